@@ -0,0 +1,121 @@
+"""
+Time the Psi calculation of each backend across numbers of events and samples
+
+Random junction reads and skipped exon-like events are made for every
+combination of ``--n-events`` and ``--n-samples``, and
+:py:func:`outrigger.psi.vectorized.calculate_psi_arrays` is timed with each
+backend. The fastest of ``--repeats`` runs is reported, as a csv on standard
+out, so the results of several machines can be put together::
+
+    python benchmarks/backends.py --n-jobs 4 > backends.csv
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from outrigger.psi import vectorized
+from outrigger.psi.reads import SparseReads
+
+
+N_EVENTS = 1000, 10000
+N_SAMPLES = 10, 100, 1000
+N_INCOMPATIBLE = 2
+
+
+def random_reads(n_samples, n_junctions, density=0.2, seed=0):
+    """(n_samples, n_junctions) reads, of which ``density`` aren't zero"""
+    random_state = np.random.RandomState(seed)
+    reads = random_state.poisson(30, size=(n_samples, n_junctions))
+    reads[random_state.uniform(size=reads.shape) > density] = 0
+    return reads
+
+
+def random_positions(n_events, n_junctions, seed=0):
+    """Column positions of events with 1, 2 and ``N_INCOMPATIBLE`` junctions
+
+    Like skipped exons, each event has one isoform1 junction and two isoform2
+    junctions. Some events share their junctions, like events sharing
+    flanking exons do.
+    """
+    random_state = np.random.RandomState(seed)
+    positions = random_state.randint(
+        0, n_junctions, size=(n_events, 3 + N_INCOMPATIBLE))
+    isoform1 = positions[:, :1]
+    isoform2 = positions[:, 1:3]
+    incompatible = positions[:, 3:]
+    return isoform1, isoform2, incompatible
+
+
+def time_backend(reads, isoform1, isoform2, incompatible, backend, n_jobs,
+                 repeats):
+    """Fastest time in seconds of ``repeats`` Psi calculations"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        vectorized.calculate_psi_arrays(reads, isoform1, isoform2,
+                                        incompatible, n_jobs=n_jobs,
+                                        backend=backend)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark(n_events=N_EVENTS, n_samples=N_SAMPLES,
+              backends=vectorized.BACKENDS, n_jobs=-1, repeats=3,
+              sparse=False):
+    """Table of the fastest time of each backend, events and samples"""
+    rows = []
+    for n_event in n_events:
+        # About as many junctions as events, as in real indexes
+        n_junctions = n_event
+        isoform1, isoform2, incompatible = random_positions(n_event,
+                                                            n_junctions)
+        for n_sample in n_samples:
+            reads = random_reads(n_sample, n_junctions)
+            if sparse:
+                reads = SparseReads(reads, index=np.arange(n_sample),
+                                    columns=np.arange(n_junctions))
+            for backend in backends:
+                seconds = time_backend(reads, isoform1, isoform2,
+                                       incompatible, backend, n_jobs,
+                                       repeats)
+                rows.append((backend, n_event, n_sample, n_jobs, seconds))
+                sys.stderr.write('{} {} events x {} samples: {:.3f} '
+                                 's\n'.format(backend, n_event, n_sample,
+                                              seconds))
+    return pd.DataFrame(rows, columns=['backend', 'n_events', 'n_samples',
+                                       'n_jobs', 'seconds'])
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n')[0])
+    parser.add_argument('--n-events', type=int, nargs='+', default=N_EVENTS,
+                        help='Numbers of events to calculate '
+                             '(default={})'.format(N_EVENTS))
+    parser.add_argument('--n-samples', type=int, nargs='+',
+                        default=N_SAMPLES,
+                        help='Numbers of samples to calculate '
+                             '(default={})'.format(N_SAMPLES))
+    parser.add_argument('--backends', nargs='+', default=vectorized.BACKENDS,
+                        choices=vectorized.BACKENDS,
+                        help='Backends to time (default is all)')
+    parser.add_argument('--n-jobs', type=int, default=-1,
+                        help='Number of workers of the "processes" and '
+                             '"threads" backends (default=-1)')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Number of times to time each calculation, of '
+                             'which the fastest is kept (default=3)')
+    parser.add_argument('--sparse', action='store_true',
+                        help='Calculate from sparse junction reads')
+    args = parser.parse_args(args)
+
+    timings = benchmark(args.n_events, args.n_samples, args.backends,
+                        args.n_jobs, args.repeats, args.sparse)
+    timings.to_csv(sys.stdout, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ import os
 import pdb
 import shutil
 import sys
+import tempfile
 import traceback
 
 import gffutils
@@ -16,8 +17,8 @@ from outrigger import __version__
 import outrigger.common
 from outrigger import util, common
 from outrigger.index import events, adjacencies
-from outrigger.io import star, gtf, bam
-from outrigger.psi import compute
+from outrigger.io import star, gtf, bam, tables
+from outrigger.psi import vectorized, reads, slots, stream, server, shards
 from outrigger.validate import check_splice_sites
 
 
@@ -28,6 +29,11 @@ JUNCTION_METADATA_PATH = os.path.join(JUNCTION_PATH, 'metadata.csv')
 INDEX = os.path.join(OUTPUT, 'index')
 EVENTS_CSV = 'events.csv'
 METADATA_CSV = 'metadata.csv'
+SAMPLES_CSV = 'samples.csv'
+
+# Number of samples whose Psi is written to each temporary file of
+# outrigger_psi.csv or psi.npz, when calculating one bam file at a time
+STREAM_CHUNK_SIZE = 100
 
 
 class CommandLine(object):
@@ -285,6 +291,20 @@ class CommandLine(object):
                                      ' bigger than the other side of the exon '
                                      'by this amount, (default is 10, so 10x '
                                      'bigger), then do not use this event')
+        psi_parser.add_argument('--notes', required=False,
+                                default='categorical',
+                                choices=vectorized.NOTES_FORMATS,
+                                help='How to write why each event in each '
+                                     'sample was or was not given a Psi score '
+                                     'in the summary files. "text" and '
+                                     '"categorical" both write the English '
+                                     'explanation in a "notes" column, but '
+                                     '"categorical" uses much less memory '
+                                     'while doing it. "code" writes only a '
+                                     'small integer in a "case" column, and '
+                                     'the explanation of each code in '
+                                     '"psi/cases.csv". (default='
+                                     '"categorical")')
         psi_parser.add_argument('--ignore-multimapping', action='store_true',
                                 help='Applies to STAR SJ.out.tab files only.'
                                      ' If this flag is used, then do not '
@@ -323,13 +343,265 @@ class CommandLine(object):
                                      'reading. Default is -1, which means '
                                      'to use as many threads as are '
                                      'available.')
+        psi_parser.add_argument('--backend', required=False,
+                                default='processes',
+                                choices=vectorized.BACKENDS,
+                                help='How to run the --n-jobs workers. '
+                                     '"processes" share a memory-mapped copy '
+                                     'of the junction reads, written to a '
+                                     'temporary file. "threads" share the '
+                                     'junction reads in memory, without '
+                                     'writing or copying them. "serial" '
+                                     'calculates one block of events at a '
+                                     'time and ignores --n-jobs. Which is '
+                                     'fastest depends on the machine and '
+                                     'data, see benchmarks/backends.py. '
+                                     '(default="processes")')
+        psi_parser.add_argument('--psi-format', required=False,
+                                default='wide',
+                                choices=vectorized.PSI_FORMATS,
+                                help='How to write the Psi scores. "wide" '
+                                     'writes a samples x events matrix to '
+                                     '"psi.csv" in each splice type folder, '
+                                     'and all splice types together to '
+                                     '"psi/outrigger_psi.csv". "long" writes '
+                                     'only the samples and events with a Psi '
+                                     'score, as compressed "sample_id", '
+                                     '"event_id", "psi" and "case" columns, to'
+                                     ' "psi.npz" in each splice type folder. '
+                                     'Read these with '
+                                     'outrigger.io.tables.read_npz. '
+                                     '(default="wide")')
+        psi_parser.add_argument('--summary', required=False, default='full',
+                                choices=vectorized.SUMMARY_FORMATS,
+                                help='What to write to the "summary.csv" '
+                                     'file of each splice type and to '
+                                     '"psi/outrigger_summary.csv". "full" '
+                                     'writes the junction reads, Psi and '
+                                     'notes of every event in every sample. '
+                                     '"cases" writes only the sample, event '
+                                     'and integer case, and "counts" only '
+                                     'the number of samples in each case of '
+                                     'every event, with the explanation of '
+                                     'each case in "psi/cases.csv". "none" '
+                                     'writes no summaries. (default="full")')
+        psi_parser.add_argument('--dtypes', required=False,
+                                default='default',
+                                choices=vectorized.DTYPES,
+                                help='Data types of the junction reads, Psi '
+                                     'and summaries. "compact" stores reads '
+                                     'as 32-bit unsigned integers, Psi as '
+                                     '32-bit floats, and sample and event ids '
+                                     'as categories, which takes about half '
+                                     'the memory, but Psi is written with '
+                                     'fewer digits. Requires pandas 0.24 or '
+                                     'later. (default="default")')
+        psi_parser.add_argument('--append', required=False, default=False,
+                                action='store_true',
+                                help='If set, add new samples to the '
+                                     'existing output of "outrigger psi" in '
+                                     'the --output folder, by calculating Psi '
+                                     'only for the new samples. The junction '
+                                     'reads of the new samples are given with '
+                                     '--sj-out-tab, --bam or '
+                                     '--junction-reads-csv, and are added to '
+                                     'junctions/reads.csv. Use the same '
+                                     'options as the original run. Events '
+                                     'which had no Psi calculated before are '
+                                     'not added, to add these, rerun '
+                                     '"outrigger psi" on all samples. By '
+                                     'default, this is off.')
+        psi_parser.add_argument('--sample-partition-size', required=False,
+                                default=None, action='store', type=int,
+                                help='If given, calculate Psi on this many '
+                                     'samples at a time, reading only their '
+                                     'junction reads into memory, so the '
+                                     'memory used depends on this number '
+                                     'instead of the total number of samples.'
+                                     ' The output is the same. Recommended '
+                                     'for tens of thousands of samples. By '
+                                     'default, all samples are calculated '
+                                     'together.')
+        psi_parser.add_argument('--sweep-min-reads', required=False,
+                                default=None, action='store', type=int,
+                                nargs='+',
+                                help='If given, calculate Psi with each of '
+                                     'these --min-reads thresholds, and every'
+                                     ' --sweep-uneven-coverage-multiplier, in '
+                                     'one pass over the junction reads. The '
+                                     'results of each setting are written to '
+                                     'the "psi/sweep" folder instead of the '
+                                     'usual output. By default, there is no '
+                                     'sweep.')
+        psi_parser.add_argument('--sweep-uneven-coverage-multiplier',
+                                required=False, default=None, action='store',
+                                type=int, nargs='+',
+                                help='If given, calculate Psi with each of '
+                                     'these --uneven-coverage-multiplier '
+                                     'thresholds, and every --sweep-min-reads,'
+                                     ' in one pass over the junction reads. '
+                                     'By default, there is no sweep.')
+        psi_parser.add_argument('--sweep-output', required=False,
+                                default='psi',
+                                choices=vectorized.SWEEP_OUTPUTS,
+                                help='What to write for each setting of a '
+                                     'sweep. "psi" writes the samples and '
+                                     'events with a Psi score, as compressed '
+                                     '"sample_id", "event_id", "splice_type",'
+                                     ' "psi" and "case" columns, to one .npz '
+                                     'file per setting. "counts" writes only '
+                                     'the number of samples and events in '
+                                     'each case, of every setting and splice '
+                                     'type, to "psi/sweep/counts.csv". '
+                                     '(default="psi")')
+        psi_parser.add_argument('--chunk-size', required=False,
+                                default=None, action='store', type=int,
+                                help='Number of events to calculate psi on '
+                                     'together, in a single process. By '
+                                     'default, this is chosen from the '
+                                     'number of events, samples and '
+                                     '--n-jobs.')
         psi_parser.add_argument('--low-memory', required=False,
                                 default=False,
                                 action='store_true',
                                 help='If set, then use a smaller memory '
                                      'footprint. By default, this is off.')
+        psi_parser.add_argument('--sparse', required=False, default=False,
+                                action='store_true',
+                                help='If set, store the samples x junctions '
+                                     'matrix of reads as a sparse matrix, '
+                                     'which only stores the nonzero read '
+                                     'counts. Recommended for single-cell '
+                                     'data with thousands of samples. By '
+                                     'default, this is off.')
+        psi_parser.add_argument('--stream', required=False, default=False,
+                                action='store_true',
+                                help='If set with --bam, count the junction '
+                                     'reads of each bam file and calculate '
+                                     'Psi of that sample right away, one bam '
+                                     'file per worker, without writing '
+                                     'junctions/reads.csv. Junctions are '
+                                     'taken from the index, so all events in '
+                                     'the index are calculated, even ones '
+                                     'without reads in any sample. By '
+                                     'default, this is off.')
+        psi_parser.add_argument('--shard', required=False, default=None,
+                                action='store', type=str,
+                                help='If given as "i/N", e.g. "1/4", only '
+                                     'calculate Psi of the i-th of N '
+                                     'consecutive, nearly equal shards of '
+                                     'the sorted sample ids, so each of N '
+                                     'machines can calculate one shard into '
+                                     'its own --output folder. All events of '
+                                     'the index are calculated, even ones '
+                                     'without reads in the shard\'s samples, '
+                                     'so the shards can be combined with '
+                                     '"outrigger merge-psi". Can\'t be '
+                                     'combined with --append, '
+                                     '--sample-partition-size or the sweep '
+                                     'options, and requires --psi-format '
+                                     'wide. By default, all samples are '
+                                     'calculated.')
         psi_parser.set_defaults(func=self.psi)
 
+        # --- Subcommand to merge the Psi of shards of samples --- #
+        merge_psi_parser = self.subparser.add_parser(
+            'merge-psi', help='Combine the Psi of shards of samples, '
+                              'calculated with "outrigger psi --shard", '
+                              'into one output')
+        merge_psi_parser.add_argument(
+            '-s', '--shards', required=True, nargs='+', type=str,
+            action='store',
+            help='Output folders of "outrigger psi --shard" of every shard, '
+                 'in order, e.g. "shard1 shard2 shard3". Samples are in the '
+                 'order of the shards')
+        merge_psi_parser.add_argument(
+            '-o', '--output', required=False, type=str, action='store',
+            default=None,
+            help='Name of the folder to write the merged "psi" folder to '
+                 '(default is {})'.format(OUTPUT))
+        merge_psi_parser.add_argument('--debug', required=False,
+                                      action='store_true',
+                                      help='If given, print debugging '
+                                           'logging information to standard '
+                                           'out')
+        merge_psi_parser.set_defaults(func=self.merge_psi)
+
+        # --- Subcommand to answer Psi requests from memory --- #
+        serve_parser = self.subparser.add_parser(
+            'serve', help='Load the splicing event index and junction reads '
+                          'once, and answer Psi requests over HTTP')
+        serve_parser.add_argument(
+            '-i', '--index', required=False, default=None,
+            help='Name of the folder where you saved the output from '
+                 '"outrigger index" (default is {})'.format(INDEX))
+        serve_parser.add_argument(
+            '-o', '--output', required=False, type=str, action='store',
+            default=None,
+            help='Name of the folder where you saved the output from '
+                 '"outrigger index" and "outrigger psi" (default is '
+                 '{})'.format(OUTPUT))
+        serve_parser.add_argument(
+            '-c', '--junction-reads-csv', required=False,
+            help="Name of the compiled splice junction file to calculate psi "
+                 "scores on. Default is the '--output' folder's "
+                 "junctions/reads.csv file")
+        serve_parser.add_argument('--host', required=False,
+                                  default=server.HOST,
+                                  help='Address to answer requests on '
+                                       '(default={})'.format(server.HOST))
+        serve_parser.add_argument('--port', required=False, type=int,
+                                  default=server.PORT,
+                                  help='Port to answer requests on '
+                                       '(default={})'.format(server.PORT))
+        serve_parser.add_argument('-m', '--min-reads', type=int,
+                                  action='store', required=False, default=10,
+                                  help='Minimum number of reads per junction '
+                                       'for calculating Psi (default=10)')
+        serve_parser.add_argument('-e', '--method', type=str, action='store',
+                                  required=False, default='mean',
+                                  help='How to deal with multiple junctions '
+                                       'on an event - take the mean (default)'
+                                       ' or the min? (the other option)')
+        serve_parser.add_argument('-u', '--uneven-coverage-multiplier',
+                                  type=int, action='store', required=False,
+                                  default=10,
+                                  help='If a junction one one side of an exon '
+                                       'is bigger than the other side of the '
+                                       'exon by this amount, (default is 10, '
+                                       'so 10x bigger), then do not use this '
+                                       'event')
+        serve_parser.add_argument('--sparse', required=False, default=False,
+                                  action='store_true',
+                                  help='If set, keep the samples x junctions '
+                                       'matrix of reads as a sparse matrix. '
+                                       'By default, this is off.')
+        serve_parser.add_argument('--reads-col', default='reads',
+                                  help="Name of column in "
+                                       "--junction-reads-csv containing reads "
+                                       "to use. (default='reads')")
+        serve_parser.add_argument('--sample-id-col', default='sample_id',
+                                  help="Name of column in "
+                                       "--junction-reads-csv containing "
+                                       "sample ids to use. "
+                                       "(default='sample_id')")
+        serve_parser.add_argument('--junction-id-col',
+                                  default='junction_id',
+                                  help="Name of column in "
+                                       "--junction-reads-csv containing "
+                                       "junction ids to use. "
+                                       "(default='junction_id')")
+        serve_parser.add_argument('--debug', required=False,
+                                  action='store_true',
+                                  help='If given, print debugging logging '
+                                       'information to standard out')
+        serve_parser.add_argument('--n-jobs', required=False, default=1,
+                                  action='store', type=int,
+                                  help='Number of processes to use for each '
+                                       'request. Default is 1, since '
+                                       'requests are usually small.')
+        serve_parser.set_defaults(func=self.serve)
+
         if input_options is None or len(input_options) == 0:
             self.parser.print_usage()
             self.args = None
@@ -355,6 +627,14 @@ class CommandLine(object):
         psi = Psi(**vars(self.args))
         psi.execute()
 
+    def serve(self):
+        serve = Serve(**vars(self.args))
+        serve.execute()
+
+    def merge_psi(self):
+        merge_psi = MergePsi(**vars(self.args))
+        merge_psi.execute()
+
     def do_usage_and_die(self, str):
         '''Cleanly exit if incorrect parameters are given
 
@@ -447,20 +727,33 @@ class Subcommand(object):
         else:
             return os.path.join(self.junctions_folder, 'reads.csv')
 
-    def make_junction_reads_file(self):
+    def read_alignments(self, filenames=None):
+        """Make a table of junction reads from SJ.out.tab or bam files
+
+        Parameters
+        ----------
+        filenames : list of str, optional
+            Only read these of the SJ.out.tab or bam files. By default, read
+            all of them.
+        """
         if self.bam is None:
             util.progress(
                 'Reading SJ.out.files and creating a big splice junction'
                 ' table of reads spanning exon-exon junctions...')
             splice_junctions = star.read_multiple_sj_out_tab(
-                self.sj_out_tab,
+                self.sj_out_tab if filenames is None else filenames,
                 ignore_multimapping=self.ignore_multimapping)
         else:
             util.progress('Reading bam files and creating a big splice '
                           'junction table of reads spanning exon-exon '
                           'junctions')
             splice_junctions = bam.read_multiple_bams(
-                self.bam, self.ignore_multimapping, self.n_jobs)
+                self.bam if filenames is None else filenames,
+                self.ignore_multimapping, self.n_jobs)
+        return splice_junctions
+
+    def make_junction_reads_file(self, filenames=None):
+        splice_junctions = self.read_alignments(filenames)
         dirname = os.path.dirname(self.junction_reads_filename)
         if not os.path.exists(dirname):
             os.makedirs(dirname)
@@ -727,6 +1020,18 @@ class Index(Subcommand):
                           index_label=outrigger.common.EVENT_ID)
         util.done()
 
+        # Junctions of each event as integers, so "outrigger psi" doesn't
+        # need to look up junction ids of every event
+        filename = os.path.join(self.index_folder, splice_type,
+                                slots.JUNCTION_SLOTS_NPZ)
+        util.progress('Writing junctions of {splice_type} events to '
+                      '{filename} ...'.format(splice_type=splice_type.upper(),
+                                              filename=filename))
+        event_junctions = slots.EventJunctions.from_annotation(
+            attributes, **outrigger.common.ISOFORM_JUNCTIONS[splice_type])
+        event_junctions.save(filename)
+        util.done()
+
     def write_new_gtf(self, db):
         gtf = os.path.join(self.gtf_folder,
                            os.path.basename(self.gtf_filename))
@@ -879,6 +1184,20 @@ class Psi(SubcommandAfterIndex):
     reads_col = None
     sample_id_col = None
     junction_id_col = None
+    notes = 'categorical'
+    sparse = False
+    chunk_size = None
+    psi_format = 'wide'
+    dtypes = 'default'
+    summary = 'full'
+    append = False
+    sample_partition_size = None
+    sweep_min_reads = None
+    sweep_uneven_coverage_multiplier = None
+    sweep_output = 'psi'
+    stream = False
+    shard = None
+    backend = 'processes'
 
     required_cols = {'--reads-col': reads_col,
                      '--sample-id-col': sample_id_col,
@@ -897,7 +1216,7 @@ class Psi(SubcommandAfterIndex):
 
     @property
     def folders(self):
-        return self.output_folder, self.psi_folder
+        return self.output_folder, self.junctions_folder, self.psi_folder
 
     def __init__(self, **kwargs):
         # Read all arguments and set as attributes of this class
@@ -918,7 +1237,7 @@ class Psi(SubcommandAfterIndex):
                         splice_name, splice_folder))
 
         if not os.path.exists(self.junction_reads_filename) and \
-                self.bam is None:
+                self.bam is None and self.sj_out_tab is None:
             raise OSError(
                 "The junction reads csv file ({}) doesn't exist! "
                 "Cowardly exiting because I don't have the junction "
@@ -928,6 +1247,72 @@ class Psi(SubcommandAfterIndex):
         for folder in self.folders:
             self.maybe_make_folder(folder)
 
+        # Junctions of the events of each splice type, once they're read
+        self.event_junctions = {}
+
+    @property
+    def sweeping(self):
+        return self.sweep_min_reads is not None or \
+            self.sweep_uneven_coverage_multiplier is not None
+
+    @property
+    def sweep_folder(self):
+        return os.path.join(self.psi_folder, 'sweep')
+
+    @property
+    def shard_number(self):
+        """(i, n) of the i-th of n shards of samples, or None for all"""
+        if self.shard is None:
+            return None
+        return shards.parse_shard(self.shard)
+
+    def check_shard(self):
+        """Make sure --shard is valid and works with the other options"""
+        if self.shard_number is None:
+            return
+        if self.sweeping or self.append or \
+                self.sample_partition_size is not None:
+            raise ValueError('--shard can\'t be combined with --append, '
+                             '--sample-partition-size or the sweep options')
+        if self.psi_format != 'wide':
+            raise ValueError('--shard requires --psi-format wide, so the '
+                             'shards can be merged with "outrigger '
+                             'merge-psi"')
+
+    def shard_alignments(self):
+        """SJ.out.tab or bam files of this shard's samples, or all of them
+
+        Each file is one sample, so the files are sharded by their sample ids
+        """
+        if self.bam is None:
+            filenames = self.sj_out_tab
+
+            def sample_id(filename):
+                # Same as the sample ids of star.read_multiple_sj_out_tab
+                basename = os.path.basename(filename)
+                return basename.split('SJ.out.tab')[0].rstrip('.')
+        else:
+            filenames = self.bam
+            sample_id = os.path.basename
+        if self.shard_number is None:
+            return filenames
+        return shards.shard_items(filenames, *self.shard_number,
+                                  key=sample_id)
+
+    def shard_sample_ids(self):
+        """Ids of this shard's samples in the junction reads csv"""
+        util.progress('Finding the samples in {} ...'.format(
+            self.junction_reads_filename))
+        sample_ids, = tables.read_unique(self.junction_reads_filename,
+                                         [self.sample_id_col])
+        util.done()
+        i, n = self.shard_number
+        shard_ids = shards.shard_items(sample_ids, i, n)
+        util.progress('Calculating shard {i} of {n}: {k} of {total} '
+                      'samples'.format(i=i, n=n, k=len(shard_ids),
+                                       total=len(sample_ids)))
+        return pd.Index(shard_ids)
+
     def maybe_read_junction_reads(self):
         try:
             dtype = {self.reads_col: np.float32}
@@ -963,6 +1348,253 @@ class Psi(SubcommandAfterIndex):
         else:
             return events
 
+    def read_event_junctions(self, filename, splice_abbrev):
+        """Read junctions of events, precomputed by the index if possible
+
+        Indexes made by ``outrigger index`` save the junctions of every event
+        as integers, in "junction_slots.npz". For older indexes, only the
+        events' table is read.
+
+        Parameters
+        ----------
+        filename : str
+            Events csv file, either all the events in the index or only the
+            validated events
+        splice_abbrev : str
+            Splice type of the events, e.g. "se"
+
+        Returns
+        -------
+        event_junctions : slots.EventJunctions
+            Junctions of the events in ``filename``
+        """
+        if (filename, splice_abbrev) not in self.event_junctions:
+            self.event_junctions[filename, splice_abbrev] = \
+                self._read_event_junctions(filename, splice_abbrev)
+        return self.event_junctions[filename, splice_abbrev]
+
+    def _read_event_junctions(self, filename, splice_abbrev):
+        npz = os.path.join(self.input_index, splice_abbrev,
+                           slots.JUNCTION_SLOTS_NPZ)
+        if os.path.exists(npz):
+            event_junctions = slots.EventJunctions.load(npz)
+            # Validated events are a subset of all the events
+            event_ids = pd.read_csv(filename, usecols=[0], index_col=0,
+                                    low_memory=self.low_memory).index
+            if event_ids.isin(event_junctions.event_ids).all():
+                return event_junctions.subset(event_ids)
+        event_annotation = pd.read_csv(filename, index_col=0,
+                                       low_memory=self.low_memory)
+        return slots.EventJunctions.from_annotation(
+            event_annotation,
+            **outrigger.common.ISOFORM_JUNCTIONS[splice_abbrev])
+
+    def index_junction_ids(self):
+        """Ids of all junctions of the events, including incompatible ones
+
+        Junction reads of any other junctions don't change Psi
+        """
+        junction_ids = []
+        for splice_name, splice_abbrev in outrigger.common.SPLICE_TYPES:
+            filename = self.maybe_get_validated_events(splice_abbrev)
+            if os.path.exists(filename):
+                junction_ids.append(self.read_event_junctions(
+                    filename, splice_abbrev).junctions)
+        if not junction_ids:
+            return pd.Index([])
+        return pd.Index(pd.unique(np.concatenate(junction_ids)))
+
+    def read_index_junction_reads(self):
+        """Junction reads of only the junctions of the index's events
+
+        Rows of other junctions are dropped while reading an existing
+        junction reads csv, a chunk at a time, and after compiling new
+        junction reads. The metadata of all junctions, not only the index's,
+        is written, as when all samples are calculated together with
+        ``--sample-partition-size`` or ``--append``.
+
+        Returns
+        -------
+        junction_reads : pandas.DataFrame
+            Tall table of the junction reads of the index's junctions
+        sample_ids : pandas.Index
+            Sorted ids of all samples, including samples without any reads
+            of the index's junctions
+        """
+        junction_ids = self.index_junction_ids()
+        # The junction reads csv of a shard only has that shard's samples, so
+        # a shard of SJ.out.tab or bam files always reads the files
+        shard_files = self.shard_number is not None and \
+            (self.bam is not None or self.sj_out_tab is not None)
+        if os.path.exists(self.junction_reads_filename) and not shard_files:
+            filters = {self.junction_id_col: junction_ids}
+            kwargs = {}
+            if self.shard_number is not None:
+                # Sample ids are compared as text, as read_unique reads them
+                filters[self.sample_id_col] = self.shard_sample_ids()
+                kwargs['dtype'] = {self.sample_id_col: str}
+            util.progress('Found compiled junction reads file in {} and '
+                          'reading in the reads of the {} junctions of the '
+                          'index ...'.format(self.junction_reads_filename,
+                                             len(junction_ids)))
+            junction_reads, (sample_ids,) = tables.read_rows(
+                self.junction_reads_filename, filters,
+                unique=[self.sample_id_col], low_memory=self.low_memory,
+                **kwargs)
+            util.done()
+            if self.shard_number is not None:
+                sample_ids = filters[self.sample_id_col]
+            self.write_junction_metadata()
+        else:
+            # Only this shard's files are read, if there are shards
+            junction_reads = self.make_junction_reads_file(
+                self.shard_alignments())
+            sample_ids = pd.Index(
+                sorted(junction_reads[self.sample_id_col].unique()))
+            metadata_csv = os.path.join(self.junctions_folder, METADATA_CSV)
+            self.junction_metadata(junction_reads, metadata_csv)
+
+        in_index = junction_reads[self.junction_id_col].isin(junction_ids)
+        if not in_index.all():
+            util.progress('Keeping the {} of {} junction reads whose '
+                          'junctions are in the index '
+                          '...'.format(in_index.sum(), len(in_index)))
+            junction_reads = junction_reads.loc[in_index]
+            util.done()
+        return junction_reads, sample_ids
+
+    def write_junction_metadata(self):
+        """Write metadata of all junctions of the junction reads csv
+
+        The junction reads are read a chunk at a time, so only the metadata
+        is in memory. Nothing is written if the metadata already exists.
+        """
+        metadata_csv = os.path.join(self.junctions_folder, METADATA_CSV)
+        if os.path.exists(metadata_csv):
+            return
+        util.progress('Writing metadata of junctions in {reads} to {csv}'
+                      ' ...'.format(reads=self.junction_reads_filename,
+                                    csv=metadata_csv))
+        # Moved into place once all the junctions are written
+        temp_csv = metadata_csv + '.tmp'
+        junction_ids = set()
+        for chunk in pd.read_csv(self.junction_reads_filename,
+                                 chunksize=tables.CHUNKSIZE,
+                                 low_memory=self.low_memory):
+            self.append_junction_metadata(star.make_metadata(chunk),
+                                          temp_csv, junction_ids)
+        if junction_ids:
+            shutil.move(temp_csv, metadata_csv)
+        util.done()
+
+    @property
+    def reads_dtype(self):
+        """Data type of the samples x junctions matrix of reads"""
+        if self.dtypes == 'compact':
+            return vectorized.READS_DTYPE
+        return int
+
+    def make_junction_reads_2d(self, junction_reads, sample_ids=None):
+        """Make a samples x junctions matrix from the tall table of reads
+
+        Samples in ``sample_ids`` without any junction reads get a row of
+        zeros
+        """
+        if self.sparse:
+            util.progress('Creating sparse samples x junctions matrix of '
+                          'reads ...')
+            junction_reads_2d = reads.SparseReads.from_tall(
+                junction_reads, sample_id_col=self.sample_id_col,
+                junction_id_col=self.junction_id_col,
+                reads_col=self.reads_col, dtype=self.reads_dtype,
+                samples=sample_ids)
+            util.done()
+            return junction_reads_2d
+
+        util.progress('Creating samples x junctions matrix of reads ...')
+        junction_reads_2d = reads.pivot_reads(
+            junction_reads, sample_id_col=self.sample_id_col,
+            junction_id_col=self.junction_id_col, reads_col=self.reads_col,
+            dtype=self.reads_dtype, samples=sample_ids)
+        util.done()
+        return junction_reads_2d
+
+    @property
+    def case_codes(self):
+        """Whether any output has integer case codes instead of notes"""
+        return self.notes == 'code' or self.summary in ('cases', 'counts')
+
+    def write_case_table(self):
+        """Write the explanation of the integer case codes in the summary"""
+        cases = vectorized.case_table(
+            min_reads=self.min_reads,
+            uneven_coverage_multiplier=self.uneven_coverage_multiplier)
+        csv = os.path.join(self.psi_folder, 'cases.csv')
+        util.progress('Writing explanations of the case codes in the '
+                      'summaries to {} ...'.format(csv))
+        cases.to_csv(csv)
+        util.done()
+
+    def splice_type_file(self, splice_abbrev, filename):
+        """Path to an output file of one splice type"""
+        return os.path.join(self.psi_folder, splice_abbrev, filename)
+
+    def write_calculated(self, event_junctions, sample_ids, splice_abbrev):
+        """Save which events, junctions and samples Psi was calculated on
+
+        Used to add new samples with ``--append``
+        """
+        event_junctions.save(self.splice_type_file(
+            splice_abbrev, slots.JUNCTION_SLOTS_NPZ))
+        pd.Series(sample_ids, name=outrigger.common.SAMPLE_ID).to_csv(
+            self.splice_type_file(splice_abbrev, SAMPLES_CSV), index=False)
+
+    def calculate_splice_type(self, event_junctions, junction_reads_2d,
+                              splice_name, splice_abbrev, summary_csv,
+                              first=True):
+        """Calculate Psi of one splice type, writing summaries to a csv
+
+        If ``first`` is False, the summaries are added to the end of
+        ``summary_csv`` instead of overwriting it.
+
+        Returns
+        -------
+        psis : list of pandas.DataFrame
+            Psi of each block of events, in ``self.psi_format``
+        """
+        util.progress(
+            'Calculating percent spliced-in (Psi) scores on '
+            '{name} ({abbrev}) events, writing the summaries as they '
+            'are done ...'.format(name=splice_name, abbrev=splice_abbrev))
+        isoform_junctions = outrigger.common.ISOFORM_JUNCTIONS[splice_abbrev]
+
+        # Write this splice type's summary of events and why they
+        # weren't or were calculated Psi on, one block of events at a time
+        psis = []
+        for i, (block_psi, summary) in enumerate(vectorized.iter_psi(
+                event_junctions, junction_reads_2d,
+                min_reads=self.min_reads, n_jobs=self.n_jobs,
+                method=self.method,
+                uneven_coverage_multiplier=self.uneven_coverage_multiplier,
+                notes=self.notes, chunk_size=self.chunk_size,
+                psi_format=self.psi_format, dtypes=self.dtypes,
+                summary=self.summary, backend=self.backend,
+                **isoform_junctions)):
+            if summary is not None:
+                tables.append_csv(summary, summary_csv,
+                                  first=first and i == 0, na_rep='NA',
+                                  index=False)
+            psis.append(block_psi)
+        util.done()
+        if self.summary == 'none':
+            return psis
+        util.progress('Wrote {name} ({abbrev}) event summaries (e.g. '
+                      'number of reads, why an event does not have a Psi '
+                      'score) to {filename}'
+                      ''.format(name=splice_name, abbrev=splice_abbrev,
+                                filename=summary_csv))
+        return psis
+
     def execute(self):
         """Calculate percent spliced in (psi) of splicing events"""
 
@@ -970,22 +1602,33 @@ class Psi(SubcommandAfterIndex):
         if self.debug:
             logger.setLevel(10)
 
-        junction_reads = self.csv()
-
-        metadata_csv = os.path.join(self.junctions_folder, METADATA_CSV)
-        self.junction_metadata(junction_reads, metadata_csv)
-
-        junction_reads_2d = junction_reads.pivot(index=self.sample_id_col,
-                                                 columns=self.junction_id_col,
-                                                 values=self.reads_col)
-        junction_reads_2d.fillna(0, inplace=True)
-        junction_reads_2d = junction_reads_2d.astype(int)
+        self.check_shard()
+        if self.sweeping:
+            return self.execute_sweep()
+        if self.stream:
+            return self.execute_stream()
+        if self.append:
+            return self.execute_append()
+        if self.sample_partition_size is not None:
+            return self.execute_partitioned()
+
+        junction_reads, sample_ids = self.read_index_junction_reads()
+        junction_reads_2d = self.make_junction_reads_2d(junction_reads,
+                                                        sample_ids)
+        if self.shard_number is not None:
+            # Every shard calculates all events of the index, so the shards
+            # have the same events and can be merged
+            junction_reads_2d = reads.reindex_columns(
+                junction_reads_2d, self.index_junction_ids())
 
         logger.debug('\n--- Splice Junction reads ---')
         logger.debug(repr(junction_reads.head()))
 
-        psis = []
-        summaries = []
+        # Events x samples matrix of all splice types, written one block of
+        # events at a time
+        psi_csv = os.path.join(self.psi_folder, 'outrigger_psi.csv')
+        first_psi = True
+        splice_abbrevs = []
         for splice_name, splice_abbrev in outrigger.common.SPLICE_TYPES:
             filename = self.maybe_get_validated_events(splice_abbrev)
             if not os.path.exists(filename):
@@ -997,73 +1640,737 @@ class Psi(SubcommandAfterIndex):
             util.progress('Reading {name} ({abbrev}) events from {filename}'
                           ' ...'.format(name=splice_name, abbrev=splice_abbrev,
                                         filename=filename))
-
-            event_annotation = pd.read_csv(filename, index_col=0,
-                                           low_memory=self.low_memory)
+            event_junctions = self.read_event_junctions(filename,
+                                                        splice_abbrev)
             util.done()
-
-            isoform_junctions = outrigger.common.ISOFORM_JUNCTIONS[
-                splice_abbrev]
             logger.debug('\n--- Splicing event annotation ---')
-            logger.debug(repr(event_annotation.head()))
-
-            util.progress(
-                'Calculating percent spliced-in (Psi) scores on '
-                '{name} ({abbrev}) events ...'.format(
-                    name=splice_name, abbrev=splice_abbrev))
-            # Splice type percent spliced-in (psi) and summary
-            type_psi, summary = compute.calculate_psi(
-                event_annotation, junction_reads_2d,
-                min_reads=self.min_reads, n_jobs=self.n_jobs,
-                method=self.method,
-                uneven_coverage_multiplier=self.uneven_coverage_multiplier,
-                **isoform_junctions)
+            logger.debug(repr(event_junctions))
+
+            self.maybe_make_folder(os.path.join(self.psi_folder,
+                                                splice_abbrev))
+            self.write_calculated(
+                event_junctions.present(junction_reads_2d.columns),
+                junction_reads_2d.index, splice_abbrev)
+
+            summary_csv = self.splice_type_file(splice_abbrev, 'summary.csv')
+            type_psis = self.calculate_splice_type(
+                event_junctions, junction_reads_2d, splice_name,
+                splice_abbrev, summary_csv)
+            splice_abbrevs.append(splice_abbrev)
+
+            if self.psi_format == 'long':
+                # Write this splice type's non-NaN percent spliced-in values
+                type_psi = pd.concat(type_psis, ignore_index=True)
+                filename = self.splice_type_file(splice_abbrev, 'psi.npz')
+                util.progress('Writing {name} ({abbrev}) Psi values to '
+                              '{filename} ...'.format(name=splice_name,
+                                                      abbrev=splice_abbrev,
+                                                      filename=filename))
+                tables.write_npz(type_psi, filename)
+                util.done()
+                continue
 
             # Write this event's percent spliced-in matrix
-            csv = os.path.join(self.psi_folder, splice_abbrev,
-                               'psi.csv'.format(splice_abbrev))
+            type_psi = pd.concat(type_psis, axis=1)
+            csv = self.splice_type_file(splice_abbrev, 'psi.csv')
             util.progress('Writing {name} ({abbrev}) Psi values to {filename}'
                           ' ...'.format(name=splice_name, abbrev=splice_abbrev,
                                         filename=csv))
-            self.maybe_make_folder(os.path.dirname(csv))
             type_psi.to_csv(csv, na_rep='NA')
+            del type_psi
+            util.done()
 
-            # Write this event's summary of events and why they weren't or were
-            # calculated Psi on
-            csv = os.path.join(self.psi_folder, splice_abbrev,
-                               'summary.csv'.format(splice_abbrev))
-            util.progress('Writing {name} ({abbrev}) event summaries (e.g. '
-                          'number of reads, why an event does not have a Psi '
-                          'score) to {filename} ...'
-                          ''.format(name=splice_name, abbrev=splice_abbrev,
-                                    filename=csv))
-            self.maybe_make_folder(os.path.dirname(csv))
-            summary.to_csv(csv, na_rep='NA', index=False)
-            psis.append(type_psi)
-            summary['splice_type'] = splice_abbrev
-            summaries.append(summary)
+            util.progress('Adding {name} ({abbrev}) Psi values to the '
+                          'features x samples matrix of all splice types in '
+                          '{filename} ...'.format(name=splice_name,
+                                                  abbrev=splice_abbrev,
+                                                  filename=psi_csv))
+            for block_psi in type_psis:
+                tables.append_csv(block_psi.T, psi_csv, first=first_psi,
+                                  na_rep='NA')
+                first_psi = False
             util.done()
 
-        util.progress('Concatenating all calculated psi scores '
-                      'into one big matrix...')
-        splicing = pd.concat(psis, axis=1)
-        util.done()
-        splicing = splicing.T
-        csv = os.path.join(self.psi_folder, 'outrigger_psi.csv')
-        util.progress('Writing a samples x features matrix of Psi '
-                      'scores to {} ...'.format(csv))
-        splicing.to_csv(csv, na_rep='NA')
+        if self.case_codes:
+            self.write_case_table()
+
+        self.write_summary(splice_abbrevs)
+
+    def write_summary(self, splice_abbrevs, add_counts=False):
+        """Write the summaries of all splice types to outrigger_summary.csv
+
+        With ``add_counts=True`` and ``--summary counts``, the case counts of
+        the same event from several partitions or samples are added up first
+        """
+        if self.summary == 'none':
+            return
+        summary_csvs = [self.splice_type_file(abbrev, 'summary.csv')
+                        for abbrev in splice_abbrevs]
+        if self.summary == 'counts' and add_counts:
+            for summary_csv in summary_csvs:
+                counts = pd.read_csv(summary_csv)
+                counts = counts.groupby([common.EVENT_ID, common.CASE],
+                                        sort=False)[common.COUNT].sum()
+                counts.reset_index().to_csv(summary_csv, index=False)
+
+        csv = os.path.join(self.psi_folder, 'outrigger_summary.csv')
+        util.progress('Writing summary table of Psi scores, junction reads, '
+                      'and cases of all splice types to {} ...'.format(csv))
+        tables.concatenate_csvs(summary_csvs, csv, column='splice_type',
+                                values=splice_abbrevs)
         util.done()
 
-        util.progress('Concatenating all summaries '
-                      'into one big matrix...')
-        summary = pd.concat(summaries, ignore_index=True)
+    def partitions(self, items):
+        """Split a list into consecutive partitions of samples"""
+        size = self.sample_partition_size
+        if size < 1:
+            raise ValueError('--sample-partition-size must be at least 1, '
+                             'not {}'.format(size))
+        return [items[i:i + size] for i in range(0, len(items), size)]
+
+    def make_junction_reads_file_partitioned(self):
+        """Write the junction reads of alignments a partition at a time
+
+        Each SJ.out.tab or bam file is one sample
+        """
+        if self.bam is None:
+            # Same order of samples as reading them all at once
+            filenames = sorted(self.sj_out_tab, key=os.path.basename)
+        else:
+            filenames = self.bam
+        dirname = os.path.dirname(self.junction_reads_filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        for i, partition in enumerate(self.partitions(filenames)):
+            splice_junctions = self.read_alignments(partition)
+            util.progress('Writing {} ...\n'.format(
+                self.junction_reads_filename))
+            tables.append_csv(splice_junctions, self.junction_reads_filename,
+                              first=i == 0, index=False)
+            util.done()
+
+    def execute_partitioned(self):
+        """Calculate Psi on a partition of samples at a time
+
+        Only one partition's junction reads are in memory at once. All
+        partitions are calculated on the junctions of all samples, so the
+        output is the same as calculating all samples together. Junction
+        metadata and long-format Psi are written to temporary files as each
+        partition is done, and put together from disk at the end.
+        """
+        if not os.path.exists(self.junction_reads_filename):
+            self.make_junction_reads_file_partitioned()
+        reads_csv = self.junction_reads_filename
+
+        util.progress('Finding the samples and junctions in {} '
+                      '...'.format(reads_csv))
+        sample_ids, junction_ids = tables.read_unique(
+            reads_csv, [self.sample_id_col, self.junction_id_col])
         util.done()
+        partitions = self.partitions(sample_ids)
+
+        splice_types = []
+        event_junctions = {}
+        for splice_name, splice_abbrev in outrigger.common.SPLICE_TYPES:
+            filename = self.maybe_get_validated_events(splice_abbrev)
+            if not os.path.exists(filename):
+                util.progress('No {name} ({abbrev}) events found, '
+                              'skipping.'. format(name=splice_name,
+                                                  abbrev=splice_abbrev))
+                continue
+            util.progress('Reading {name} ({abbrev}) events from {filename}'
+                          ' ...'.format(name=splice_name, abbrev=splice_abbrev,
+                                        filename=filename))
+            event_junctions[splice_abbrev] = self.read_event_junctions(
+                filename, splice_abbrev)
+            util.done()
+
+            self.maybe_make_folder(os.path.join(self.psi_folder,
+                                                splice_abbrev))
+            self.write_calculated(
+                event_junctions[splice_abbrev].present(junction_ids),
+                sample_ids, splice_abbrev)
+            splice_types.append((splice_name, splice_abbrev))
+
+        temp_folder = tempfile.mkdtemp(prefix='partitions',
+                                       dir=self.psi_folder)
+        try:
+            partition_csvs = [
+                os.path.join(temp_folder, 'reads{}.csv'.format(i))
+                for i in range(len(partitions))]
+            util.progress('Splitting {csv} into {n} partitions of at most '
+                          '{size} samples ...'.format(
+                                csv=reads_csv, n=len(partitions),
+                                size=self.sample_partition_size))
+            groups = dict((sample_id, i)
+                          for i, partition in enumerate(partitions)
+                          for sample_id in partition)
+            tables.split_csv(reads_csv, self.sample_id_col, groups,
+                             partition_csvs)
+            util.done()
+
+            metadata_csv = os.path.join(self.junctions_folder, METADATA_CSV)
+            write_metadata = not os.path.exists(metadata_csv)
+            temp_metadata_csv = os.path.join(temp_folder, METADATA_CSV)
+            metadata_junction_ids = set()
+            long_npzs = dict((abbrev, []) for name, abbrev in splice_types)
+            psi_csvs = []
+            for i, partition_csv in enumerate(partition_csvs):
+                util.progress('Reading junction reads of partition {i}/{n} '
+                              '...'.format(i=i + 1, n=len(partitions)))
+                junction_reads = pd.read_csv(partition_csv,
+                                             low_memory=self.low_memory)
+                util.done()
+                if write_metadata:
+                    self.append_junction_metadata(
+                        star.make_metadata(junction_reads), temp_metadata_csv,
+                        metadata_junction_ids)
+                # Every partition has all the junctions, so the same events
+                junction_reads_2d = reads.reindex_columns(
+                    self.make_junction_reads_2d(junction_reads),
+                    junction_ids)
+                del junction_reads
+
+                psis = []
+                for splice_name, splice_abbrev in splice_types:
+                    type_psis = self.calculate_splice_type(
+                        event_junctions[splice_abbrev], junction_reads_2d,
+                        splice_name, splice_abbrev,
+                        self.splice_type_file(splice_abbrev, 'summary.csv'),
+                        first=i == 0)
+                    if self.psi_format == 'long':
+                        # Put together with the other partitions at the end
+                        npz = os.path.join(temp_folder, '{}{}.npz'.format(
+                            splice_abbrev, i))
+                        tables.write_npz(pd.concat(type_psis,
+                                                   ignore_index=True), npz)
+                        long_npzs[splice_abbrev].append(npz)
+                        continue
+
+                    type_psi = pd.concat(type_psis, axis=1)
+                    csv = self.splice_type_file(splice_abbrev, 'psi.csv')
+                    util.progress('Writing {name} ({abbrev}) Psi values to '
+                                  '{filename} ...'.format(
+                                        name=splice_name,
+                                        abbrev=splice_abbrev, filename=csv))
+                    tables.append_csv(type_psi, csv, first=i == 0,
+                                      na_rep='NA')
+                    psis.append(type_psi)
+                    util.done()
+
+                if self.psi_format == 'wide':
+                    # Events x samples of this partition, pasted together
+                    # into the big matrix at the end
+                    csv = os.path.join(temp_folder, 'psi{}.csv'.format(i))
+                    pd.concat(psis, axis=1).T.to_csv(csv, na_rep='NA')
+                    psi_csvs.append(csv)
+
+            if metadata_junction_ids:
+                util.progress('Writing metadata of junctions to {csv}'
+                              ' ...'.format(csv=metadata_csv))
+                shutil.move(temp_metadata_csv, metadata_csv)
+                util.done()
+
+            for splice_name, splice_abbrev in splice_types:
+                if long_npzs[splice_abbrev]:
+                    filename = self.splice_type_file(splice_abbrev,
+                                                     'psi.npz')
+                    util.progress('Writing {name} ({abbrev}) Psi values to '
+                                  '{filename} ...'.format(
+                                        name=splice_name,
+                                        abbrev=splice_abbrev,
+                                        filename=filename))
+                    tables.concatenate_npzs(long_npzs[splice_abbrev],
+                                            filename)
+                    util.done()
+
+            if self.case_codes:
+                self.write_case_table()
+
+            if self.psi_format == 'wide':
+                csv = os.path.join(self.psi_folder, 'outrigger_psi.csv')
+                util.progress('Writing a samples x features matrix of Psi '
+                              'scores to {} ...'.format(csv))
+                tables.paste_csvs(psi_csvs, csv)
+                util.done()
+        finally:
+            shutil.rmtree(temp_folder)
+
+        self.write_summary([abbrev for name, abbrev in splice_types],
+                           add_counts=True)
+
+    def append_junction_metadata(self, metadata, csv, junction_ids):
+        """Append the metadata of junctions which weren't written yet to csv
+
+        Only the ids of the junctions already in ``csv`` are kept in memory,
+        in the set ``junction_ids``, which is updated with the new ones. The
+        header is written with the first junctions.
+        """
+        metadata = metadata.drop_duplicates(common.JUNCTION_ID)
+        new = metadata.loc[~metadata[common.JUNCTION_ID].isin(junction_ids)]
+        if len(new.index) == 0:
+            return
+        tables.append_csv(new, csv, first=not junction_ids, index=False)
+        junction_ids.update(new[common.JUNCTION_ID])
+
+    def execute_stream(self):
+        """Calculate Psi of one bam file at a time, straight from the bam
+
+        Each worker counts the junction reads of one bam file and calculates
+        Psi of that sample on the junctions of the index, so the junction
+        reads of all samples are never in one table. Junction metadata, and
+        Psi of ``STREAM_CHUNK_SIZE`` samples at a time, are written to
+        temporary files as samples are done and put together from disk at
+        the end, so memory doesn't grow with the number of samples
+        """
+        if self.bam is None:
+            raise ValueError('--stream calculates Psi straight from bam '
+                             'files, so it requires --bam')
+        if self.append or self.sample_partition_size is not None:
+            raise ValueError('--stream can\'t be combined with --append or '
+                             '--sample-partition-size')
+        bam_filenames = self.shard_alignments()
+
+        splice_types = []
+        event_junctions = []
+        for splice_name, splice_abbrev in outrigger.common.SPLICE_TYPES:
+            filename = self.maybe_get_validated_events(splice_abbrev)
+            if not os.path.exists(filename):
+                util.progress('No {name} ({abbrev}) events found, '
+                              'skipping.'. format(name=splice_name,
+                                                  abbrev=splice_abbrev))
+                continue
+            util.progress('Reading {name} ({abbrev}) events from {filename}'
+                          ' ...'.format(name=splice_name, abbrev=splice_abbrev,
+                                        filename=filename))
+            type_junctions = self.read_event_junctions(filename,
+                                                       splice_abbrev)
+            util.done()
+
+            self.maybe_make_folder(os.path.join(self.psi_folder,
+                                                splice_abbrev))
+            self.write_calculated(
+                type_junctions, [os.path.basename(x) for x in bam_filenames],
+                splice_abbrev)
+            splice_types.append((splice_name, splice_abbrev))
+            event_junctions.append((splice_abbrev, type_junctions))
+
+        metadata_csv = os.path.join(self.junctions_folder, METADATA_CSV)
+        write_metadata = not os.path.exists(metadata_csv)
+        temp_folder = tempfile.mkdtemp(prefix='stream', dir=self.psi_folder)
+        try:
+            # Metadata of each junction is written the first time it's seen,
+            # and moved to metadata.csv once all samples are done
+            temp_metadata_csv = os.path.join(temp_folder, METADATA_CSV)
+            junction_ids = set()
+            long_psis = dict((abbrev, []) for name, abbrev in splice_types)
+            long_npzs = dict((abbrev, []) for name, abbrev in splice_types)
+            psi_csvs = []
+            pasted = []
+            util.progress('Calculating percent spliced-in (Psi) scores of '
+                          '{n} bam files, one at a time, writing each sample '
+                          'as it is done ...'.format(n=len(bam_filenames)))
+            samples = stream.iter_bam_psi(
+                bam_filenames, event_junctions,
+                ignore_multimapping=self.ignore_multimapping,
+                n_jobs=self.n_jobs, backend=self.backend,
+                min_reads=self.min_reads, method=self.method,
+                uneven_coverage_multiplier=self.uneven_coverage_multiplier,
+                notes=self.notes, psi_format=self.psi_format,
+                dtypes=self.dtypes, summary=self.summary)
+            for i, (metadata, results) in enumerate(samples):
+                if write_metadata:
+                    self.append_junction_metadata(metadata, temp_metadata_csv,
+                                                  junction_ids)
+                last_chunk = (i + 1) % STREAM_CHUNK_SIZE == 0 or \
+                    i == len(bam_filenames) - 1
+                psis = []
+                for (splice_name, splice_abbrev), (type_psi, summary) in zip(
+                        splice_types, results):
+                    if summary is not None:
+                        tables.append_csv(
+                            summary, self.splice_type_file(splice_abbrev,
+                                                           'summary.csv'),
+                            first=i == 0, na_rep='NA', index=False)
+                    if self.psi_format == 'long':
+                        # Written to a temporary file every chunk of
+                        # samples, and put together at the end
+                        long_psis[splice_abbrev].append(type_psi)
+                        if last_chunk:
+                            npz = os.path.join(temp_folder, '{}{}.npz'.format(
+                                splice_abbrev, len(long_npzs[splice_abbrev])))
+                            tables.write_npz(pd.concat(
+                                long_psis[splice_abbrev], ignore_index=True),
+                                npz)
+                            long_npzs[splice_abbrev].append(npz)
+                            long_psis[splice_abbrev] = []
+                        continue
+                    tables.append_csv(
+                        type_psi,
+                        self.splice_type_file(splice_abbrev, 'psi.csv'),
+                        first=i == 0, na_rep='NA')
+                    psis.append(type_psi)
+
+                if self.psi_format == 'wide':
+                    # Events x samples, pasted together into the big matrix
+                    # at the end
+                    pasted.append(pd.concat(psis, axis=1))
+                    if last_chunk:
+                        csv = os.path.join(temp_folder, 'psi{}.csv'.format(
+                            len(psi_csvs)))
+                        pd.concat(pasted).T.to_csv(csv, na_rep='NA')
+                        psi_csvs.append(csv)
+                        pasted = []
+            util.done()
+
+            if junction_ids:
+                util.progress('Writing metadata of junctions to {csv}'
+                              ' ...'.format(csv=metadata_csv))
+                shutil.move(temp_metadata_csv, metadata_csv)
+                util.done()
+
+            for splice_name, splice_abbrev in splice_types:
+                if long_npzs[splice_abbrev]:
+                    filename = self.splice_type_file(splice_abbrev,
+                                                     'psi.npz')
+                    util.progress('Writing {name} ({abbrev}) Psi values to '
+                                  '{filename} ...'.format(
+                                        name=splice_name,
+                                        abbrev=splice_abbrev,
+                                        filename=filename))
+                    tables.concatenate_npzs(long_npzs[splice_abbrev],
+                                            filename)
+                    util.done()
+
+            if self.case_codes:
+                self.write_case_table()
+
+            if self.psi_format == 'wide' and psi_csvs:
+                csv = os.path.join(self.psi_folder, 'outrigger_psi.csv')
+                util.progress('Writing a samples x features matrix of Psi '
+                              'scores to {} ...'.format(csv))
+                tables.paste_csvs(psi_csvs, csv)
+                util.done()
+        finally:
+            shutil.rmtree(temp_folder)
+
+        self.write_summary([abbrev for name, abbrev in splice_types],
+                           add_counts=True)
+
+    def read_new_junction_reads(self):
+        """Junction reads of the samples to add with ``--append``"""
+        if self.bam is not None or self.sj_out_tab is not None:
+            return self.read_alignments()
+        if self.junction_reads_csv is not None:
+            return self.maybe_read_junction_reads()
+        raise ValueError('Adding samples with "--append" requires the '
+                         'junction reads of the new samples, from '
+                         '--sj-out-tab, --bam or --junction-reads-csv')
+
+    def check_appendable(self, splice_abbrev):
+        """Make sure new samples can be added to a splice type's output"""
+        required = [slots.JUNCTION_SLOTS_NPZ, SAMPLES_CSV, 'summary.csv',
+                    'psi.npz' if self.psi_format == 'long' else 'psi.csv']
+        for filename in required:
+            if not os.path.exists(self.splice_type_file(splice_abbrev,
+                                                        filename)):
+                raise OSError(
+                    "Can't add samples to the {abbrev} Psi output in {folder}"
+                    " because {filename} doesn't exist. Is --psi-format the "
+                    "same as before? Otherwise, rerun \"outrigger psi\" on "
+                    "all samples without --append".format(
+                        abbrev=splice_abbrev, filename=filename,
+                        folder=self.psi_folder))
+
+        notes = common.CASE if self.notes == 'code' else common.NOTES
+        summary_csv = self.splice_type_file(splice_abbrev, 'summary.csv')
+        if notes not in tables.read_header(summary_csv):
+            raise ValueError(
+                'The summary {csv} was written with a different --notes '
+                'option than "{notes}". Use the same --notes as '
+                'before'.format(csv=summary_csv, notes=self.notes))
+
+    def execute_append(self):
+        """Calculate Psi of only new samples and add them to the output"""
+        if self.summary != 'full':
+            raise ValueError('Adding samples with "--append" adds to the '
+                             'full summaries, so it can\'t be used with '
+                             '"--summary {}"'.format(self.summary))
+        splice_types = [
+            (splice_name, splice_abbrev)
+            for splice_name, splice_abbrev in outrigger.common.SPLICE_TYPES
+            if os.path.exists(self.splice_type_file(
+                splice_abbrev, slots.JUNCTION_SLOTS_NPZ))]
+        if not splice_types:
+            raise OSError("There is no output of \"outrigger psi\" in {} to "
+                          "add samples to".format(self.psi_folder))
+        for splice_name, splice_abbrev in splice_types:
+            self.check_appendable(splice_abbrev)
+
+        junction_reads = self.read_new_junction_reads()
+        junction_reads_2d = self.make_junction_reads_2d(junction_reads)
+
+        old_samples = pd.read_csv(self.splice_type_file(
+            splice_types[0][1], SAMPLES_CSV))[outrigger.common.SAMPLE_ID]
+        existing = junction_reads_2d.index.intersection(old_samples)
+        if len(existing) > 0:
+            raise ValueError('Psi was already calculated on these samples: '
+                             '{}'.format(', '.join(map(str, existing))))
+
+        # Keep the table of all samples' reads complete
+        reads_csv = os.path.join(self.junctions_folder, 'reads.csv')
+        if os.path.exists(reads_csv):
+            util.progress('Adding junction reads of {n} new samples to '
+                          '{csv} ...'.format(n=len(junction_reads_2d.index),
+                                             csv=reads_csv))
+            if self.bam is None and self.sj_out_tab is None:
+                # Copy the reads exactly as they are in the csv
+                tables.append_csv_file(self.junction_reads_csv, reads_csv)
+            else:
+                columns = tables.read_header(reads_csv)
+                tables.append_csv(junction_reads.reindex(columns=columns),
+                                  reads_csv, index=False)
+            util.done()
+
+        metadata_csv = os.path.join(self.junctions_folder, METADATA_CSV)
+        if os.path.exists(metadata_csv):
+            metadata = star.make_metadata(junction_reads)
+            known = pd.read_csv(metadata_csv, usecols=[common.JUNCTION_ID])
+            metadata = metadata.loc[~metadata[common.JUNCTION_ID].isin(
+                known[common.JUNCTION_ID])]
+            util.progress('Adding {n} junctions which are only in the new '
+                          'samples to {csv} ...'.format(n=len(metadata),
+                                                        csv=metadata_csv))
+            columns = tables.read_header(metadata_csv)
+            tables.append_csv(metadata.reindex(columns=columns), metadata_csv,
+                              index=False)
+            util.done()
+
+        psis = []
+        summary_csvs = []
+        new_summary_csvs = []
+        splice_abbrevs = []
+        for splice_name, splice_abbrev in splice_types:
+            calculated = slots.EventJunctions.load(self.splice_type_file(
+                splice_abbrev, slots.JUNCTION_SLOTS_NPZ))
+            filename = self.maybe_get_validated_events(splice_abbrev)
+            event_junctions = self.read_event_junctions(
+                filename, splice_abbrev).subset(calculated.event_ids)
+
+            # New samples have zero reads on junctions which were only in
+            # the old samples
+            columns = junction_reads_2d.columns.union(calculated.junctions)
+            type_reads_2d = reads.reindex_columns(junction_reads_2d, columns)
+
+            samples_csv = self.splice_type_file(splice_abbrev, SAMPLES_CSV)
+            sample_ids = pd.read_csv(samples_csv)[
+                outrigger.common.SAMPLE_ID].tolist()
+            self.write_calculated(event_junctions.present(columns),
+                                  sample_ids + type_reads_2d.index.tolist(),
+                                  splice_abbrev)
+
+            summary_csv = self.splice_type_file(splice_abbrev, 'summary.csv')
+            new_summary_csv = self.splice_type_file(splice_abbrev,
+                                                    'summary.new.csv')
+            type_psis = self.calculate_splice_type(
+                event_junctions, type_reads_2d, splice_name, splice_abbrev,
+                new_summary_csv)
+            try:
+                tables.append_csv_file(new_summary_csv, summary_csv)
+            except ValueError:
+                # New samples have more incompatible junctions
+                tables.concatenate_csvs([summary_csv, new_summary_csv],
+                                        summary_csv + '.new', index=False)
+                shutil.move(summary_csv + '.new', summary_csv)
+            summary_csvs.append(summary_csv)
+            new_summary_csvs.append(new_summary_csv)
+            splice_abbrevs.append(splice_abbrev)
+
+            if self.psi_format == 'long':
+                filename = self.splice_type_file(splice_abbrev, 'psi.npz')
+                util.progress('Adding {name} ({abbrev}) Psi values to '
+                              '{filename} ...'.format(name=splice_name,
+                                                      abbrev=splice_abbrev,
+                                                      filename=filename))
+                type_psi = pd.concat([tables.read_npz(filename)] + type_psis,
+                                     ignore_index=True)
+                tables.write_npz(type_psi, filename)
+                util.done()
+                continue
+
+            csv = self.splice_type_file(splice_abbrev, 'psi.csv')
+            util.progress('Adding {name} ({abbrev}) Psi values to {filename}'
+                          ' ...'.format(name=splice_name, abbrev=splice_abbrev,
+                                        filename=csv))
+            type_psi = pd.concat(type_psis, axis=1)
+            type_psi = type_psi.reindex(columns=tables.read_header(csv)[1:])
+            tables.append_csv(type_psi, csv, na_rep='NA')
+            psis.append(type_psi)
+            util.done()
+
+        if self.psi_format == 'wide':
+            csv = os.path.join(self.psi_folder, 'outrigger_psi.csv')
+            util.progress('Adding new samples to the features x samples '
+                          'matrix of Psi scores in {} ...'.format(csv))
+            tables.join_csv(csv, pd.concat(psis, axis=1).T)
+            util.done()
+
         csv = os.path.join(self.psi_folder, 'outrigger_summary.csv')
-        util.progress('Writing summary table of Psi scores, junction reads, '
-                      'and cases to {} ...'.format(csv))
-        summary.to_csv(csv, na_rep='NA')
+        util.progress('Adding new samples to the summary table of all splice '
+                      'types in {} ...'.format(csv))
+        try:
+            for new_summary_csv, splice_abbrev in zip(new_summary_csvs,
+                                                      splice_abbrevs):
+                tables.append_csv_file(new_summary_csv, csv,
+                                       column='splice_type',
+                                       value=splice_abbrev, index=True)
+        except ValueError:
+            tables.concatenate_csvs(summary_csvs, csv, column='splice_type',
+                                    values=splice_abbrevs)
+        for new_summary_csv in new_summary_csvs:
+            os.remove(new_summary_csv)
+        util.done()
+
+    def execute_sweep(self):
+        """Calculate Psi with every combination of thresholds in one pass
+
+        The junction reads are read and pivoted only once, and each block of
+        events' reads are gathered only once for all the settings
+        """
+        if self.append or self.sample_partition_size is not None:
+            raise ValueError('Sweeping thresholds with --sweep-min-reads or '
+                             '--sweep-uneven-coverage-multiplier can\'t be '
+                             'combined with --append or '
+                             '--sample-partition-size')
+        settings = vectorized.sweep_settings(
+            self.sweep_min_reads or [self.min_reads],
+            self.sweep_uneven_coverage_multiplier
+            or [self.uneven_coverage_multiplier])
+
+        junction_reads, sample_ids = self.read_index_junction_reads()
+        junction_reads_2d = self.make_junction_reads_2d(junction_reads,
+                                                        sample_ids)
+        self.maybe_make_folder(self.sweep_folder)
+
+        psis = [[] for setting in settings]
+        counts = []
+        for splice_name, splice_abbrev in outrigger.common.SPLICE_TYPES:
+            filename = self.maybe_get_validated_events(splice_abbrev)
+            if not os.path.exists(filename):
+                util.progress('No {name} ({abbrev}) events found, '
+                              'skipping.'. format(name=splice_name,
+                                                  abbrev=splice_abbrev))
+                continue
+            event_junctions = self.read_event_junctions(filename,
+                                                        splice_abbrev)
+
+            util.progress(
+                'Calculating percent spliced-in (Psi) scores on {name} '
+                '({abbrev}) events with {n} settings of --min-reads and '
+                '--uneven-coverage-multiplier ...'.format(
+                    name=splice_name, abbrev=splice_abbrev,
+                    n=len(settings)))
+            blocks = vectorized.iter_sweep(
+                event_junctions, junction_reads_2d, settings=settings,
+                method=self.method, n_jobs=self.n_jobs, backend=self.backend,
+                chunk_size=self.chunk_size, output=self.sweep_output,
+                **outrigger.common.ISOFORM_JUNCTIONS[splice_abbrev])
+            if self.sweep_output == 'counts':
+                type_counts = sum(blocks)
+                type_counts = type_counts.stack().rename(common.COUNT)
+                type_counts = type_counts.reset_index()
+                type_counts.insert(2, 'splice_type', splice_abbrev)
+                counts.append(type_counts)
+            else:
+                for block in blocks:
+                    for setting_psis, block_psi in zip(psis, block):
+                        block_psi.insert(2, 'splice_type', splice_abbrev)
+                        setting_psis.append(block_psi)
+            util.done()
+
+        if self.sweep_output == 'counts' and counts:
+            csv = os.path.join(self.sweep_folder, 'counts.csv')
+            util.progress('Writing the number of samples and events in each '
+                          'case of every setting to {} ...'.format(csv))
+            pd.concat(counts, ignore_index=True).to_csv(csv, index=False)
+            util.done()
+        elif self.sweep_output == 'psi':
+            for (min_reads, multiplier), setting_psis in zip(settings, psis):
+                if not setting_psis:
+                    continue
+                filename = os.path.join(
+                    self.sweep_folder,
+                    'min_reads{}_uneven_coverage_multiplier{}.npz'.format(
+                        min_reads, multiplier))
+                util.progress('Writing Psi values with --min-reads {} and '
+                              '--uneven-coverage-multiplier {} to {} '
+                              '...'.format(min_reads, multiplier, filename))
+                tables.write_npz(pd.concat(setting_psis, ignore_index=True),
+                                 filename)
+                util.done()
+
+
+class Serve(SubcommandAfterIndex):
+
+    junction_reads_csv = None
+    host = server.HOST
+    port = server.PORT
+    sparse = False
+    n_jobs = 1
+
+    @property
+    def folders(self):
+        # Only reads the index and junction reads, doesn't write anything
+        return ()
+
+    def execute(self):
+        """Load the index and junction reads, then answer Psi requests"""
+        if not os.path.exists(self.junction_reads_filename):
+            raise OSError(
+                "The junction reads csv file ({}) doesn't exist! Run "
+                "\"outrigger psi\" first, or give --junction-reads-csv"
+                "".format(self.junction_reads_filename))
+        store = server.PsiStore(
+            self.input_index, self.junction_reads_filename,
+            min_reads=self.min_reads, method=self.method,
+            uneven_coverage_multiplier=self.uneven_coverage_multiplier,
+            n_jobs=self.n_jobs, sparse=self.sparse,
+            sample_id_col=self.sample_id_col,
+            junction_id_col=self.junction_id_col, reads_col=self.reads_col)
+        util.progress('Answering Psi requests on http://{host}:{port}/psi '
+                      '... (Press Ctrl+C to stop)'.format(host=self.host,
+                                                          port=self.port))
+        server.serve(store, self.host, self.port)
+        util.done()
+
+
+class MergePsi(Subcommand):
+
+    shards = ()
+
+    @property
+    def psi_folder(self):
+        return os.path.join(self.output_folder, 'psi')
+
+    @property
+    def folders(self):
+        return self.output_folder, self.psi_folder
+
+    def execute(self):
+        """Combine the Psi of shards of samples into one psi folder"""
+        shard_folders = [os.path.join(x, 'psi') for x in self.shards]
+        for folder in shard_folders:
+            if not os.path.exists(folder):
+                raise OSError("The Psi folder of a shard ({}) doesn't exist! "
+                              "Was \"outrigger psi --shard\" run with this "
+                              "--output folder?".format(folder))
+        util.progress('Merging the Psi of {n} shards into {folder} '
+                      '...'.format(n=len(shard_folders),
+                                   folder=self.psi_folder))
+        splice_abbrevs = shards.merge_psi(shard_folders, self.psi_folder)
         util.done()
+        util.progress('Merged the Psi of the {} events'.format(
+            ', '.join(splice_abbrevs)))
 
 
 def main():
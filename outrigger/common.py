@@ -63,6 +63,8 @@ UNEVEN_COVERAGE_MULTIPLIER = 10
 
 # --- Outrigger Psi --- #
 NOTES = 'notes'
+CASE = 'case'
+COUNT = 'count'
 PSI = 'psi'
 UPSTREAM = 'upstream'
 DOWNSTREAM = 'downstream'
@@ -0,0 +1,448 @@
+"""
+Write large tables to csv files a chunk at a time
+"""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Number of rows to read at once when copying between csv files
+CHUNKSIZE = 100000
+
+
+def append_csv(df, filename, first=False, **kwargs):
+    """Write a chunk of a table to a csv file
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        A chunk of rows of the table
+    filename : str
+        Name of the csv file
+    first : bool, optional
+        If True, this is the first chunk, so overwrite ``filename`` and write
+        the header. Otherwise, append ``df`` to the end of the file without a
+        header. (default=False)
+    kwargs
+        Any other keyword arguments to :py:meth:`pandas.DataFrame.to_csv`
+    """
+    df.to_csv(filename, mode='w' if first else 'a', header=first, **kwargs)
+
+
+def read_header(filename):
+    """Column names of a csv file, without reading the rest"""
+    return pd.read_csv(filename, nrows=0).columns.tolist()
+
+
+def _last_index(filename):
+    """Index of the last row of a csv whose first column is a row number
+
+    Only the end of the file is read. Returns -1 if there are no rows.
+    """
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        block = min(size, 4096)
+        while True:
+            f.seek(size - block)
+            lines = f.read(block).rstrip(b'\n').split(b'\n')
+            if len(lines) > 1 or block == size:
+                break
+            block = min(size, block * 2)
+    if len(lines) < 2:
+        # Only the header
+        return -1
+    return int(lines[-1].split(b',')[0])
+
+
+def append_csv_file(source, target, column=None, value=None, index=False,
+                    na_rep='NA', chunksize=CHUNKSIZE):
+    """Append the rows of one csv file to the end of another
+
+    The rows of ``source`` are matched to the columns of ``target``, and
+    only ``chunksize`` rows are in memory at a time. Values are copied as
+    text, exactly as they are in ``source``.
+
+    Parameters
+    ----------
+    source : str
+        Csv file with a header and no index, whose rows are added
+    target : str
+        Csv file to add the rows to
+    column : str, optional
+        Name of a column of ``target`` which isn't in ``source``, to fill
+        with ``value``
+    value : str, optional
+        Value of ``column`` for the rows of ``source``
+    index : bool, optional
+        If True, the first column of ``target`` is the row number, which is
+        continued for the new rows. (default=False)
+    na_rep : str, optional
+        Missing values, for the columns of ``target`` which aren't in
+        ``source`` (default="NA")
+    chunksize : int, optional
+        Number of rows to read and write at a time
+
+    Raises
+    ------
+    ValueError
+        If ``source`` has columns which ``target`` doesn't
+    """
+    columns = read_header(target)
+    if index:
+        columns = columns[1:]
+    extra = set(read_header(source)) - set(columns)
+    if extra:
+        raise ValueError('{source} has columns which are not in {target}: '
+                         '{extra}'.format(source=source, target=target,
+                                          extra=', '.join(sorted(extra))))
+
+    n_rows = _last_index(target) + 1 if index else 0
+    chunks = pd.read_csv(source, dtype=str, keep_default_na=False,
+                         chunksize=chunksize)
+    for chunk in chunks:
+        if column is not None:
+            chunk[column] = value
+        chunk = chunk.reindex(columns=columns, fill_value=na_rep)
+        chunk.index = pd.RangeIndex(n_rows, n_rows + len(chunk))
+        append_csv(chunk, target, index=index)
+        n_rows += len(chunk)
+
+
+def join_csv(filename, df, na_rep='NA', chunksize=CHUNKSIZE):
+    """Add the columns of a table to a csv file, matching the rows
+
+    The csv file is rewritten ``chunksize`` rows at a time, and its values
+    are copied as text.
+
+    Parameters
+    ----------
+    filename : str
+        Csv file whose first column is the row names, like ``df.index``
+    df : pandas.DataFrame
+        Columns to add. Rows of ``filename`` which aren't in ``df`` get
+        ``na_rep``, and rows of ``df`` which aren't in ``filename`` are
+        ignored.
+    na_rep : str, optional
+        Missing values (default="NA")
+    chunksize : int, optional
+        Number of rows to read and write at a time
+    """
+    joined = filename + '.joined'
+    chunks = pd.read_csv(filename, dtype=str, keep_default_na=False,
+                         index_col=0, chunksize=chunksize)
+    for i, chunk in enumerate(chunks):
+        chunk = chunk.join(df.reindex(chunk.index))
+        append_csv(chunk, joined, first=i == 0, na_rep=na_rep)
+    shutil.move(joined, filename)
+
+
+def concatenate_csvs(filenames, csv, column=None, values=None,
+                     na_rep='NA', chunksize=CHUNKSIZE, index=True):
+    """Stack csv tables into one big csv, without reading them all at once
+
+    Same output as writing ``pd.concat(dfs, ignore_index=True)`` with a
+    ``column`` added to each table, but only ``chunksize`` rows are in
+    memory at a time. Values are copied as text, exactly as they are in the
+    original files.
+
+    Parameters
+    ----------
+    filenames : list of str
+        Csv files to concatenate, each with a header and no index
+    csv : str
+        Name of the concatenated csv file to write
+    column : str, optional
+        Name of a column to add to the concatenated table, to tell which file
+        each row came from
+    values : list, optional
+        Value of ``column`` for the rows of each file in ``filenames``
+    na_rep : str, optional
+        Missing values, including columns which are only in some of the
+        files (default="NA")
+    chunksize : int, optional
+        Number of rows to read and write at a time
+    index : bool, optional
+        If True, write the row numbers as the first column (default=True)
+    """
+    # Same columns, in the same order, as pd.concat of the tables with
+    # ``column`` added to each, so it comes right after the first table's
+    columns = []
+    for filename in filenames:
+        columns.extend(name for name in read_header(filename)
+                       if name not in columns)
+        if column is not None and column not in columns:
+            columns.append(column)
+    if column is not None and column not in columns:
+        columns.append(column)
+
+    # The concatenated table is numbered 0, 1, 2, ... like ignore_index=True
+    n_rows = 0
+    for i, filename in enumerate(filenames):
+        chunks = pd.read_csv(filename, dtype=str, keep_default_na=False,
+                             chunksize=chunksize)
+        for chunk in chunks:
+            if column is not None:
+                chunk[column] = values[i]
+            chunk = chunk.reindex(columns=columns, fill_value=na_rep)
+            chunk.index = pd.RangeIndex(n_rows, n_rows + len(chunk))
+            append_csv(chunk, csv, first=n_rows == 0, index=index)
+            n_rows += len(chunk)
+
+    if n_rows == 0:
+        # Only the header
+        pd.DataFrame(columns=columns).to_csv(csv, index=index)
+
+
+def read_unique(filename, columns, chunksize=CHUNKSIZE):
+    """Sorted unique values of columns of a csv file, a chunk at a time
+
+    Values are read as text, exactly as they are in the file.
+
+    Parameters
+    ----------
+    filename : str
+        Csv file with a header
+    columns : list of str
+        Columns to find the unique values of
+    chunksize : int, optional
+        Number of rows to read at a time
+
+    Returns
+    -------
+    uniques : list of pandas.Index
+        Sorted unique values of each column
+    """
+    uniques = [set() for _ in columns]
+    chunks = pd.read_csv(filename, usecols=columns, dtype=str,
+                         keep_default_na=False, chunksize=chunksize)
+    for chunk in chunks:
+        for values, column in zip(uniques, columns):
+            values.update(chunk[column].unique())
+    return [pd.Index(sorted(values)) for values in uniques]
+
+
+def read_rows(filename, filters, chunksize=CHUNKSIZE, unique=None, **kwargs):
+    """Read only the rows of a csv file with the given values, in chunks
+
+    Parameters
+    ----------
+    filename : str
+        Csv file with a header
+    filters : dict
+        Mapping of column names to the values to keep. Rows are kept if every
+        one of these columns has one of its values
+    chunksize : int, optional
+        Number of rows to read at a time
+    unique : list of str, optional
+        Columns to also find the unique values of, in every row of the file
+        including the rows which aren't kept
+    kwargs
+        Any other keyword arguments to :py:func:`pandas.read_csv`, e.g.
+        ``usecols``
+
+    Returns
+    -------
+    rows : pandas.DataFrame
+        The matching rows, in the same order as in ``filename``
+    uniques : list of pandas.Index
+        Only if ``unique`` is given. Sorted unique values of each of its
+        columns
+    """
+    chunks = pd.read_csv(filename, chunksize=chunksize, **kwargs)
+    rows = []
+    uniques = [set() for _ in unique or []]
+    for chunk in chunks:
+        keep = np.ones(len(chunk), dtype=bool)
+        for column, values in filters.items():
+            keep &= chunk[column].isin(values).values
+        rows.append(chunk.loc[keep])
+        for values, column in zip(uniques, unique or []):
+            values.update(chunk[column].unique())
+    if not rows:
+        # Only the header
+        rows = pd.read_csv(filename, nrows=0, **kwargs)
+    else:
+        rows = pd.concat(rows)
+    if unique is None:
+        return rows
+    return rows, [pd.Index(sorted(values)) for values in uniques]
+
+
+def split_csv(filename, column, groups, filenames, chunksize=CHUNKSIZE):
+    """Split the rows of a csv file into several files by the value of a column
+
+    Only ``chunksize`` rows are in memory at a time, and values are copied as
+    text, exactly as they are in ``filename``. Rows keep their order.
+
+    Parameters
+    ----------
+    filename : str
+        Csv file with a header and no index
+    column : str
+        Name of the column whose value decides which file a row goes to
+    groups : dict or pandas.Series
+        Mapping of each value of ``column`` to the position of its file in
+        ``filenames``. Rows with other values are dropped.
+    filenames : list of str
+        Names of the csv files to write. Every file gets the header, even if
+        it has no rows.
+    chunksize : int, optional
+        Number of rows to read and write at a time
+    """
+    header = pd.DataFrame(columns=read_header(filename))
+    for name in filenames:
+        header.to_csv(name, index=False)
+
+    groups = pd.Series(groups)
+    chunks = pd.read_csv(filename, dtype=str, keep_default_na=False,
+                         chunksize=chunksize)
+    for chunk in chunks:
+        positions = chunk[column].map(groups)
+        for position, rows in chunk.groupby(positions, sort=False):
+            append_csv(rows, filenames[int(position)], index=False)
+
+
+def paste_csvs(filenames, csv, chunksize=CHUNKSIZE):
+    """Put the columns of csv tables with the same rows side by side
+
+    Same output as writing ``pd.concat(dfs, axis=1)``, but only ``chunksize``
+    rows of each file are in memory at a time. Values are copied as text,
+    exactly as they are in the original files.
+
+    Parameters
+    ----------
+    filenames : list of str
+        Csv files whose first column is the row names, which are the same and
+        in the same order in every file
+    csv : str
+        Name of the pasted csv file to write
+    chunksize : int, optional
+        Number of rows to read and write at a time
+
+    Raises
+    ------
+    ValueError
+        If the rows of the files have different names
+    """
+    readers = [pd.read_csv(filename, dtype=str, keep_default_na=False,
+                           index_col=0, chunksize=chunksize)
+               for filename in filenames]
+    n_rows = 0
+    for chunks in zip(*readers):
+        if not all(chunk.index.equals(chunks[0].index) for chunk in chunks):
+            raise ValueError('The rows of {} are not the same, so their '
+                             'columns can\'t be put side by '
+                             'side'.format(', '.join(filenames)))
+        pasted = pd.concat(chunks, axis=1)
+        append_csv(pasted, csv, first=n_rows == 0)
+        n_rows += len(pasted)
+
+    if n_rows == 0:
+        # Only the header
+        columns = [name for filename in filenames
+                   for name in read_header(filename)[1:]]
+        index = read_header(filenames[0])[0] if filenames else ''
+        pd.DataFrame(columns=[index] + columns).to_csv(csv, index=False)
+
+
+def write_npz(df, filename):
+    """Write a table as compressed columns to a NumPy ``.npz`` file
+
+    Each column is stored as its own compressed array. Text columns, such as
+    sample and event ids, are stored as integer codes into their sorted
+    unique values, so each id is written only once. The index is not saved.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Table to write
+    filename : str
+        Name of the file, which should end in ".npz"
+    """
+    arrays = {'columns': np.array(df.columns, dtype=str)}
+    for i, name in enumerate(df.columns):
+        values = df[name]
+        if values.dtype == object or values.dtype.name == 'category':
+            codes, uniques = pd.factorize(values, sort=True)
+            arrays['codes{}'.format(i)] = codes.astype(np.int32)
+            arrays['categories{}'.format(i)] = np.array(uniques, dtype=str)
+        else:
+            arrays['values{}'.format(i)] = values.values
+    np.savez_compressed(filename, **arrays)
+
+
+def read_npz(filename):
+    """Read a table written by :py:func:`write_npz`
+
+    Text columns are read as memory-efficient pandas Categoricals.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the ".npz" file
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The table
+    """
+    with np.load(filename) as arrays:
+        columns = arrays['columns'].tolist()
+        data = {}
+        for i, name in enumerate(columns):
+            if 'codes{}'.format(i) in arrays:
+                data[name] = pd.Categorical.from_codes(
+                    arrays['codes{}'.format(i)],
+                    categories=arrays['categories{}'.format(i)].astype(object))
+            else:
+                data[name] = arrays['values{}'.format(i)]
+    return pd.DataFrame(data, columns=columns)
+
+
+def concatenate_npzs(filenames, filename):
+    """Stack the rows of tables written by :py:func:`write_npz` into one
+
+    Only one column of all the tables is in memory at a time. The codes of
+    text columns are translated to the sorted unique values of all tables,
+    so the result is the same as writing the concatenated tables at once.
+
+    Parameters
+    ----------
+    filenames : list of str
+        Names of the ".npz" files, whose rows are stacked in this order
+    filename : str
+        Name of the ".npz" file to write
+
+    Raises
+    ------
+    ValueError
+        If the tables don't all have the same columns
+    """
+    files = [np.load(x) for x in filenames]
+    try:
+        columns = files[0]['columns']
+        for name, npz in zip(filenames[1:], files[1:]):
+            if not np.array_equal(npz['columns'], columns):
+                raise ValueError('The columns of {} are different from the '
+                                 'columns of {}'.format(name, filenames[0]))
+
+        arrays = {'columns': columns}
+        for i in range(len(columns)):
+            codes = 'codes{}'.format(i)
+            if codes not in files[0]:
+                values = 'values{}'.format(i)
+                arrays[values] = np.concatenate([x[values] for x in files])
+                continue
+            categories = [x['categories{}'.format(i)] for x in files]
+            uniques = np.unique(np.concatenate(categories))
+            # Missing values have the code -1, which stays -1
+            arrays[codes] = np.concatenate([
+                np.append(np.searchsorted(uniques, c), -1)[x[codes]]
+                for x, c in zip(files, categories)]).astype(np.int32)
+            arrays['categories{}'.format(i)] = uniques
+    finally:
+        for npz in files:
+            npz.close()
+    np.savez_compressed(filename, **arrays)
@@ -6,6 +6,7 @@ import pandas as pd
 from ..common import INCOMPATIBLE_JUNCTIONS, MIN_READS, \
     UNEVEN_COVERAGE_MULTIPLIER, SAMPLE_ID, EVENT_ID, NOTES, PSI
 from ..util import progress
+from . import vectorized
 
 
 logging.basicConfig()
@@ -606,20 +607,27 @@ def calculate_psi(event_annotation, reads2d,
                   isoform1_junctions, isoform2_junctions,
                   min_reads=MIN_READS, method='mean',
                   uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER,
-                  n_jobs=-1):
+                  n_jobs=-1, notes='text', temp_folder=None,
+                  chunk_size=None):
     """Compute percent-spliced-in of events based on junction reads
 
+    All events and samples are calculated at once with NumPy arrays by
+    :py:mod:`outrigger.psi.vectorized`, which gives the same output as
+    iterating over the events with :py:func:`_maybe_parallelize_psi`.
+
     Parameters
     ----------
     event_annotation : pandas.DataFrame
         A table where each row represents a single splicing event. The required
        columns are the ones specified in `isoform1_junctions`,
         `isoform2_junctions`, and `event_col`.
-    reads2d : pandas.DataFrame
+    reads2d : pandas.DataFrame or outrigger.psi.reads.SparseReads
         A (n_samples, n_total_junctions) table of the number of reads found in
         all samples' exon-exon, all junctions. Very very large, e.g.
         1000 samples x 50,000 junctions = 50 million elements
         number of reads observed at a splice junction of a particular sample.
+        For datasets with mostly zero reads, use a sparse matrix built with
+        :py:meth:`outrigger.psi.reads.SparseReads.from_tall`
     isoform1_junctions : list
         Columns in `event_annotation` which represent junctions that
         correspond to isoform1, the Psi=0 isoform, e.g. ['junction13'] for SE
@@ -643,8 +651,24 @@ def calculate_psi(event_annotation, reads2d,
         junction12 and junction23, junction12=40 but junction23=500, then this
         event would be rejected because 500 > 40*10 (default=10)
     n_jobs : int, optional
-        Number of subprocesses to create. Default is -1, which is to use as
-        many processes/cores as possible
+        Number of subprocesses to create, each of which calculates Psi on a
+        block of events. Default is -1, which is to use as many
+        processes/cores as possible. The reads are memory-mapped once and
+        shared by all subprocesses, rather than copied to each one
+    notes : "text" | "categorical" | "code", optional
+        How to report why each event in each sample was or was not rejected.
+        "text" (default) is the English explanation, "categorical" is the same
+        explanation stored as a memory-efficient pandas Categorical, and
+        "code" replaces the "notes" column with an integer "case" column,
+        which can be translated with
+        :py:func:`outrigger.psi.vectorized.case_table`
+    temp_folder : str, optional
+        Folder for the memory-mapped reads shared by the subprocesses. Default
+        is ``$JOBLIB_TEMP_FOLDER`` or the system's temporary folder
+    chunk_size : int, optional
+        Number of events calculated together in one block, by one subprocess.
+        Default is to choose based on the number of events, samples and
+        processors, with at most a few million junction reads per block
 
     Returns
     -------
@@ -655,11 +679,8 @@ def calculate_psi(event_annotation, reads2d,
         reads, percent spliced-in (Psi), and notes on each event in each
         sample, that explains why or why not Psi was calculated
     """
-    summaries = _maybe_parallelize_psi(event_annotation, reads2d,
-                                       isoform1_junctions, isoform2_junctions,
-                                       min_reads, method,
-                                       uneven_coverage_multiplier, n_jobs)
-    summary = pd.concat(summaries, ignore_index=True)
-
-    psi = summary.pivot(index=SAMPLE_ID, columns=EVENT_ID, values=PSI)
-    return psi, summary
+    return vectorized.calculate_psi(
+        event_annotation, reads2d, isoform1_junctions, isoform2_junctions,
+        min_reads=min_reads, method=method,
+        uneven_coverage_multiplier=uneven_coverage_multiplier, n_jobs=n_jobs,
+        notes=notes, temp_folder=temp_folder, chunk_size=chunk_size)
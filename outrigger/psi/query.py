@@ -0,0 +1,280 @@
+"""
+Calculate Psi of only some events and samples, straight from an index
+
+Instead of running ``outrigger psi`` on every event and sample, only the
+rows of the events and the junction reads that are needed are read, and Psi
+is calculated on that slice with the same rules.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from ..common import MIN_READS, UNEVEN_COVERAGE_MULTIPLIER, SAMPLE_ID, \
+    EVENT_ID, JUNCTION_ID, READS, ISOFORM_JUNCTIONS, SPLICE_ABBREVS
+from ..io import tables
+from . import vectorized
+from .reads import SparseReads, pivot_reads, reindex_columns
+from .slots import EventJunctions, JUNCTION_SLOTS_NPZ, MISSING
+
+
+EVENTS_CSV = 'events.csv'
+
+# Suffixes of the gene annotations of each isoform in the events' tables,
+# e.g. "isoform1_gene_name"
+GENE_SUFFIXES = '_gene_name', '_gene_id'
+
+
+def events_csv(index, splice_abbrev):
+    """Validated events of a splice type if there are any, or all events
+
+    Parameters
+    ----------
+    index : str
+        Folder with the output of ``outrigger index``
+    splice_abbrev : str
+        Splice type, e.g. "se"
+
+    Returns
+    -------
+    filename : str
+        The "validated/events.csv" of the splice type if it exists, and
+        otherwise its "events.csv"
+    """
+    folder = os.path.join(index, splice_abbrev)
+    validated = os.path.join(folder, 'validated', EVENTS_CSV)
+    if os.path.exists(validated):
+        return validated
+    return os.path.join(folder, EVENTS_CSV)
+
+
+def gene_events(filename, genes=None):
+    """Ids of the events annotated with each gene name or id
+
+    Genes can be either gene names or ids, as in the "isoform1_gene_name" or
+    "isoform2_gene_id" columns of the events' table, which is read a chunk
+    at a time.
+
+    Parameters
+    ----------
+    filename : str
+        Csv of events, e.g. from :py:func:`events_csv`
+    genes : list-like, optional
+        Only find the events of these genes. Default is all genes
+
+    Returns
+    -------
+    events : dict
+        Ids of the events of each gene, as a :py:class:`pandas.Index` in the
+        order of the table. Genes without any events are left out
+
+    Raises
+    ------
+    ValueError
+        If the events have no gene annotation
+    """
+    columns = [name for name in tables.read_header(filename)
+               if name.endswith(GENE_SUFFIXES)]
+    if not columns:
+        raise ValueError('The events in {} have no gene annotation, so they '
+                         'can\'t be selected by gene. Was the index made '
+                         'with a GTF file?'.format(filename))
+    if genes is not None:
+        genes = set(genes)
+
+    events = {}
+    chunks = pd.read_csv(filename, usecols=[EVENT_ID] + columns, dtype=str,
+                         chunksize=tables.CHUNKSIZE)
+    for chunk in chunks:
+        for column in columns:
+            for event_id, names in zip(chunk[EVENT_ID], chunk[column]):
+                if not isinstance(names, str):
+                    continue
+                for name in names.split(','):
+                    if genes is None or name in genes:
+                        events.setdefault(name, []).append(event_id)
+    return dict((gene, pd.Index(pd.unique(event_ids)))
+                for gene, event_ids in events.items())
+
+
+def read_event_junctions(index, splice_abbrev, filename, event_ids=None):
+    """Junctions of the selected events of one splice type
+
+    The junctions saved by ``outrigger index`` are used if possible, and
+    otherwise only the rows of the selected events are read from
+    ``filename``.
+
+    Parameters
+    ----------
+    index : str
+        Folder with the output of ``outrigger index``
+    splice_abbrev : str
+        Splice type, e.g. "se"
+    filename : str
+        Csv of the events, e.g. from :py:func:`events_csv`
+    event_ids : list-like, optional
+        Ids of the events to keep. Default is all the events of ``filename``
+
+    Returns
+    -------
+    event_junctions : outrigger.psi.slots.EventJunctions
+        Junctions of the events, in the order of ``filename``
+    """
+    npz = os.path.join(index, splice_abbrev, JUNCTION_SLOTS_NPZ)
+    if os.path.exists(npz):
+        event_junctions = EventJunctions.load(npz)
+        # Validated events are a subset of all the events
+        listed = pd.read_csv(filename, usecols=[0], index_col=0).index
+        if listed.isin(event_junctions.event_ids).all():
+            if event_ids is not None:
+                listed = listed.intersection(event_ids)
+            return event_junctions.subset(listed)
+
+    if event_ids is None:
+        event_annotation = pd.read_csv(filename, index_col=0)
+    else:
+        event_annotation = tables.read_rows(filename, {EVENT_ID: event_ids})
+        event_annotation = event_annotation.set_index(EVENT_ID)
+    return EventJunctions.from_annotation(event_annotation,
+                                          **ISOFORM_JUNCTIONS[splice_abbrev])
+
+
+def _junction_ids(event_junctions):
+    """Ids of the junctions which the events use"""
+    positions = np.concatenate([event_junctions.isoform1.ravel(),
+                                event_junctions.isoform2.ravel(),
+                                event_junctions.incompatible.ravel()])
+    positions = np.unique(positions[positions != MISSING])
+    return event_junctions.junctions[positions]
+
+
+def _read_reads2d(filename, junction_ids, samples=None,
+                  sample_id_col=SAMPLE_ID, junction_id_col=JUNCTION_ID,
+                  reads_col=READS, dtype=int):
+    """Samples x junctions matrix of only some rows of a junction reads csv
+
+    Every sample of the csv, or of ``samples`` if they're given, gets a row
+    and every junction of ``junction_ids`` gets a column, with zero reads if
+    there are no rows for them, just like in ``outrigger psi``.
+    """
+    filters = {junction_id_col: junction_ids}
+    if samples is not None:
+        filters[sample_id_col] = samples
+    junction_reads, (sample_ids,) = tables.read_rows(
+        filename, filters, usecols=[sample_id_col, junction_id_col,
+                                    reads_col],
+        dtype={reads_col: np.float32}, unique=[sample_id_col])
+    if samples is not None:
+        sample_ids = sample_ids[sample_ids.isin(samples)]
+    return pivot_reads(junction_reads, sample_id_col=sample_id_col,
+                       junction_id_col=junction_id_col, reads_col=reads_col,
+                       dtype=dtype, samples=sample_ids, junctions=junction_ids)
+
+
+def _subset_reads2d(reads2d, junction_ids, samples=None):
+    """Only some samples and junctions of a junction reads matrix
+
+    Junctions of ``junction_ids`` which aren't in ``reads2d`` get zero reads
+    """
+    index = reads2d.index
+    if samples is not None:
+        index = index[index.isin(samples)]
+    if isinstance(reads2d, SparseReads):
+        matrix = reads2d.matrix[reads2d.index.get_indexer(index)]
+        subset = SparseReads(matrix, index=index, columns=reads2d.columns)
+    else:
+        subset = reads2d.loc[index]
+    return reindex_columns(subset, junction_ids)
+
+
+def query(index, reads, events=None, samples=None, genes=None,
+          splice_types=SPLICE_ABBREVS, min_reads=MIN_READS, method='mean',
+          uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER,
+          notes='categorical', n_jobs=1, sample_id_col=SAMPLE_ID,
+          junction_id_col=JUNCTION_ID, reads_col=READS, dtypes='default'):
+    """Calculate percent spliced-in of only some events and samples
+
+    Only the events' rows of the index, and the junction reads of their
+    junctions in the selected samples, are read. Psi is calculated with
+    :py:func:`outrigger.psi.vectorized.calculate_psi`, so the results are
+    the same as for those events and samples in the output of
+    ``outrigger psi``.
+
+    Parameters
+    ----------
+    index : str
+        Folder with the output of ``outrigger index``, e.g.
+        "outrigger_output/index". Validated events are used if there are any
+    reads : str or pandas.DataFrame or outrigger.psi.reads.SparseReads
+        Either a csv of junction reads with one row per sample and junction,
+        such as "outrigger_output/junctions/reads.csv", or a (samples,
+        junctions) matrix of the reads
+    events : list-like, optional
+        Ids of the events to calculate. Default is all events, or all the
+        events of ``genes``
+    samples : list-like, optional
+        Ids of the samples to calculate. Default is all samples
+    genes : list-like, optional
+        Names or ids of genes, e.g. "Snap25", to calculate the events of
+    splice_types : list of str, optional
+        Splice types to calculate, e.g. ["se"] (default is all)
+    sample_id_col, junction_id_col, reads_col : str, optional
+        Columns of the ``reads`` csv with the sample ids, junction ids and
+        number of reads
+
+    See :py:func:`outrigger.psi.vectorized.calculate_psi` for the other
+    parameters.
+
+    Returns
+    -------
+    psi : pandas.DataFrame
+        An (samples, events) dataframe of the percent spliced-in values
+    summary : pandas.DataFrame
+        Junction reads, Psi and notes of each event in each sample, with the
+        splice type of the event in the "splice_type" column
+    """
+    if events is not None:
+        events = pd.Index(events)
+
+    event_junctions = []
+    for splice_abbrev in splice_types:
+        filename = events_csv(index, splice_abbrev)
+        if not os.path.exists(filename):
+            continue
+        event_ids = events
+        if genes is not None:
+            found = gene_events(filename, genes)
+            found = pd.Index([x for ids in found.values()
+                              for x in ids]).unique()
+            event_ids = found if event_ids is None \
+                else event_ids.intersection(found)
+        event_junctions.append((splice_abbrev, read_event_junctions(
+            index, splice_abbrev, filename, event_ids)))
+    if not event_junctions:
+        raise OSError("There are no events of the splice types {} in the "
+                      "index {}".format(', '.join(splice_types), index))
+
+    junction_ids = pd.Index(pd.unique(np.concatenate(
+        [_junction_ids(x) for __, x in event_junctions])))
+    if isinstance(reads, str):
+        reads2d = _read_reads2d(reads, junction_ids, samples,
+                                sample_id_col=sample_id_col,
+                                junction_id_col=junction_id_col,
+                                reads_col=reads_col,
+                                dtype=vectorized.READS_DTYPE
+                                if dtypes == 'compact' else int)
+    else:
+        reads2d = _subset_reads2d(reads, junction_ids, samples)
+
+    psis = []
+    summaries = []
+    for splice_abbrev, type_junctions in event_junctions:
+        psi, summary = vectorized.calculate_psi(
+            type_junctions, reads2d, min_reads=min_reads, method=method,
+            uneven_coverage_multiplier=uneven_coverage_multiplier,
+            n_jobs=n_jobs, notes=notes, dtypes=dtypes,
+            **ISOFORM_JUNCTIONS[splice_abbrev])
+        summary['splice_type'] = splice_abbrev
+        psis.append(psi)
+        summaries.append(summary)
+    return pd.concat(psis, axis=1), pd.concat(summaries, ignore_index=True)
@@ -0,0 +1,338 @@
+"""
+Sample x junction matrices of junction reads, for calculating Psi
+"""
+import contextlib
+import os
+import shutil
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from ..common import SAMPLE_ID, JUNCTION_ID, READS
+
+
+class SparseReads(object):
+    """Junction reads of many samples, stored as a sparse matrix
+
+    Single cell datasets have thousands of samples and hundreds of thousands
+    of junctions, but most samples have zero reads on most junctions. This
+    stores only the nonzero counts, compressed by junction (column) so that
+    getting all samples' reads for the junctions of a few events is cheap.
+
+    Has the same ``index`` (sample ids) and ``columns`` (junction ids) as the
+    dense (n_samples, n_junctions) pandas DataFrame, and can be used instead
+    of it in :py:func:`outrigger.psi.compute.calculate_psi`.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse.spmatrix or numpy.ndarray
+        A (n_samples, n_junctions) matrix of junction reads
+    index : list-like
+        Sample ids, the rows of ``matrix``
+    columns : list-like
+        Junction ids, the columns of ``matrix``
+    """
+
+    def __init__(self, matrix, index, columns):
+        self.matrix = sparse.csc_matrix(matrix)
+        self.index = pd.Index(index)
+        self.columns = pd.Index(columns)
+
+        if self.matrix.shape != (len(self.index), len(self.columns)):
+            raise ValueError(
+                'The matrix has shape {shape} but there are {n_samples} '
+                'samples and {n_junctions} junctions'.format(
+                    shape=self.matrix.shape, n_samples=len(self.index),
+                    n_junctions=len(self.columns)))
+
+    def __repr__(self):
+        return '<{name}: {n_samples} samples x {n_junctions} junctions, ' \
+               '{nnz} nonzero>'.format(name=self.__class__.__name__,
+                                       n_samples=self.shape[0],
+                                       n_junctions=self.shape[1],
+                                       nnz=self.matrix.nnz)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @classmethod
+    def from_tall(cls, junction_reads, sample_id_col=SAMPLE_ID,
+                  junction_id_col=JUNCTION_ID, reads_col=READS,
+                  dtype=int, samples=None):
+        """Build the sparse matrix directly from a tall table of reads
+
+        Unlike ``junction_reads.pivot(...)``, a dense matrix is never created.
+        Samples and junctions are sorted just like the pivot's output.
+
+        Parameters
+        ----------
+        junction_reads : pandas.DataFrame
+            A tall table with one row per sample and junction, such as the one
+            in ``junctions/reads.csv``
+        sample_id_col, junction_id_col, reads_col : str, optional
+            Columns of ``junction_reads`` containing the sample ids, junction
+            ids, and number of reads
+        dtype : numpy.dtype, optional
+            Data type of the stored read counts (default=int)
+        samples : list-like, optional
+            Sample ids of the rows, e.g. to also have samples without any
+            junction reads. Default is the sorted samples of
+            ``junction_reads``
+
+        Raises
+        ------
+        ValueError
+            If a sample has more than one row of the same junction
+        """
+        rows, samples, cols, junctions, reads = _codes(
+            junction_reads, sample_id_col, junction_id_col, reads_col,
+            dtype=dtype, samples=samples)
+        matrix = sparse.coo_matrix((reads, (rows, cols)),
+                                   shape=(len(samples), len(junctions)))
+        return cls(matrix.tocsc(), index=samples, columns=junctions)
+
+    def take(self, positions):
+        """Dense (n_samples, n_positions) reads of junctions at positions"""
+        return self.matrix[:, positions].toarray()
+
+    def reindex(self, columns):
+        """Same reads with these junctions, zero for new junctions
+
+        Parameters
+        ----------
+        columns : list-like
+            Junction ids of the new matrix
+
+        Returns
+        -------
+        reindexed : SparseReads
+            (n_samples, len(columns)) reads
+        """
+        columns = pd.Index(columns)
+        positions = self.columns.get_indexer(columns)
+        present = np.flatnonzero(positions >= 0)
+        # Matrix which moves each old column to its new position
+        mover = sparse.csc_matrix(
+            (np.ones(len(present), dtype=self.matrix.dtype),
+             (positions[present], present)),
+            shape=(len(self.columns), len(columns)))
+        return self.__class__(self.matrix.dot(mover), index=self.index,
+                              columns=columns)
+
+    def to_frame(self):
+        """Dense (n_samples, n_junctions) pandas DataFrame of the reads"""
+        return pd.DataFrame(self.matrix.toarray(), index=self.index,
+                            columns=self.columns)
+
+
+def _codes(junction_reads, sample_id_col=SAMPLE_ID,
+           junction_id_col=JUNCTION_ID, reads_col=READS, dtype=int,
+           samples=None, junctions=None):
+    """Integer row and column of every row of a tall table of reads
+
+    Samples and junctions are sorted, unless they're given. Rows of samples
+    or junctions which aren't given are dropped.
+
+    Raises
+    ------
+    ValueError
+        If a sample has more than one row of the same junction, just like
+        ``junction_reads.pivot(...)``
+
+    Returns
+    -------
+    rows : numpy.ndarray
+        Position of each row's sample in ``samples``
+    samples : pandas.Index
+        Sample ids
+    cols : numpy.ndarray
+        Position of each row's junction in ``junctions``
+    junctions : pandas.Index
+        Junction ids
+    reads : numpy.ndarray
+        Reads of each row, zero if missing
+    """
+    if samples is None:
+        rows, samples = pd.factorize(junction_reads[sample_id_col],
+                                     sort=True)
+    else:
+        samples = pd.Index(samples)
+        rows = samples.get_indexer(junction_reads[sample_id_col])
+    if junctions is None:
+        cols, junctions = pd.factorize(junction_reads[junction_id_col],
+                                       sort=True)
+    else:
+        junctions = pd.Index(junctions)
+        cols = junctions.get_indexer(junction_reads[junction_id_col])
+    reads = junction_reads[reads_col].fillna(0).values.astype(dtype)
+
+    present = (rows >= 0) & (cols >= 0)
+    if not present.all():
+        rows, cols, reads = rows[present], cols[present], reads[present]
+
+    pairs = rows.astype(np.int64) * len(junctions) + cols
+    if len(np.unique(pairs)) < len(pairs):
+        raise ValueError('Some samples have more than one row of junction '
+                         'reads for the same junction in "{}". Each sample '
+                         'and junction must have only one '
+                         'row'.format(junction_id_col))
+    return rows, pd.Index(samples), cols, pd.Index(junctions), reads
+
+
+def pivot_reads(junction_reads, sample_id_col=SAMPLE_ID,
+                junction_id_col=JUNCTION_ID, reads_col=READS, dtype=int,
+                samples=None, junctions=None):
+    """Dense samples x junctions table of reads from a tall table of reads
+
+    Same as ``junction_reads.pivot(...).fillna(0).astype(dtype)``, but the
+    samples and junctions are factorized into integer codes and the reads
+    are written straight into one preallocated array, without pandas'
+    intermediate copies and floats.
+
+    Parameters
+    ----------
+    junction_reads : pandas.DataFrame
+        A tall table with one row per sample and junction, such as the one in
+        ``junctions/reads.csv``
+    sample_id_col, junction_id_col, reads_col : str, optional
+        Columns of ``junction_reads`` containing the sample ids, junction
+        ids, and number of reads
+    dtype : numpy.dtype, optional
+        Data type of the read counts (default=int)
+    samples : list-like, optional
+        Sample ids of the rows, e.g. to also have samples without any
+        junction reads. Default is the sorted samples of ``junction_reads``
+    junctions : list-like, optional
+        Junction ids of the columns. Junctions which aren't in
+        ``junction_reads`` get zero reads, and reads of other junctions are
+        dropped. Default is the sorted junctions of ``junction_reads``
+
+    Returns
+    -------
+    reads2d : pandas.DataFrame
+        A (n_samples, n_junctions) table of junction reads
+
+    Raises
+    ------
+    ValueError
+        If a sample has more than one row of the same junction
+    """
+    rows, samples, cols, junctions, reads = _codes(
+        junction_reads, sample_id_col, junction_id_col, reads_col,
+        dtype=dtype, samples=samples, junctions=junctions)
+    matrix = np.zeros((len(samples), len(junctions)), dtype=dtype)
+    matrix[rows, cols] = reads
+    return pd.DataFrame(matrix, index=samples.rename(sample_id_col),
+                        columns=junctions.rename(junction_id_col))
+
+
+def reindex_columns(reads2d, columns):
+    """Junction reads of these junctions, with zero reads for new junctions
+
+    Parameters
+    ----------
+    reads2d : pandas.DataFrame or SparseReads
+        A (n_samples, n_junctions) matrix of junction reads
+    columns : list-like
+        Junction ids of the new matrix
+
+    Returns
+    -------
+    reindexed : pandas.DataFrame or SparseReads
+        A (n_samples, len(columns)) matrix of junction reads
+    """
+    if isinstance(reads2d, SparseReads):
+        return reads2d.reindex(columns)
+    return reads2d.reindex(columns=columns, fill_value=0)
+
+
+def take_columns(reads2d, positions):
+    """Dense reads of all samples for junctions at the given positions
+
+    Parameters
+    ----------
+    reads2d : pandas.DataFrame or numpy.ndarray or SparseReads
+        A (n_samples, n_junctions) matrix of junction reads
+    positions : numpy.ndarray
+        Integer column positions of junctions. Negative positions are
+        junctions which are not in the data and get zero reads
+
+    Returns
+    -------
+    reads : numpy.ndarray
+        A (n_samples,) + positions.shape array of reads
+    """
+    positions = np.asarray(positions)
+    flat = positions.ravel()
+    present = flat >= 0
+
+    # Only get each junction once, no matter how many events use it
+    columns, inverse = np.unique(flat[present], return_inverse=True)
+    if isinstance(reads2d, SparseReads):
+        subset = reads2d.take(columns)
+    else:
+        subset = np.asarray(reads2d)[:, columns]
+
+    n_samples = subset.shape[0]
+    reads = np.zeros((n_samples, flat.size), dtype=subset.dtype)
+    reads[:, present] = subset[:, inverse]
+    return reads.reshape((n_samples,) + positions.shape)
+
+
+def column_max(reads2d):
+    """Most reads of each junction in any one sample
+
+    Parameters
+    ----------
+    reads2d : pandas.DataFrame or numpy.ndarray or SparseReads
+        A (n_samples, n_junctions) matrix of junction reads
+
+    Returns
+    -------
+    maximum : numpy.ndarray
+        A (n_junctions,) array of the maximum reads of each junction, zero
+        if there are no samples
+    """
+    if reads2d.shape[0] == 0:
+        return np.zeros(reads2d.shape[1])
+    if isinstance(reads2d, SparseReads):
+        return reads2d.matrix.max(axis=0).toarray().ravel()
+    return np.asarray(reads2d).max(axis=0)
+
+
+@contextlib.contextmanager
+def memmap_reads(reads, temp_folder=None):
+    """Read-only memory-mapped copy of junction reads, for parallel workers
+
+    The reads are written to a file once, and loaded back as memory-mapped
+    arrays. When these are passed to ``joblib.Parallel`` workers, only the
+    filename is sent, and every worker attaches to the same pages of memory
+    instead of unpickling its own copy of the reads. The file is deleted when
+    the context exits.
+
+    Parameters
+    ----------
+    reads : numpy.ndarray or SparseReads
+        A (n_samples, n_junctions) matrix of junction reads
+    temp_folder : str, optional
+        Folder in which to create the memory-mapped file. Default is the
+        system's temporary folder, or ``$JOBLIB_TEMP_FOLDER`` if set
+
+    Yields
+    ------
+    memmapped : numpy.memmap or SparseReads
+        Same reads as ``reads``, backed by the memory-mapped file
+    """
+    if temp_folder is None:
+        temp_folder = os.environ.get('JOBLIB_TEMP_FOLDER')
+    folder = tempfile.mkdtemp(prefix='outrigger_reads_', dir=temp_folder)
+    try:
+        filename = os.path.join(folder, 'reads.pkl')
+        joblib.dump(reads, filename)
+        yield joblib.load(filename, mmap_mode='r')
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
@@ -0,0 +1,329 @@
+"""
+Answer Psi requests from an index and junction reads kept in memory
+
+Every ``outrigger psi`` run reads the index and the junction reads, and
+builds the samples x junctions matrix, before calculating anything. A
+:py:class:`PsiStore` does this once, and also keeps the column positions of
+every event's junctions in the matrix, so a request only slices the cached
+arrays and calls :py:func:`outrigger.psi.vectorized.calculate_psi_arrays`.
+:py:func:`serve` answers requests over HTTP on a local port.
+"""
+import io
+import json
+import os
+from wsgiref.simple_server import make_server
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+from ..common import MIN_READS, UNEVEN_COVERAGE_MULTIPLIER, SAMPLE_ID, \
+    EVENT_ID, JUNCTION_ID, READS, SPLICE_ABBREVS
+from ..io import tables
+from ..util import progress, done
+from . import vectorized
+from .query import events_csv, gene_events, read_event_junctions
+from .reads import SparseReads, pivot_reads, reindex_columns
+
+
+HOST = '127.0.0.1'
+PORT = 8080
+
+
+class PsiStore(object):
+    """Index and junction reads in memory, to calculate Psi on request
+
+    The ``n_jobs`` workers of each request are threads, which share the
+    cached junction reads instead of writing a memory-mapped copy of them
+    on every request.
+
+    Parameters
+    ----------
+    index : str
+        Folder with the output of ``outrigger index``. Validated events are
+        used if there are any
+    reads_csv : str
+        Csv of junction reads with one row per sample and junction, such as
+        "outrigger_output/junctions/reads.csv". Only the reads of the index's
+        junctions are kept
+    splice_types : list of str, optional
+        Splice types to load, e.g. ["se"] (default is all)
+    sparse : bool, optional
+        If True, keep the reads as a
+        :py:class:`outrigger.psi.reads.SparseReads`
+    sample_id_col, junction_id_col, reads_col : str, optional
+        Columns of ``reads_csv`` with the sample ids, junction ids and number
+        of reads
+
+    See :py:func:`outrigger.psi.vectorized.calculate_psi` for the other
+    parameters.
+    """
+
+    def __init__(self, index, reads_csv, splice_types=SPLICE_ABBREVS,
+                 min_reads=MIN_READS, method='mean',
+                 uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER,
+                 n_jobs=1, sparse=False, sample_id_col=SAMPLE_ID,
+                 junction_id_col=JUNCTION_ID, reads_col=READS):
+        self.min_reads = min_reads
+        self.method = method
+        self.uneven_coverage_multiplier = uneven_coverage_multiplier
+        self.n_jobs = n_jobs
+        self.sparse = sparse
+        self.sample_id_col = sample_id_col
+        self.junction_id_col = junction_id_col
+        self.reads_col = reads_col
+
+        self.event_junctions = {}
+        self.genes = {}
+        for splice_abbrev in splice_types:
+            filename = events_csv(index, splice_abbrev)
+            if not os.path.exists(filename):
+                continue
+            progress('Loading {} events from {} ...'.format(splice_abbrev,
+                                                            filename))
+            self.event_junctions[splice_abbrev] = read_event_junctions(
+                index, splice_abbrev, filename)
+            try:
+                self.genes[splice_abbrev] = gene_events(filename)
+            except ValueError:
+                # Without gene annotation, events can't be found by gene
+                self.genes[splice_abbrev] = None
+            done()
+        if not self.event_junctions:
+            raise OSError("There are no events of the splice types {} in the "
+                          "index {}".format(', '.join(splice_types), index))
+        self.index_junctions = pd.Index(pd.unique(np.concatenate(
+            [x.junctions for x in self.event_junctions.values()])))
+
+        progress('Loading junction reads of the index\'s junctions from {} '
+                 '...'.format(reads_csv))
+        junction_reads, (samples,) = tables.read_rows(
+            reads_csv, {junction_id_col: self.index_junctions},
+            unique=[sample_id_col])
+        # Every junction of the index gets a column, so events without any
+        # reads are calculated, as in a query
+        self.reads2d = reindex_columns(
+            self._reads2d(junction_reads, samples), self.index_junctions)
+        done()
+        self._resolve()
+
+    def _reads2d(self, junction_reads, samples):
+        """Samples x junctions matrix of a tall table of reads"""
+        if self.sparse:
+            return SparseReads.from_tall(
+                junction_reads, sample_id_col=self.sample_id_col,
+                junction_id_col=self.junction_id_col,
+                reads_col=self.reads_col, samples=samples)
+        return pivot_reads(junction_reads, sample_id_col=self.sample_id_col,
+                           junction_id_col=self.junction_id_col,
+                           reads_col=self.reads_col, samples=samples)
+
+    def _resolve(self):
+        """Cache the column positions of every event's junctions"""
+        self.slots = dict(
+            (splice_abbrev, type_junctions.resolve(self.reads2d.columns))
+            for splice_abbrev, type_junctions
+            in self.event_junctions.items())
+
+    @property
+    def samples(self):
+        return self.reads2d.index
+
+    def add_samples(self, junction_reads):
+        """Add the junction reads of new samples
+
+        Parameters
+        ----------
+        junction_reads : pandas.DataFrame
+            A tall table with one row per sample and junction, with the same
+            columns as the reads csv
+
+        Returns
+        -------
+        samples : pandas.Index
+            Ids of the added samples
+        """
+        samples = pd.Index(pd.unique(junction_reads[self.sample_id_col]))
+        existing = samples.intersection(self.samples)
+        if len(existing) > 0:
+            raise ValueError('There are already junction reads of these '
+                             'samples: {}'.format(', '.join(map(str,
+                                                                existing))))
+        in_index = junction_reads[self.junction_id_col].isin(
+            self.index_junctions)
+        new = pivot_reads(junction_reads.loc[in_index],
+                          sample_id_col=self.sample_id_col,
+                          junction_id_col=self.junction_id_col,
+                          reads_col=self.reads_col, samples=samples)
+
+        columns = self.reads2d.columns.union(new.columns)
+        resolve = not columns.equals(self.reads2d.columns)
+        old = reindex_columns(self.reads2d, columns)
+        new = new.reindex(columns=columns, fill_value=0)
+        if isinstance(old, SparseReads):
+            self.reads2d = SparseReads(
+                sparse.vstack([old.matrix, sparse.csc_matrix(new.values)]),
+                index=old.index.append(new.index), columns=columns)
+        else:
+            self.reads2d = pd.concat([old, new])
+        if resolve:
+            self._resolve()
+        return samples
+
+    def _events(self, splice_abbrev, events=None, genes=None):
+        """Positions of the requested events in the cached slots"""
+        event_ids = self.slots[splice_abbrev][0]
+        keep = np.ones(len(event_ids), dtype=bool)
+        if events is not None:
+            keep &= event_ids.isin(events)
+        if genes is not None:
+            type_genes = self.genes[splice_abbrev]
+            if type_genes is None:
+                raise ValueError('The {} events have no gene annotation, so '
+                                 'they can\'t be selected by '
+                                 'gene'.format(splice_abbrev))
+            found = set().union(*[type_genes.get(gene, ())
+                                  for gene in genes])
+            keep &= event_ids.isin(found)
+        return np.flatnonzero(keep)
+
+    def psi(self, events=None, samples=None, genes=None, splice_types=None):
+        """Percent spliced-in and case codes of some events and samples
+
+        Parameters
+        ----------
+        events : list-like, optional
+            Ids of the events to calculate. Default is all events, or all the
+            events of ``genes``
+        samples : list-like, optional
+            Ids of the samples to calculate. Default is all samples
+        genes : list-like, optional
+            Names or ids of genes, e.g. "Snap25", to calculate the events of
+        splice_types : list of str, optional
+            Splice types to calculate, e.g. ["se"] (default is all loaded)
+
+        Returns
+        -------
+        psi : pandas.DataFrame
+            An (samples, events) dataframe of the percent spliced-in values
+        cases : pandas.DataFrame
+            An (samples, events) dataframe of the integer case codes, see
+            :py:func:`outrigger.psi.vectorized.case_table`
+        """
+        if splice_types is None:
+            splice_types = sorted(self.event_junctions)
+        unknown = set(splice_types).difference(self.event_junctions)
+        if unknown:
+            raise ValueError('No events of the splice types {} were '
+                             'loaded'.format(', '.join(sorted(unknown))))
+
+        reads = vectorized.reads_matrix(self.reads2d)
+        sample_ids = self.samples
+        if samples is not None:
+            rows = np.flatnonzero(self.samples.isin(samples))
+            sample_ids = self.samples[rows]
+            if isinstance(reads, SparseReads):
+                reads = SparseReads(reads.matrix[rows], index=sample_ids,
+                                    columns=reads.columns)
+            else:
+                reads = reads[rows]
+
+        psis = []
+        cases = []
+        for splice_abbrev in splice_types:
+            event_ids, isoform1, isoform2, incompatible = \
+                self.slots[splice_abbrev]
+            positions = self._events(splice_abbrev, events, genes)
+            psi, case = vectorized.calculate_psi_arrays(
+                reads, isoform1[positions], isoform2[positions],
+                incompatible[positions], min_reads=self.min_reads,
+                method=self.method,
+                uneven_coverage_multiplier=self.uneven_coverage_multiplier,
+                n_jobs=self.n_jobs, backend='threads')
+            columns = pd.Index(event_ids[positions], name=EVENT_ID)
+            index = pd.Index(sample_ids, name=SAMPLE_ID)
+            psis.append(pd.DataFrame(psi, index=index, columns=columns))
+            cases.append(pd.DataFrame(case, index=index, columns=columns))
+        return pd.concat(psis, axis=1), pd.concat(cases, axis=1)
+
+
+def _ids(query, name):
+    """Comma-separated ids of a query string parameter, or None"""
+    if name not in query:
+        return None
+    return [x for value in query[name] for x in value.split(',') if x]
+
+
+def _json(psi, cases):
+    """Psi and case codes as lists, with null for NaN"""
+    values = np.where(np.isnan(psi.values), None, psi.values)
+    return {'samples': psi.index.tolist(), 'events': psi.columns.tolist(),
+            'psi': values.tolist(), 'cases': cases.values.tolist()}
+
+
+def application(store):
+    """WSGI application answering Psi requests from a :py:class:`PsiStore`
+
+    Requests
+    --------
+    GET /psi?events=...&samples=...&genes=...&splice_types=...
+        Psi and case codes of the events and samples, each a comma-separated
+        list of ids. Returns JSON with "samples", "events", and (samples,
+        events) lists of "psi" and "cases"
+    GET /samples
+        JSON list of the sample ids
+    POST /samples
+        Add the junction reads of new samples, sent as a csv with the same
+        columns as the reads csv. Returns JSON list of the added sample ids
+    """
+    def app(environ, start_response):
+        def respond(status, body):
+            data = json.dumps(body).encode('utf-8')
+            start_response(status, [('Content-Type', 'application/json'),
+                                    ('Content-Length', str(len(data)))])
+            return [data]
+
+        path = environ.get('PATH_INFO', '')
+        method = environ.get('REQUEST_METHOD', 'GET')
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        try:
+            if path == '/psi' and method == 'GET':
+                psi, cases = store.psi(
+                    events=_ids(query, 'events'),
+                    samples=_ids(query, 'samples'),
+                    genes=_ids(query, 'genes'),
+                    splice_types=_ids(query, 'splice_types'))
+                return respond('200 OK', _json(psi, cases))
+            elif path == '/samples' and method == 'GET':
+                return respond('200 OK', store.samples.tolist())
+            elif path == '/samples' and method == 'POST':
+                length = int(environ.get('CONTENT_LENGTH') or 0)
+                body = environ['wsgi.input'].read(length)
+                junction_reads = pd.read_csv(io.BytesIO(body))
+                samples = store.add_samples(junction_reads)
+                return respond('200 OK', samples.tolist())
+        except (ValueError, KeyError) as e:
+            return respond('400 Bad Request', {'error': str(e)})
+        return respond('404 Not Found',
+                       {'error': 'No such request: {} {}'.format(method,
+                                                                 path)})
+    return app
+
+
+def serve(store, host=HOST, port=PORT):
+    """Answer Psi requests on ``host``:``port`` until interrupted
+
+    Requests are answered one at a time, see :py:func:`application`
+    """
+    server = make_server(host, port, application(store))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,177 @@
+"""
+Split the samples of a Psi calculation into shards, and merge their outputs
+
+A shard is a contiguous range of the sorted sample ids, so running
+``outrigger psi --shard i/N`` for every ``i`` on separate machines calculates
+each sample exactly once. Every shard calculates all the events of the index,
+so the outputs of the shards have the same events, and
+:py:func:`merge_psi` puts them back together one chunk of rows at a time.
+"""
+import os
+import shutil
+
+import pandas as pd
+
+from ..common import SPLICE_ABBREVS, EVENT_ID, CASE, COUNT
+from ..io import tables
+from .slots import JUNCTION_SLOTS_NPZ
+
+
+PSI_CSV = 'psi.csv'
+SAMPLES_CSV = 'samples.csv'
+SUMMARY_CSV = 'summary.csv'
+OUTRIGGER_PSI_CSV = 'outrigger_psi.csv'
+OUTRIGGER_SUMMARY_CSV = 'outrigger_summary.csv'
+
+# Files which are the same in every shard, so they're copied from the first
+SHARED_FILES = 'cases.csv',
+SHARED_TYPE_FILES = JUNCTION_SLOTS_NPZ,
+
+
+def parse_shard(shard):
+    """Shard number and number of shards of "i/N", numbering from 1
+
+    Parameters
+    ----------
+    shard : str
+        Which shard to calculate, e.g. "2/8" for the second of eight
+
+    Returns
+    -------
+    i, n : int
+        Number of the shard, and the number of shards
+
+    Raises
+    ------
+    ValueError
+        If ``shard`` isn't "i/N" with 1 <= i <= N
+    """
+    try:
+        i, n = (int(x) for x in shard.split('/'))
+    except ValueError:
+        raise ValueError('The shard must look like "i/N", e.g. "1/4", not '
+                         '"{}"'.format(shard))
+    if not 1 <= i <= n:
+        raise ValueError('The shard number must be between 1 and the number '
+                         'of shards, not "{}"'.format(shard))
+    return i, n
+
+
+def shard_items(items, i, n, key=None):
+    """Items of the i-th of n contiguous shards of the sorted items
+
+    The shards differ in size by at most one item, and every item is in
+    exactly one shard.
+
+    Parameters
+    ----------
+    items : list-like
+        Items to split, e.g. sample ids
+    i, n : int
+        Number of the shard, from 1 to ``n``, and the number of shards
+    key : function, optional
+        Sort the items by ``key(item)`` instead of the items themselves, e.g.
+        the sample id of a file
+
+    Returns
+    -------
+    shard : list
+        The sorted items of the shard
+    """
+    items = sorted(items, key=key)
+    start = (i - 1) * len(items) // n
+    stop = i * len(items) // n
+    return items[start:stop]
+
+
+def _add_counts(summary_csv):
+    """Add up the case counts of the same event from several shards"""
+    counts = pd.read_csv(summary_csv)
+    counts = counts.groupby([EVENT_ID, CASE], sort=False)[COUNT].sum()
+    counts.reset_index().to_csv(summary_csv, index=False)
+
+
+def merge_psi(folders, folder, splice_abbrevs=SPLICE_ABBREVS):
+    """Merge the "psi" output folders of shards into one
+
+    The samples of the shards are put together in the order of ``folders``.
+    Only a chunk of rows of each file is in memory at a time, except for
+    summaries of case counts, which are added up by event.
+
+    Parameters
+    ----------
+    folders : list of str
+        "psi" folders of ``outrigger psi --shard`` of each shard, in order
+    folder : str
+        "psi" folder to write the merged output to
+    splice_abbrevs : list of str, optional
+        Splice types to merge, if the shards have them (default is all)
+
+    Returns
+    -------
+    merged : list of str
+        Splice types which were merged
+
+    Raises
+    ------
+    OSError
+        If some shards have Psi of a splice type and others don't
+    """
+    merged = []
+    summary_csvs = []
+    summary_abbrevs = []
+    for splice_abbrev in splice_abbrevs:
+        type_folders = [os.path.join(x, splice_abbrev) for x in folders]
+        exists = [os.path.exists(os.path.join(x, PSI_CSV))
+                  for x in type_folders]
+        if not any(exists):
+            continue
+        if not all(exists):
+            missing = [x for x, e in zip(type_folders, exists) if not e]
+            raise OSError('There is no {psi} in {missing}, but there is in '
+                          'the other shards. Were all shards calculated with '
+                          'the same index and --psi-format '
+                          'wide?'.format(psi=PSI_CSV,
+                                         missing=', '.join(missing)))
+        type_folder = os.path.join(folder, splice_abbrev)
+        if not os.path.exists(type_folder):
+            os.makedirs(type_folder)
+
+        # Samples x events, so the rows of the shards are stacked
+        for filename in (PSI_CSV, SAMPLES_CSV):
+            filenames = [os.path.join(x, filename) for x in type_folders]
+            if os.path.exists(filenames[0]):
+                tables.concatenate_csvs(filenames,
+                                        os.path.join(type_folder, filename),
+                                        index=False)
+
+        summaries = [os.path.join(x, SUMMARY_CSV) for x in type_folders]
+        if os.path.exists(summaries[0]):
+            summary_csv = os.path.join(type_folder, SUMMARY_CSV)
+            tables.concatenate_csvs(summaries, summary_csv, index=False)
+            if COUNT in tables.read_header(summary_csv):
+                _add_counts(summary_csv)
+            summary_csvs.append(summary_csv)
+            summary_abbrevs.append(splice_abbrev)
+
+        for filename in SHARED_TYPE_FILES:
+            if os.path.exists(os.path.join(type_folders[0], filename)):
+                shutil.copyfile(os.path.join(type_folders[0], filename),
+                                os.path.join(type_folder, filename))
+        merged.append(splice_abbrev)
+
+    # Events x samples, so the columns of the shards are put side by side
+    psi_csvs = [os.path.join(x, OUTRIGGER_PSI_CSV) for x in folders]
+    if all(os.path.exists(x) for x in psi_csvs):
+        tables.paste_csvs(psi_csvs, os.path.join(folder, OUTRIGGER_PSI_CSV))
+
+    if summary_csvs:
+        tables.concatenate_csvs(
+            summary_csvs, os.path.join(folder, OUTRIGGER_SUMMARY_CSV),
+            column='splice_type', values=summary_abbrevs)
+
+    for filename in SHARED_FILES:
+        if os.path.exists(os.path.join(folders[0], filename)):
+            shutil.copyfile(os.path.join(folders[0], filename),
+                            os.path.join(folder, filename))
+    return merged
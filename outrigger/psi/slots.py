@@ -0,0 +1,219 @@
+"""
+Integer junction slots of splicing events, against a junction vocabulary
+
+``outrigger index`` saves the junctions of every event as integer positions
+into a vocabulary of junction ids. ``outrigger psi`` then resolves the
+vocabulary against the columns of the junction reads matrix once, and every
+event's reads are found by integer indexing only.
+"""
+import numpy as np
+import pandas as pd
+
+from ..common import INCOMPATIBLE_JUNCTIONS
+
+
+# Position of junctions which aren't in the vocabulary or reads matrix, or
+# which pad events with fewer incompatible junctions
+MISSING = -1
+
+# Name of the file with the junction slots, in each splice type's folder of
+# the index
+JUNCTION_SLOTS_NPZ = 'junction_slots.npz'
+
+
+def _positions(junctions, junction_ids):
+    """Column positions of a table of junction ids, MISSING if not present"""
+    positions = junction_ids.get_indexer(junctions.values.ravel())
+    return positions.reshape(junctions.shape)
+
+
+class EventJunctions(object):
+    """Junctions of splicing events, as positions in a junction vocabulary
+
+    Parameters
+    ----------
+    event_ids : list-like
+        Unique ids of the events
+    junctions : list-like
+        Unique junction ids, the vocabulary
+    isoform1, isoform2 : numpy.ndarray
+        (n_events, n_junctions) integer positions of the isoform1 and
+        isoform2 junctions of each event in ``junctions``
+    incompatible : numpy.ndarray
+        (n_events, n_incompatible) integer positions of the incompatible
+        junctions of each event in ``junctions``, padded with ``MISSING``
+    """
+
+    def __init__(self, event_ids, junctions, isoform1, isoform2,
+                 incompatible):
+        self.event_ids = pd.Index(event_ids)
+        self.junctions = pd.Index(junctions)
+        self.isoform1 = np.asarray(isoform1)
+        self.isoform2 = np.asarray(isoform2)
+        self.incompatible = np.asarray(incompatible)
+
+        n_events = len(self.event_ids)
+        for name in ('isoform1', 'isoform2', 'incompatible'):
+            slots = getattr(self, name)
+            if slots.ndim != 2 or slots.shape[0] != n_events:
+                raise ValueError(
+                    '{name} must have one row per event ({n_events}), but '
+                    'has shape {shape}'.format(name=name, n_events=n_events,
+                                               shape=slots.shape))
+
+    def __repr__(self):
+        return '<{name}: {n_events} events, {n_junctions} ' \
+               'junctions>'.format(name=self.__class__.__name__,
+                                   n_events=len(self.event_ids),
+                                   n_junctions=len(self.junctions))
+
+    def __len__(self):
+        return len(self.event_ids)
+
+    @classmethod
+    def from_annotation(cls, event_annotation, isoform1_junctions,
+                        isoform2_junctions):
+        """Find the junctions of each event in a table of events
+
+        There are multiple rows with the same event id because the flanking
+        exons may be wider or shorter, but Psi only depends on the junctions
+        so only the first row of each event is used. Events are sorted by id.
+
+        Parameters
+        ----------
+        event_annotation : pandas.DataFrame
+            A table of all possible events, with event ids as the index (row
+            names) and the columns described by ``isoform1_junctions`` and
+            ``isoform_junctions``, and optionally "incompatible_junctions"
+        isoform1_junctions : list of str
+            Junction numbers corresponding to isoform 1, e.g. ['junction13']
+        isoform2_junctions : list of str
+            Junction numbers corresponding to isoform 2, e.g. ['junction12',
+            'junction23']
+        """
+        first = event_annotation.loc[
+            ~event_annotation.index.duplicated(keep='first')]
+        first = first.sort_index(kind='mergesort')
+
+        if INCOMPATIBLE_JUNCTIONS in first:
+            incompatible = first[INCOMPATIBLE_JUNCTIONS]
+            incompatible = incompatible.where(incompatible.notnull(), '')
+            incompatible = incompatible.astype(str).str.split('|',
+                                                              expand=True)
+            incompatible = incompatible.where(incompatible != '')
+        else:
+            incompatible = pd.DataFrame(index=first.index)
+
+        legal = first[list(isoform1_junctions) + list(isoform2_junctions)]
+        junctions = pd.Index(pd.unique(np.concatenate(
+            [legal.values.ravel(), incompatible.values.ravel()])))
+        junctions = junctions[junctions.notnull()].sort_values()
+
+        return cls(first.index, junctions,
+                   _positions(first[isoform1_junctions], junctions),
+                   _positions(first[isoform2_junctions], junctions),
+                   _positions(incompatible, junctions))
+
+    def subset(self, event_ids):
+        """Junctions of only the given events, which are kept sorted"""
+        keep = self.event_ids.isin(event_ids)
+        return self.__class__(self.event_ids[keep], self.junctions,
+                              self.isoform1[keep], self.isoform2[keep],
+                              self.incompatible[keep])
+
+    def present(self, junction_ids):
+        """Only the junctions which are in ``junction_ids``
+
+        Events without all their isoform1 and isoform2 junctions are dropped,
+        and incompatible junctions which aren't present are padded with
+        ``MISSING``. These are all the junctions Psi depends on.
+
+        Parameters
+        ----------
+        junction_ids : list-like
+            Junction ids, e.g. the columns of the reads matrix
+
+        Returns
+        -------
+        present : EventJunctions
+            Events and junctions which are in ``junction_ids``
+        """
+        keep = self.junctions.isin(junction_ids)
+        # New position of each junction in the smaller vocabulary
+        positions = np.where(keep, np.cumsum(keep) - 1, MISSING)
+        positions = np.append(positions, MISSING)
+
+        isoform1 = positions[self.isoform1]
+        isoform2 = positions[self.isoform2]
+        in_data = ((isoform1 != MISSING).all(axis=1)
+                   & (isoform2 != MISSING).all(axis=1))
+        return self.__class__(self.event_ids[in_data], self.junctions[keep],
+                              isoform1[in_data], isoform2[in_data],
+                              positions[self.incompatible[in_data]])
+
+    def resolve(self, junction_ids):
+        """Find the column positions of each event's junctions in reads
+
+        Parameters
+        ----------
+        junction_ids : pandas.Index
+            Junction ids of the columns of the reads matrix
+
+        Returns
+        -------
+        event_ids : pandas.Index
+            Sorted ids of the events whose isoform1 and isoform2 junctions are
+            all present in ``junction_ids``. Events missing any junction are
+            dropped.
+        isoform1, isoform2 : numpy.ndarray
+            (n_events, n_junctions) integer column positions of the isoform1
+            and isoform2 junctions of each event
+        incompatible : numpy.ndarray
+            (n_events, n_incompatible) integer column positions of the
+            incompatible junctions of each event which are present in
+            ``junction_ids``, in the same order as ``junction_ids``. Events
+            with fewer incompatible junctions are padded with ``MISSING``
+        """
+        # Only look up each junction id once, then it's all integers
+        columns = pd.Index(junction_ids).get_indexer(self.junctions)
+        columns = np.append(columns, MISSING)
+
+        isoform1 = columns[self.isoform1]
+        isoform2 = columns[self.isoform2]
+        in_data = ((isoform1 != MISSING).all(axis=1)
+                   & (isoform2 != MISSING).all(axis=1))
+        isoform1 = isoform1[in_data]
+        isoform2 = isoform2[in_data]
+        # MISSING indexes the appended MISSING at the end of columns
+        incompatible = columns[self.incompatible[in_data]]
+
+        # Order the junctions like the reads matrix, drop duplicates, and push
+        # the missing ones to the end
+        incompatible = np.sort(incompatible, axis=1)
+        duplicated = np.zeros(incompatible.shape, dtype=bool)
+        duplicated[:, 1:] = incompatible[:, 1:] == incompatible[:, :-1]
+        incompatible[duplicated] = MISSING
+        order = np.argsort(incompatible == MISSING, axis=1, kind='mergesort')
+        incompatible = np.take_along_axis(incompatible, order, axis=1)
+        n_incompatible = (incompatible != MISSING).sum(axis=1)
+        incompatible = incompatible[:, :n_incompatible.max(initial=0)]
+
+        return self.event_ids[in_data], isoform1, isoform2, incompatible
+
+    def save(self, filename):
+        """Write to a compressed NumPy ``.npz`` file"""
+        np.savez_compressed(
+            filename, event_ids=np.array(self.event_ids, dtype=str),
+            junctions=np.array(self.junctions, dtype=str),
+            isoform1=self.isoform1.astype(np.int32),
+            isoform2=self.isoform2.astype(np.int32),
+            incompatible=self.incompatible.astype(np.int32))
+
+    @classmethod
+    def load(cls, filename):
+        """Read from a file written by :py:meth:`save`"""
+        with np.load(filename) as arrays:
+            return cls(arrays['event_ids'].astype(object),
+                       arrays['junctions'].astype(object),
+                       arrays['isoform1'], arrays['isoform2'],
+                       arrays['incompatible'])
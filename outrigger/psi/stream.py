@@ -0,0 +1,104 @@
+"""
+Calculate Psi of one bam file at a time, without a table of all reads
+
+Each worker counts the junction reads of one bam file, puts them on the
+junction vocabulary of the index, and calculates Psi and the summary of that
+sample right away. The junction reads of all samples are never in memory or
+on disk at once.
+"""
+import os
+
+import joblib
+import pandas as pd
+
+from ..common import ISOFORM_JUNCTIONS
+from ..io import bam, star
+from . import vectorized
+from .reads import pivot_reads
+
+
+def sample_psi(bam_filename, event_junctions, ignore_multimapping=False,
+               psi_format='wide', dtypes='default', **kwargs):
+    """Calculate Psi of all events in the sample of one bam file
+
+    Parameters
+    ----------
+    bam_filename : str
+        Bam file of one sample, whose sample id is the file's name
+    event_junctions : list of tuple
+        (splice_abbrev, outrigger.psi.slots.EventJunctions) of the events of
+        each splice type. Junctions without reads in this sample have zero
+        reads, so every event is calculated
+    ignore_multimapping : bool, optional
+        If True, don't count reads which map to multiple locations
+    psi_format : "wide" | "long", optional
+        Format of the Psi of each splice type, see
+        :py:func:`outrigger.psi.vectorized.iter_psi`
+    dtypes : "default" | "compact", optional
+        Data types of the reads, Psi and summaries, see
+        :py:func:`outrigger.psi.vectorized.calculate_psi`
+    kwargs
+        Any other keyword arguments to
+        :py:func:`outrigger.psi.vectorized.iter_psi`, e.g. ``min_reads``
+
+    Returns
+    -------
+    metadata : pandas.DataFrame
+        Location of each junction with reads in this sample, see
+        :py:func:`outrigger.io.star.make_metadata`
+    results : list of tuple
+        (psi, summary) of each splice type in ``event_junctions``. The
+        summary is None with ``summary="none"``
+    """
+    sample_id = os.path.basename(bam_filename)
+    junction_reads = bam.bam_to_junction_reads_table(bam_filename,
+                                                     ignore_multimapping)
+    metadata = star.make_metadata(junction_reads)
+    reads_dtype = vectorized.READS_DTYPE if dtypes == 'compact' else int
+
+    results = []
+    for splice_abbrev, type_junctions in event_junctions:
+        # Samples without any junction reads still get a row
+        type_reads2d = pivot_reads(junction_reads, dtype=reads_dtype,
+                                   samples=[sample_id],
+                                   junctions=type_junctions.junctions)
+        blocks = list(vectorized.iter_psi(
+            type_junctions, type_reads2d, n_jobs=1, psi_format=psi_format,
+            dtypes=dtypes,
+            **dict(kwargs, **ISOFORM_JUNCTIONS[splice_abbrev])))
+        if psi_format == 'long':
+            psi = pd.concat([psi for psi, summary in blocks],
+                            ignore_index=True)
+        else:
+            psi = pd.concat([psi for psi, summary in blocks], axis=1)
+        summaries = [summary for psi, summary in blocks
+                     if summary is not None]
+        summary = pd.concat(summaries, ignore_index=True) \
+            if summaries else None
+        results.append((psi, summary))
+    return metadata, results
+
+
+def iter_bam_psi(bam_filenames, event_junctions, ignore_multimapping=False,
+                 n_jobs=-1, backend='processes', **kwargs):
+    """Calculate Psi of one bam file per worker, yielding each sample in order
+
+    Only as many samples as there are processors are calculated before their
+    results are yielded, so memory doesn't grow with the number of samples.
+    The workers are processes or threads, or with ``backend="serial"``, one
+    bam file is calculated at a time. See :py:func:`sample_psi` for the other
+    parameters and yielded values.
+    """
+    vectorized._check_backend(backend)
+    if backend == 'serial':
+        n_jobs = 1
+    processors = n_jobs if n_jobs > 0 else joblib.cpu_count()
+    with vectorized._parallel(n_jobs, backend) as parallel:
+        for start in range(0, len(bam_filenames), processors):
+            results = parallel(
+                joblib.delayed(sample_psi)(
+                    filename, event_junctions,
+                    ignore_multimapping=ignore_multimapping, **kwargs)
+                for filename in bam_filenames[start:start + processors])
+            for result in results:
+                yield result
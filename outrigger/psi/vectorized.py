@@ -0,0 +1,1352 @@
+"""
+Calculate percent spliced-in (Psi) of all events at once with NumPy arrays
+
+Instead of rejecting or retaining one sample of one event at a time, the
+junction reads of all events are gathered into
+(n_events, n_samples, n_junctions) arrays and every rejection case of
+:py:func:`outrigger.psi.compute._single_isoform_maybe_reject` is evaluated as
+a boolean array expression.
+"""
+import itertools
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from ..common import MIN_READS, UNEVEN_COVERAGE_MULTIPLIER, SAMPLE_ID, \
+    EVENT_ID, NOTES, PSI, CASE, COUNT
+from ..util import progress
+from .reads import SparseReads, column_max, memmap_reads, take_columns
+from .slots import EventJunctions, MISSING
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# Maximum number of junction read counts to gather into memory at once
+MAX_BLOCK_SIZE = 2 ** 22
+
+# When parallelizing, aim for this many blocks of events per processor, but
+# don't make blocks smaller than this many events
+BLOCKS_PER_CPU = 4
+MIN_CHUNK_SIZE = 1000
+
+# Integer code of each case, which is the position of its explanation in
+# CASE_NOTES below
+(CASE_INCOMPATIBLE, CASE_ZERO, CASE_ALL_INSUFFICIENT, CASE_ONE_SUFFICIENT,
+ CASE_UNEQUAL, CASE_EXCLUSION, CASE_INCLUSION, CASE_ALL_SUFFICIENT,
+ CASE_9A, CASE_9B, CASE_10A, CASE_10B, CASE_11A, CASE_11B,
+ CASE_UNKNOWN) = range(15)
+
+CASE_NOTES = (
+    'Case 1: >= {min_reads} reads on junctions that are incompatible with '
+    'the annotation',
+    'Case 2: Zero observed reads',
+    'Case 3: All junctions with insufficient reads',
+    'Case 4: Only one junction with sufficient reads',
+    'Case 5: Unequal read coverage (one side has at least '
+    '{uneven_coverage_multiplier}x more reads)',
+    'Case 6: Exclusion',
+    'Case 7: Inclusion',
+    'Case 8: Sufficient reads on all junctions',
+    'Case 9a: Isoform1 with sufficient reads but Isoform2 has 1+ junctions '
+    'with insufficient reads: There are sufficient junction reads',
+    'Case 9b: Isoform1 with sufficient reads but Isoform2 has 1+ junctions '
+    'with insufficient reads: There are insufficient junction reads',
+    'Case 10a: Isoform1 has 1+ junction with insufficient reads but Isoform2 '
+    'with sufficient reads: There are sufficient junction reads',
+    'Case 10b: Isoform1 has 1+ junction with insufficient reads but Isoform2 '
+    'with sufficient reads: There are insufficient junction reads',
+    'Case 11a: Isoform1 and Isoform2 each have both sufficient and '
+    'insufficient junctions: There are sufficient junction reads',
+    'Case 11b: Isoform1 and Isoform2 each have both sufficient and '
+    'insufficient junctions: There are insufficient junction reads',
+    'Case ???')
+
+# Cases where the junction reads are retained and Psi is calculated
+ACCEPTED = (CASE_EXCLUSION, CASE_INCLUSION, CASE_ALL_SUFFICIENT, CASE_9A,
+            CASE_10A, CASE_11A)
+
+
+# Ways to report the case of each sample and event in the summary:
+# English explanation, the explanation as a pandas Categorical, or the
+# integer code
+NOTES_FORMATS = 'text', 'categorical', 'code'
+
+# Ways to report Psi: (samples, events) matrix, or a long table with one row
+# per sample and event with a Psi score
+PSI_FORMATS = 'wide', 'long'
+
+# Ways to classify the cases: NumPy array expressions, or a loop over the
+# samples and events compiled with numba, which is the default if installed
+ENGINES = 'numpy', 'numba'
+
+# What to report for each setting of a threshold sweep: a long table of the
+# Psi scores and cases, or only the number of samples and events in each case
+SWEEP_OUTPUTS = 'psi', 'counts'
+
+# What to report in the summary of each block of events: junction reads, Psi
+# and case of every sample and event, only the integer case of every sample
+# and event, only the number of samples in each case for every event, or
+# nothing at all
+SUMMARY_FORMATS = 'full', 'cases', 'counts', 'none'
+
+# Data types of the reads, Psi and summaries: the same int64 and float64 as
+# always, or compact ones which take about half the memory. Compact Psi is
+# single-precision, so it's written with fewer digits
+DTYPES = 'default', 'compact'
+READS_DTYPE = np.uint32
+PSI_DTYPE = np.float32
+
+# How blocks of events are calculated in parallel: worker processes which
+# share a memory-mapped copy of the reads, threads which share the reads in
+# memory, or one block at a time in this process
+BACKENDS = 'processes', 'threads', 'serial'
+
+
+def case_notes(min_reads=MIN_READS,
+               uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER):
+    """Array of English explanations, indexed by case code"""
+    notes = [note.format(min_reads=min_reads,
+                         uneven_coverage_multiplier=uneven_coverage_multiplier)
+             for note in CASE_NOTES]
+    return np.array(notes, dtype=object)
+
+
+def case_table(min_reads=MIN_READS,
+               uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER):
+    """Table to translate integer case codes into English explanations
+
+    Returns
+    -------
+    table : pandas.DataFrame
+        A (n_cases, 1) table with the integer case code as the index and the
+        explanation of the case in the "notes" column
+    """
+    notes = case_notes(min_reads, uneven_coverage_multiplier)
+    index = pd.Index(np.arange(len(notes)), name=CASE)
+    return pd.DataFrame({NOTES: notes}, index=index)
+
+
+def _format_cases(cases, notes='text', min_reads=MIN_READS,
+                  uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER):
+    """Convert integer case codes to the requested summary column
+
+    Parameters
+    ----------
+    cases : numpy.ndarray
+        Integer case codes
+    notes : "text" | "categorical" | "code"
+        Write the English explanation as a string, the explanation as a
+        memory-efficient pandas Categorical, or only the integer code
+
+    Returns
+    -------
+    name : str
+        Name of the summary column, "notes" or "case"
+    values : numpy.ndarray or pandas.Categorical
+        Column values
+    """
+    if notes == 'code':
+        return CASE, cases
+    explanations = case_notes(min_reads, uneven_coverage_multiplier)
+    if notes == 'categorical':
+        return NOTES, pd.Categorical.from_codes(cases,
+                                                categories=explanations)
+    elif notes == 'text':
+        return NOTES, explanations[cases]
+    raise ValueError('"{}" is not a valid format for the notes. Only {} are '
+                     'allowed'.format(notes, ', '.join(NOTES_FORMATS)))
+
+
+def junction_slots(event_annotation, junction_ids, isoform1_junctions,
+                   isoform2_junctions):
+    """Find the column positions of each event's junctions in a reads matrix
+
+    Parameters
+    ----------
+    event_annotation : pandas.DataFrame
+        A table of all possible events, with event ids as the index (row names)
+        and all junctions described, and contains the columns described by
+        ``isoform1_junctions`` and ``isoform_junctions``
+    junction_ids : pandas.Index
+        Junction ids of the columns of the reads matrix
+    isoform1_junctions : list of str
+        Junction numbers corresponding to isoform 1, e.g. ['junction13']
+    isoform2_junctions : list of str
+        Junction numbers corresponding to isoform 2, e.g. ['junction12',
+        'junction23']
+
+    Returns
+    -------
+    event_ids : pandas.Index
+        Sorted ids of the events whose isoform1 and isoform2 junctions are all
+        present in ``junction_ids``. Events missing any junction are dropped.
+    isoform1, isoform2 : numpy.ndarray
+        (n_events, n_junctions) integer column positions of the isoform1 and
+        isoform2 junctions of each event
+    incompatible : numpy.ndarray
+        (n_events, n_incompatible) integer column positions of the
+        incompatible junctions of each event which are present in
+        ``junction_ids``, in the same order as ``junction_ids``. Events with
+        fewer incompatible junctions are padded with ``MISSING``
+    """
+    event_junctions = EventJunctions.from_annotation(
+        event_annotation, isoform1_junctions, isoform2_junctions)
+    return event_junctions.resolve(junction_ids)
+
+
+def _gather(reads, positions):
+    """Get (n_events, n_samples, n_junctions) junction reads
+
+    ``MISSING`` positions get zero reads
+    """
+    return np.moveaxis(take_columns(reads, positions), 0, 1)
+
+
+def _check_unequal_read_coverage(isoform, uneven_coverage_multiplier):
+    """Whether one junction of an isoform is more heavily covered than other
+
+    Like ``_single_sample_check_unequal_read_coverage`` in
+    :py:mod:`outrigger.psi.compute`, only the first two junctions are
+    compared, and isoforms with only one junction are never uneven
+    """
+    if isoform.shape[-1] < 2:
+        return np.zeros(isoform.shape[:-1], dtype=bool)
+
+    junction0 = isoform[..., 0]
+    junction1 = isoform[..., 1]
+    return ((junction0 > junction1)
+            & (junction0 > junction1 * uneven_coverage_multiplier)) \
+        | ((junction1 > junction0)
+           & (junction1 > junction0 * uneven_coverage_multiplier))
+
+
+def _classify_rows(isoform1, isoform2, incompatible, min_reads,
+                   uneven_coverage_multiplier, cases):
+    """Find the case of each row of junction reads, one row at a time
+
+    Same cases as :py:func:`_classify_numpy`, but each row's junctions are
+    only read once, and the cascade stops at the first true condition. With
+    numba, this loop is compiled.
+
+    Parameters
+    ----------
+    isoform1, isoform2, incompatible : numpy.ndarray
+        (n_rows, n_junctions) junction reads, where incompatible junctions
+        which are not in the data are negative
+    cases : numpy.ndarray
+        (n_rows,) integer array to write the case codes to
+    """
+    n_junctions1 = isoform1.shape[1]
+    n_junctions2 = isoform2.shape[1]
+    n_junctions = n_junctions1 + n_junctions2
+    for i in range(cases.shape[0]):
+        incompatible_coverage = False
+        for j in range(incompatible.shape[1]):
+            if incompatible[i, j] >= min_reads and incompatible[i, j] >= 0:
+                incompatible_coverage = True
+                break
+        if incompatible_coverage:
+            cases[i] = CASE_INCOMPATIBLE
+            continue
+
+        zero1 = True
+        n_sufficient1 = 0
+        total = 0.0
+        for j in range(n_junctions1):
+            if isoform1[i, j] != 0:
+                zero1 = False
+            if isoform1[i, j] >= min_reads:
+                n_sufficient1 += 1
+            total += isoform1[i, j]
+        zero2 = True
+        n_sufficient2 = 0
+        for j in range(n_junctions2):
+            if isoform2[i, j] != 0:
+                zero2 = False
+            if isoform2[i, j] >= min_reads:
+                n_sufficient2 += 1
+            total += isoform2[i, j]
+        n_insufficient1 = n_junctions1 - n_sufficient1
+        n_insufficient2 = n_junctions2 - n_sufficient2
+
+        # Only the first two junctions of an isoform are compared, with one
+        # pseudocount each
+        unequal = False
+        if n_junctions1 >= 2:
+            junction0 = isoform1[i, 0] + 1
+            junction1 = isoform1[i, 1] + 1
+            unequal = (junction0 > junction1 and junction0 >
+                       junction1 * uneven_coverage_multiplier) or \
+                (junction1 > junction0 and junction1 >
+                 junction0 * uneven_coverage_multiplier)
+        if n_junctions2 >= 2 and not unequal:
+            junction0 = isoform2[i, 0] + 1
+            junction1 = isoform2[i, 1] + 1
+            unequal = (junction0 > junction1 and junction0 >
+                       junction1 * uneven_coverage_multiplier) or \
+                (junction1 > junction0 and junction1 >
+                 junction0 * uneven_coverage_multiplier)
+
+        all_sufficient1 = n_sufficient1 == n_junctions1
+        all_sufficient2 = n_sufficient2 == n_junctions2
+        all_insufficient1 = n_insufficient1 == n_junctions1
+        all_insufficient2 = n_insufficient2 == n_junctions2
+        sufficient_total = total >= min_reads * n_junctions
+
+        if zero1 and zero2:
+            cases[i] = CASE_ZERO
+        elif all_insufficient1 and all_insufficient2:
+            cases[i] = CASE_ALL_INSUFFICIENT
+        elif (n_sufficient1 < n_junctions1 and all_insufficient2) or \
+                (all_insufficient1 and n_sufficient2 < n_junctions2):
+            cases[i] = CASE_ONE_SUFFICIENT
+        elif unequal:
+            cases[i] = CASE_UNEQUAL
+        elif all_sufficient1 and zero2:
+            cases[i] = CASE_EXCLUSION
+        elif zero1 and all_sufficient2:
+            cases[i] = CASE_INCLUSION
+        elif all_sufficient1 and all_sufficient2:
+            cases[i] = CASE_ALL_SUFFICIENT
+        elif all_sufficient1 and n_insufficient2 > 0:
+            cases[i] = CASE_9A if sufficient_total else CASE_9B
+        elif n_insufficient1 > 0 and all_sufficient2:
+            cases[i] = CASE_10A if sufficient_total else CASE_10B
+        elif (n_insufficient1 > 0 and n_sufficient1 > 0) or \
+                (n_insufficient2 > 0 and n_sufficient2 > 0):
+            cases[i] = CASE_11A if sufficient_total else CASE_11B
+        else:
+            cases[i] = CASE_UNKNOWN
+
+
+if numba is not None:
+    _classify_rows_compiled = numba.njit(nogil=True, cache=True)(
+        _classify_rows)
+else:
+    _classify_rows_compiled = None
+
+
+def _classify_compiled(isoform1, isoform2, incompatible, min_reads,
+                       uneven_coverage_multiplier):
+    """Classify with the compiled loop over flattened samples and events"""
+    shape = isoform1.shape[:-1]
+    n_rows = int(np.prod(shape))
+
+    def flat(reads):
+        return np.ascontiguousarray(reads).reshape(n_rows, reads.shape[-1])
+
+    cases = np.empty(n_rows, dtype=np.int8)
+    _classify_rows_compiled(flat(isoform1), flat(isoform2),
+                            flat(incompatible), min_reads,
+                            uneven_coverage_multiplier, cases)
+    return cases.reshape(shape)
+
+
+def classify(isoform1, isoform2, incompatible, min_reads=MIN_READS,
+             uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER,
+             engine=None):
+    """Find the case by which each event in each sample is rejected or not
+
+    Parameters
+    ----------
+    isoform1, isoform2 : numpy.ndarray
+        (..., n_junctions) arrays of reads found on the exon-exon junctions
+        of isoform1 and isoform2
+    incompatible : numpy.ndarray
+        (..., n_incompatible) array of reads found on junctions that are
+        incompatible with the event, where junctions which are not in the
+        data are negative
+    min_reads : int, optional
+        Minimum number of reads for a junction to be counted, though the full
+        explanation is a little more complicated, please see the documentation
+        for more details. (default=10)
+    uneven_coverage_multiplier : int, optional
+        Scale factor for the maximum amount bigger one side of a junction can
+        be before rejecting the event, e.g. for an SE event with two junctions,
+        junction12 and junction23, junction12=40 but junction23=500, then this
+        event would be rejected because 500 > 40*10
+    engine : "numpy" | "numba", optional
+        Evaluate the cases as NumPy array expressions, or with a loop
+        compiled by numba. Default is "numba" if it is installed, otherwise
+        "numpy". Both give the same cases
+
+    Returns
+    -------
+    cases : numpy.ndarray
+        Integer case codes, one of ``CASE_INCOMPATIBLE`` ... ``CASE_UNKNOWN``
+    """
+    if engine is None:
+        engine = 'numpy' if numba is None else 'numba'
+    if engine == 'numba':
+        if numba is None:
+            raise ImportError('Classifying cases with the "numba" engine '
+                              'requires numba to be installed')
+        return _classify_compiled(isoform1, isoform2, incompatible,
+                                  min_reads, uneven_coverage_multiplier)
+    elif engine == 'numpy':
+        return _classify_numpy(isoform1, isoform2, incompatible, min_reads,
+                               uneven_coverage_multiplier)
+    raise ValueError('"{}" is not a valid engine to classify cases. Only {} '
+                     'are allowed'.format(engine, ', '.join(ENGINES)))
+
+
+def _classify_numpy(isoform1, isoform2, incompatible, min_reads=MIN_READS,
+                    uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER):
+    """Find the cases with NumPy array expressions, see :py:func:`classify`
+
+    Every condition is evaluated for every sample and event, and the first
+    true condition determines the case
+    """
+    n_junctions1 = isoform1.shape[-1]
+    n_junctions2 = isoform2.shape[-1]
+    n_junctions = n_junctions1 + n_junctions2
+
+    incompatible_coverage = ((incompatible >= min_reads)
+                             & (incompatible >= 0)).any(axis=-1)
+
+    zero1 = (isoform1 == 0).all(axis=-1)
+    zero2 = (isoform2 == 0).all(axis=-1)
+    n_sufficient1 = (isoform1 >= min_reads).sum(axis=-1)
+    n_sufficient2 = (isoform2 >= min_reads).sum(axis=-1)
+    n_insufficient1 = (isoform1 < min_reads).sum(axis=-1)
+    n_insufficient2 = (isoform2 < min_reads).sum(axis=-1)
+
+    all_sufficient1 = n_sufficient1 == n_junctions1
+    all_sufficient2 = n_sufficient2 == n_junctions2
+    any_sufficient1 = n_sufficient1 > 0
+    any_sufficient2 = n_sufficient2 > 0
+    all_insufficient1 = n_insufficient1 == n_junctions1
+    all_insufficient2 = n_insufficient2 == n_junctions2
+    any_insufficient1 = n_insufficient1 > 0
+    any_insufficient2 = n_insufficient2 > 0
+
+    unequal = _check_unequal_read_coverage(isoform1 + 1,
+                                           uneven_coverage_multiplier) \
+        | _check_unequal_read_coverage(isoform2 + 1,
+                                       uneven_coverage_multiplier)
+
+    sufficient_total = (isoform1.sum(axis=-1) + isoform2.sum(axis=-1)) \
+        >= (min_reads * n_junctions)
+
+    case9 = all_sufficient1 & any_insufficient2
+    case10 = any_insufficient1 & all_sufficient2
+    case11 = (any_insufficient1 & any_sufficient1) \
+        | (any_insufficient2 & any_sufficient2)
+
+    # Order matters! The first true condition determines the case
+    conditions = [
+        (incompatible_coverage, CASE_INCOMPATIBLE),
+        (zero1 & zero2, CASE_ZERO),
+        (all_insufficient1 & all_insufficient2, CASE_ALL_INSUFFICIENT),
+        (((n_sufficient1 < n_junctions1) & all_insufficient2)
+         | (all_insufficient1 & (n_sufficient2 < n_junctions2)),
+         CASE_ONE_SUFFICIENT),
+        (unequal, CASE_UNEQUAL),
+        (all_sufficient1 & zero2, CASE_EXCLUSION),
+        (zero1 & all_sufficient2, CASE_INCLUSION),
+        (all_sufficient1 & all_sufficient2, CASE_ALL_SUFFICIENT),
+        (case9 & sufficient_total, CASE_9A),
+        (case9, CASE_9B),
+        (case10 & sufficient_total, CASE_10A),
+        (case10, CASE_10B),
+        (case11 & sufficient_total, CASE_11A),
+        (case11, CASE_11B)]
+    cases = np.select([condition for condition, case in conditions],
+                      [case for condition, case in conditions],
+                      default=CASE_UNKNOWN)
+    return cases.astype(np.int8)
+
+
+def _scale(isoform, method='mean'):
+    """Aggregate junctions of the same isoform into one number"""
+    if method == 'mean':
+        return isoform.sum(axis=-1) / float(isoform.shape[-1])
+    elif method == 'min':
+        return isoform.min(axis=-1)
+    raise ValueError('"{}" is not a valid method to combine junctions of an '
+                     'isoform. Only "mean" and "min" are '
+                     'allowed'.format(method))
+
+
+def _block_reads(reads, isoform1, isoform2, incompatible):
+    """Gather the junction reads of a block of events, across all samples
+
+    Returns
+    -------
+    isoform1_reads, isoform2_reads, incompatible_reads : numpy.ndarray
+        (n_events, n_samples, n_junctions) reads of each event's junctions.
+        Incompatible junctions which pad events are negative.
+    """
+    isoform1_reads = _gather(reads, isoform1)
+    isoform2_reads = _gather(reads, isoform2)
+    incompatible_reads = _gather(reads, incompatible)
+    if incompatible.size > 0:
+        # Flag padded junctions with a negative number so they're ignored,
+        # which unsigned compact reads can't hold
+        if np.issubdtype(incompatible_reads.dtype, np.unsignedinteger):
+            incompatible_reads = incompatible_reads.astype(np.int64)
+        incompatible_reads = np.where(
+            (incompatible == MISSING)[:, np.newaxis, :],
+            np.array(-1, dtype=incompatible_reads.dtype), incompatible_reads)
+    return isoform1_reads, isoform2_reads, incompatible_reads
+
+
+def _raw_psi(isoform1_reads, isoform2_reads, method='mean'):
+    """Psi of every event and sample, before rejecting any"""
+    scaled1 = _scale(isoform1_reads, method)
+    scaled2 = _scale(isoform2_reads, method)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return scaled2 / (scaled2 + scaled1)
+
+
+def _active_events(isoform1, isoform2, incompatible, junction_max,
+                   min_reads=MIN_READS):
+    """Events with any reads on any of their junctions, in any sample
+
+    All the other events have zero observed reads in every sample, so their
+    case is known without gathering their reads. With ``min_reads`` of zero
+    or less, zero reads on incompatible junctions count, so every event is
+    active.
+    """
+    if junction_max is None or min_reads <= 0:
+        return np.ones(len(isoform1), dtype=bool)
+    positions = np.hstack([isoform1, isoform2, incompatible])
+    maximum = np.where(positions == MISSING, 0,
+                       junction_max[np.maximum(positions, 0)])
+    return (maximum > 0).any(axis=1)
+
+
+def _classify_covered(isoform1_reads, isoform2_reads, incompatible_reads,
+                      min_reads=MIN_READS,
+                      uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER):
+    """Classify samples and events, skipping ones with insufficient reads
+
+    When no junction of an event has ``min_reads`` in a sample, the case is
+    either "Case 2: Zero observed reads" or "Case 3: All junctions with
+    insufficient reads", which is found from the maximum reads. Only the
+    remaining samples and events go through :py:func:`classify`.
+    """
+    isoform_max = np.concatenate([isoform1_reads, isoform2_reads],
+                                 axis=-1).max(axis=-1)
+    covered = isoform_max >= min_reads
+    if incompatible_reads.shape[-1] > 0:
+        covered |= incompatible_reads.max(axis=-1) >= min_reads
+    cases = np.where(isoform_max == 0, CASE_ZERO,
+                     CASE_ALL_INSUFFICIENT).astype(np.int8)
+    if covered.any():
+        cases[covered] = classify(
+            isoform1_reads[covered], isoform2_reads[covered],
+            incompatible_reads[covered], min_reads=min_reads,
+            uneven_coverage_multiplier=uneven_coverage_multiplier)
+    return cases
+
+
+def _block_psi(reads, isoform1, isoform2, incompatible, min_reads=MIN_READS,
+               method='mean',
+               uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER,
+               junction_max=None, psi_dtype=float):
+    """Calculate Psi on a block of events, across all samples
+
+    Parameters
+    ----------
+    reads : numpy.ndarray or outrigger.psi.reads.SparseReads
+        A (n_samples, n_total_junctions) matrix of junction reads. Only the
+        columns of this block's junctions are made dense.
+    isoform1, isoform2, incompatible : numpy.ndarray
+        (n_events, n_junctions) integer column positions of each event's
+        junctions in ``reads``
+    junction_max : numpy.ndarray, optional
+        Maximum reads of each junction, from
+        :py:func:`outrigger.psi.reads.column_max`. If given, the reads of
+        events without any reads in any sample aren't gathered
+    psi_dtype : numpy.dtype, optional
+        Data type of the Psi values (default=float)
+
+    Returns
+    -------
+    cases : numpy.ndarray
+        (n_events, n_samples) integer case codes
+    psi : numpy.ndarray
+        (n_events, n_samples) percent spliced-in, NaN if rejected
+    """
+    shape = len(isoform1), reads.shape[0]
+    cases = np.full(shape, CASE_ZERO, dtype=np.int8)
+    psi = np.full(shape, np.nan, dtype=psi_dtype)
+    active = _active_events(isoform1, isoform2, incompatible, junction_max,
+                            min_reads)
+    if not active.any():
+        return cases, psi
+
+    isoform1_reads, isoform2_reads, incompatible_reads = _block_reads(
+        reads, isoform1[active], isoform2[active], incompatible[active])
+
+    active_cases = _classify_covered(
+        isoform1_reads, isoform2_reads, incompatible_reads,
+        min_reads=min_reads,
+        uneven_coverage_multiplier=uneven_coverage_multiplier)
+
+    active_psi = _raw_psi(isoform1_reads, isoform2_reads, method)
+    cases[active] = active_cases
+    psi[active] = np.where(np.isin(active_cases, ACCEPTED), active_psi,
+                           np.nan)
+    return cases, psi
+
+
+def _block_sweep(reads, isoform1, isoform2, incompatible, settings,
+                 method='mean', junction_max=None):
+    """Calculate Psi on a block of events with several thresholds
+
+    The junction reads are gathered, and the isoforms' reads are combined
+    into Psi, only once for all the settings. Only the case of each sample
+    depends on the thresholds.
+
+    Parameters
+    ----------
+    settings : list of tuple
+        (min_reads, uneven_coverage_multiplier) pairs
+    junction_max : numpy.ndarray, optional
+        Maximum reads of each junction, see :py:func:`_block_psi`
+
+    Returns
+    -------
+    cases : numpy.ndarray
+        (n_events, n_settings, n_samples) integer case codes
+    psi : numpy.ndarray
+        (n_events, n_settings, n_samples) percent spliced-in, NaN if rejected
+    """
+    shape = len(isoform1), len(settings), reads.shape[0]
+    cases = np.full(shape, CASE_ZERO, dtype=np.int8)
+    psi = np.full(shape, np.nan)
+    if not settings:
+        return cases, psi
+    # Events without reads are inactive with every threshold
+    active = _active_events(
+        isoform1, isoform2, incompatible, junction_max,
+        min(min_reads for min_reads, multiplier in settings))
+    if not active.any():
+        return cases, psi
+
+    isoform1_reads, isoform2_reads, incompatible_reads = _block_reads(
+        reads, isoform1[active], isoform2[active], incompatible[active])
+    active_psi = _raw_psi(isoform1_reads, isoform2_reads, method)
+
+    active_cases = np.stack([
+        _classify_covered(isoform1_reads, isoform2_reads, incompatible_reads,
+                          min_reads=min_reads,
+                          uneven_coverage_multiplier=multiplier)
+        for min_reads, multiplier in settings], axis=1)
+    cases[active] = active_cases
+    psi[active] = np.where(np.isin(active_cases, ACCEPTED),
+                           active_psi[:, np.newaxis, :], np.nan)
+    return cases, psi
+
+
+def _chunk_size(n_events, n_samples, n_slots, n_jobs=1,
+                max_block_size=None):
+    """Automatic number of events per block
+
+    Blocks have at most ``max_block_size`` reads, to limit memory. When
+    running in parallel, events are also split into about
+    ``BLOCKS_PER_CPU`` blocks per processor so the work is evenly balanced,
+    but blocks have at least ``MIN_CHUNK_SIZE`` events so the time isn't
+    spent on scheduling tasks and collecting their results.
+    """
+    if max_block_size is None:
+        max_block_size = MAX_BLOCK_SIZE
+    chunk_size = max(1, max_block_size // max(1, n_samples * n_slots))
+    if n_jobs != 1:
+        processors = n_jobs if n_jobs > 0 else joblib.cpu_count()
+        balanced = -(-n_events // (processors * BLOCKS_PER_CPU))
+        chunk_size = min(chunk_size, max(MIN_CHUNK_SIZE, balanced))
+    return chunk_size
+
+
+def _blocks(n_events, chunk_size):
+    """Slices of ``chunk_size`` consecutive events"""
+    if chunk_size < 1:
+        raise ValueError('Chunk size must be a positive number of events, '
+                         'not {}'.format(chunk_size))
+    return [slice(start, min(start + chunk_size, n_events))
+            for start in range(0, n_events, chunk_size)]
+
+
+def _check_dtypes(dtypes):
+    if dtypes not in DTYPES:
+        raise ValueError('"{}" is not a valid choice of data types. Only {} '
+                         'are allowed'.format(dtypes, ', '.join(DTYPES)))
+
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError('"{}" is not a valid backend. Only {} are '
+                         'allowed'.format(backend, ', '.join(BACKENDS)))
+
+
+def _parallel(n_jobs, backend='processes'):
+    """A :py:class:`joblib.Parallel` of ``n_jobs`` workers of the backend"""
+    if backend == 'threads':
+        return joblib.Parallel(n_jobs=n_jobs, backend='threading')
+    return joblib.Parallel(n_jobs=n_jobs)
+
+
+def reads_matrix(reads2d, dtypes='default'):
+    """Unlabeled junction reads matrix, which is sparse if the input is
+
+    This is the matrix of reads which :py:func:`calculate_psi_arrays` works
+    on, so callers can select rows of samples from it once and calculate
+    several sets of events without converting the reads each time.
+
+    Parameters
+    ----------
+    reads2d : pandas.DataFrame or numpy.ndarray or SparseReads
+        A (n_samples, n_junctions) table of junction reads
+    dtypes : "default" | "compact", optional
+        With "compact", reads are converted to ``READS_DTYPE`` unless they
+        already are
+
+    Returns
+    -------
+    reads : numpy.ndarray or SparseReads
+        The (n_samples, n_junctions) reads, as a :py:class:`SparseReads` if
+        ``reads2d`` is one, and as an array otherwise
+    """
+    _check_dtypes(dtypes)
+    if isinstance(reads2d, SparseReads):
+        if dtypes == 'compact' and reads2d.matrix.dtype != READS_DTYPE:
+            return SparseReads(reads2d.matrix.astype(READS_DTYPE),
+                               index=reads2d.index, columns=reads2d.columns)
+        return reads2d
+    reads = np.asarray(reads2d)
+    if dtypes == 'compact':
+        reads = reads.astype(READS_DTYPE, copy=False)
+    return reads
+
+
+def _psi_dtype(dtypes='default'):
+    return PSI_DTYPE if dtypes == 'compact' else float
+
+
+def _ids(ids, codes, dtypes='default'):
+    """Ids at the positions of ``codes``, categorical if compact"""
+    if dtypes == 'compact':
+        return pd.Categorical.from_codes(codes, categories=pd.Index(ids))
+    return np.asarray(ids, dtype=object)[codes]
+
+
+def _summarize(event_ids, sample_ids, reads, isoform1, isoform2,
+               incompatible, cases, psi, isoform1_junction_numbers,
+               isoform2_junction_numbers, min_reads=MIN_READS,
+               uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER,
+               notes='text', dtypes='default'):
+    """Make table summarizing junction reads, psi, and notes for all events
+
+    Same table as :py:func:`outrigger.psi.compute._summarize_event`, but for
+    all events at once. With ``notes="code"``, the "notes" column is replaced
+    by the integer "case" column, see :py:func:`case_table`. With
+    ``dtypes="compact"``, sample and event ids are categorical, and reads of
+    incompatible junctions are nullable integers instead of floats
+    """
+    n_events = len(event_ids)
+    n_samples = len(sample_ids)
+
+    summary = pd.DataFrame({
+        SAMPLE_ID: _ids(sample_ids, np.tile(np.arange(n_samples), n_events),
+                        dtypes),
+        EVENT_ID: _ids(event_ids, np.repeat(np.arange(n_events), n_samples),
+                       dtypes)})
+
+    for prefix, positions, numbers in (
+            ('isoform1_', isoform1, isoform1_junction_numbers),
+            ('isoform2_', isoform2, isoform2_junction_numbers)):
+        for i, number in enumerate(numbers):
+            summary[prefix + number] = take_columns(
+                reads, positions[:, i]).T.ravel()
+
+    summary[PSI] = psi.ravel()
+    name, values = _format_cases(cases.ravel(), notes, min_reads,
+                                 uneven_coverage_multiplier)
+    summary[name] = values
+
+    for i in range(incompatible.shape[1]):
+        positions = incompatible[:, i]
+        column = take_columns(reads, positions).T.ravel()
+        missing = np.repeat(positions == MISSING, n_samples)
+        if missing.any() and dtypes == 'compact':
+            column = pd.arrays.IntegerArray(column.astype(READS_DTYPE),
+                                            missing)
+        elif missing.any():
+            column = column.astype(float)
+            column[missing] = np.nan
+        summary['incompatible_junction{}'.format(i)] = column
+    return summary
+
+
+def _summarize_cases(event_ids, sample_ids, cases, dtypes='default'):
+    """Table of the sample, event and integer case code of every event"""
+    n_events = len(event_ids)
+    n_samples = len(sample_ids)
+    return pd.DataFrame({
+        SAMPLE_ID: _ids(sample_ids, np.tile(np.arange(n_samples), n_events),
+                        dtypes),
+        EVENT_ID: _ids(event_ids, np.repeat(np.arange(n_events), n_samples),
+                       dtypes),
+        CASE: cases.ravel()}, columns=[SAMPLE_ID, EVENT_ID, CASE])
+
+
+def _summarize_counts(event_ids, cases, dtypes='default'):
+    """Number of samples in each case of every event, without zero counts"""
+    n_cases = len(CASE_NOTES)
+    codes = np.arange(len(event_ids))[:, np.newaxis] * n_cases + cases
+    counts = np.bincount(codes.ravel(), minlength=len(event_ids) * n_cases)
+    counts = counts.reshape(len(event_ids), n_cases)
+    events, case = np.nonzero(counts)
+    return pd.DataFrame({
+        EVENT_ID: _ids(event_ids, events, dtypes),
+        CASE: case.astype(np.int8),
+        COUNT: counts[events, case]}, columns=[EVENT_ID, CASE, COUNT])
+
+
+def _block_summary(summary, event_ids, sample_ids, reads, isoform1,
+                   isoform2, incompatible, cases, psi, isoform1_junctions,
+                   isoform2_junctions, dtypes='default', **kwargs):
+    """Summary of a block of events in one of ``SUMMARY_FORMATS``
+
+    See :py:func:`_summarize` for the "full" summary. Returns None for
+    ``summary="none"``
+    """
+    if summary == 'full':
+        return _summarize(event_ids, sample_ids, reads, isoform1, isoform2,
+                          incompatible, cases, psi, isoform1_junctions,
+                          isoform2_junctions, dtypes=dtypes, **kwargs)
+    elif summary == 'cases':
+        return _summarize_cases(event_ids, sample_ids, cases, dtypes)
+    elif summary == 'counts':
+        return _summarize_counts(event_ids, cases, dtypes)
+
+
+def _check_summary(summary):
+    if summary not in SUMMARY_FORMATS:
+        raise ValueError('"{}" is not a valid summary. Only {} are '
+                         'allowed'.format(summary, ', '.join(SUMMARY_FORMATS)))
+
+
+def _setup(event_annotation, reads2d, isoform1_junctions, isoform2_junctions,
+           n_jobs=-1, chunk_size=None, dtypes='default'):
+    """Find junctions of all events and split the events into blocks"""
+    if isinstance(event_annotation, EventJunctions):
+        event_junctions = event_annotation
+    else:
+        event_junctions = EventJunctions.from_annotation(
+            event_annotation, isoform1_junctions, isoform2_junctions)
+    event_ids, isoform1, isoform2, incompatible = event_junctions.resolve(
+        reads2d.columns)
+    reads = reads_matrix(reads2d, dtypes)
+
+    n_events = len(event_ids)
+    n_samples = reads.shape[0]
+    n_slots = isoform1.shape[1] + isoform2.shape[1] + incompatible.shape[1]
+    if chunk_size is None:
+        chunk_size = _chunk_size(n_events, n_samples, n_slots, n_jobs)
+    blocks = _blocks(n_events, chunk_size)
+    return event_ids, reads, isoform1, isoform2, incompatible, blocks
+
+
+def _junction_sets(isoform1, isoform2, incompatible):
+    """Number the distinct junction sets of events, by first appearance
+
+    Events with the same isoform1, isoform2 and incompatible junctions, e.g.
+    with different flanking exons, have the same Psi and case in every
+    sample, so they only need to be calculated once.
+
+    Returns
+    -------
+    first : numpy.ndarray
+        Position of the first event with each junction set
+    keys : numpy.ndarray
+        Number of the junction set of each event
+    """
+    junctions = np.hstack([isoform1, isoform2, incompatible])
+    if len(junctions) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    unique, first, inverse = np.unique(junctions, axis=0, return_index=True,
+                                       return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty(len(order), dtype=int)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.reshape(-1)]
+
+
+def _reuse(blocks, keys, key_blocks, results):
+    """Yield each block of events' cases and Psi from their junction sets
+
+    Parameters
+    ----------
+    blocks : list of slice
+        Consecutive blocks of events
+    keys : numpy.ndarray
+        Number of the junction set of each event, by first appearance
+    key_blocks : list of slice
+        Junction sets which first appear in each block of events
+    results : iterable
+        Cases and Psi of the junction sets of each of ``key_blocks``, with
+        one junction set per row
+
+    Only the results of junction sets which appear again in later blocks are
+    kept between blocks.
+    """
+    last = np.zeros(key_blocks[-1].stop if key_blocks else 0, dtype=int)
+    np.maximum.at(last, keys, np.arange(len(keys)))
+
+    kept = np.zeros(0, dtype=int)
+    kept_cases, kept_psi = None, None
+    for block, key_block, (cases, psi) in zip(blocks, key_blocks, results):
+        if kept_cases is None:
+            kept_cases, kept_psi = cases[:0], psi[:0]
+        # Kept junction sets are all numbered before the new ones, so this
+        # is still sorted
+        known = np.concatenate([kept, np.arange(key_block.start,
+                                                key_block.stop)])
+        known_cases = np.concatenate([kept_cases, cases])
+        known_psi = np.concatenate([kept_psi, psi])
+
+        positions = np.searchsorted(known, keys[block])
+        yield block, known_cases[positions], known_psi[positions]
+
+        keep = last[known] >= block.stop
+        kept, kept_cases, kept_psi = \
+            known[keep], known_cases[keep], known_psi[keep]
+
+
+def _iter_results(reads, isoform1, isoform2, incompatible, blocks, n_jobs=-1,
+                  temp_folder=None, batch_size=None, function=None,
+                  backend='processes', **kwargs):
+    """Yield each block's slice of events, cases and Psi, in order
+
+    Each distinct junction set is only calculated once, in the first block
+    it appears in, and its results are reused for any other events with the
+    same junctions. In parallel, ``batch_size`` blocks are calculated before
+    their results are yielded. Default is to calculate all the blocks first.
+    Worker processes share a memory-mapped copy of the reads, and threads
+    share ``reads`` itself, since NumPy releases the GIL for most of the
+    work.
+
+    Each block is calculated with ``function(reads, isoform1, isoform2,
+    incompatible, **kwargs)``, by default :py:func:`_block_psi`.
+    """
+    if function is None:
+        function = _block_psi
+    n_events, n_samples = len(isoform1), reads.shape[0]
+    if not blocks:
+        yield (slice(0, 0), np.empty((0, n_samples), dtype=np.int8),
+               np.empty((0, n_samples)))
+        return
+
+    # Events without reads on any junction in any sample don't need their
+    # reads gathered
+    kwargs['junction_max'] = column_max(reads)
+
+    first, keys = _junction_sets(isoform1, isoform2, incompatible)
+    isoform1, isoform2, incompatible = \
+        isoform1[first], isoform2[first], incompatible[first]
+    # Junction sets are numbered by first appearance, so the ones which
+    # first appear in a block of events are consecutive
+    n_seen = np.maximum.accumulate(keys) + 1
+    key_blocks = [slice(n_seen[block.start - 1] if block.start > 0 else 0,
+                        n_seen[block.stop - 1]) for block in blocks]
+
+    if n_jobs == 1 or len(blocks) < 2:
+        progress('\tIterating over {} events with {} distinct junction sets '
+                 'in {} blocks ...\n'.format(n_events, len(first),
+                                             len(blocks)))
+        results = (function(reads, isoform1[key_block],
+                            isoform2[key_block], incompatible[key_block],
+                            **kwargs)
+                   for key_block in key_blocks)
+        for result in _reuse(blocks, keys, key_blocks, results):
+            yield result
+    else:
+        processors = n_jobs if n_jobs > 0 else joblib.cpu_count()
+        progress("\tParallelizing {} events' Psi calculation, with {} "
+                 "distinct junction sets, in {} blocks across {} {} "
+                 "...\n".format(n_events, len(first), len(blocks),
+                                processors, backend))
+        if batch_size is None:
+            batch_size = len(blocks)
+
+        def batches(parallel, shared):
+            for start in range(0, len(key_blocks), batch_size):
+                results = parallel(
+                    joblib.delayed(function)(
+                        shared, isoform1[key_block], isoform2[key_block],
+                        incompatible[key_block], **kwargs)
+                    for key_block in key_blocks[start:start + batch_size])
+                for result in results:
+                    yield result
+
+        if backend == 'threads':
+            with _parallel(n_jobs, backend) as parallel:
+                for result in _reuse(blocks, keys, key_blocks,
+                                     batches(parallel, reads)):
+                    yield result
+            return
+
+        # Write the reads to disk once so all workers share the same
+        # memory-mapped copy, instead of pickling them for every block
+        with memmap_reads(reads, temp_folder) as shared, \
+                _parallel(n_jobs, backend) as parallel:
+            for result in _reuse(blocks, keys, key_blocks,
+                                 batches(parallel, shared)):
+                yield result
+
+
+def _psi_frame(psi, sample_ids, event_ids):
+    """(samples, events) dataframe of (events, samples) Psi values"""
+    psi = pd.DataFrame(psi.T, index=pd.Index(sample_ids, name=SAMPLE_ID),
+                       columns=pd.Index(event_ids, name=EVENT_ID))
+    return psi.sort_index()
+
+
+def _psi_long(psi, cases, sample_ids, event_ids, dtypes='default'):
+    """Table of sample, event, Psi and case code of all non-NaN Psi values
+
+    Rows are ordered by event, then by sample, like the summary
+    """
+    events, samples = np.nonzero(~np.isnan(psi))
+    return pd.DataFrame({
+        SAMPLE_ID: _ids(sample_ids, samples, dtypes),
+        EVENT_ID: _ids(event_ids, events, dtypes),
+        PSI: psi[events, samples],
+        CASE: cases[events, samples]},
+        columns=[SAMPLE_ID, EVENT_ID, PSI, CASE])
+
+
+def calculate_psi(event_annotation, reads2d,
+                  isoform1_junctions, isoform2_junctions,
+                  min_reads=MIN_READS, method='mean',
+                  uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER,
+                  n_jobs=-1, notes='text', temp_folder=None,
+                  chunk_size=None, dtypes='default', summary='full',
+                  backend='processes'):
+    """Compute percent-spliced-in of all events at once
+
+    See :py:func:`outrigger.psi.compute.calculate_psi` for parameters. The
+    output is identical, but all samples and events are calculated in bulk
+    with NumPy arrays. ``reads2d`` can also be a
+    :py:class:`outrigger.psi.reads.SparseReads`, where only the junctions of
+    one block of events at a time are made dense. ``event_annotation`` can
+    also be a :py:class:`outrigger.psi.slots.EventJunctions` of the events'
+    junctions, such as the one saved by ``outrigger index``, so the
+    junction ids don't need to be looked up again. When running in parallel,
+    the reads are memory-mapped from a file in ``temp_folder`` and shared by
+    all workers, see :py:func:`outrigger.psi.reads.memmap_reads`.
+
+    With ``backend="threads"``, the workers are threads which all use the
+    same reads in memory, so nothing is written to disk or sent to the
+    workers. NumPy and the numba engine release the GIL for most of the
+    work, but parts which don't, such as slicing sparse reads, run one
+    thread at a time. With ``backend="serial"``, ``n_jobs`` is ignored and
+    one block is calculated at a time.
+
+    Events are calculated in blocks of ``chunk_size`` events, and each block
+    returns a single array of cases and Psi values. By default, the chunk
+    size is chosen from the number of events, samples and processors.
+
+    With ``dtypes="compact"``, reads are ``READS_DTYPE`` (converted if
+    needed, so pass them that way to avoid a copy), Psi is ``PSI_DTYPE``,
+    sample and event ids in the summary are categorical, and reads of
+    incompatible junctions are nullable integers, which together take about
+    half the memory of the default int64 and float64.
+
+    The full summary is often much bigger than Psi. With ``summary="cases"``,
+    it only has the "sample_id", "event_id" and integer "case" of each event
+    in each sample, see :py:func:`case_table`. With ``summary="counts"``, it
+    only has the "count" of samples in each "case" of each "event_id", and
+    with ``summary="none"``, it is None.
+
+    Returns
+    -------
+    psi : pandas.DataFrame
+        An (samples, events) dataframe of the percent spliced-in values
+    summary : pandas.DataFrame
+        A (n_samples * n_events, 7) shaped table with the sample id, junction
+        reads, percent spliced-in (Psi), and notes on each event in each
+        sample, that explains why or why not Psi was calculated
+    """
+    _check_dtypes(dtypes)
+    _check_summary(summary)
+    _check_backend(backend)
+    if backend == 'serial':
+        n_jobs = 1
+    event_ids, reads, isoform1, isoform2, incompatible, blocks = _setup(
+        event_annotation, reads2d, isoform1_junctions, isoform2_junctions,
+        n_jobs, chunk_size, dtypes)
+
+    results = list(_iter_results(
+        reads, isoform1, isoform2, incompatible, blocks, n_jobs=n_jobs,
+        temp_folder=temp_folder, backend=backend, min_reads=min_reads,
+        method=method,
+        uneven_coverage_multiplier=uneven_coverage_multiplier,
+        psi_dtype=_psi_dtype(dtypes)))
+    cases = np.concatenate([result[1] for result in results])
+    psi = np.concatenate([result[2] for result in results])
+
+    summary = _block_summary(
+        summary, event_ids, reads2d.index, reads, isoform1, isoform2,
+        incompatible, cases, psi, isoform1_junctions, isoform2_junctions,
+        min_reads=min_reads,
+        uneven_coverage_multiplier=uneven_coverage_multiplier, notes=notes,
+        dtypes=dtypes)
+    return _psi_frame(psi, reads2d.index, event_ids), summary
+
+
+def iter_psi(event_annotation, reads2d, isoform1_junctions,
+             isoform2_junctions, min_reads=MIN_READS, method='mean',
+             uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER,
+             n_jobs=-1, notes='text', temp_folder=None, chunk_size=None,
+             psi_format='wide', dtypes='default', summary='full',
+             backend='processes'):
+    """Calculate percent-spliced-in block by block, yielding each block
+
+    Same parameters as :py:func:`calculate_psi`, but instead of building the
+    whole summary table, the Psi values and summary of each block of
+    ``chunk_size`` events are yielded as soon as the block is done, so they
+    can be written to disk with bounded memory. When running in parallel,
+    only ``n_jobs`` blocks are held in memory at a time.
+
+    Concatenating the yielded Psi matrices along the columns, and the
+    summaries along the rows, gives the output of :py:func:`calculate_psi`.
+
+    With ``psi_format="long"``, Psi is never pivoted into a matrix. Instead,
+    each block's Psi is a table with "sample_id", "event_id", "psi" and
+    integer "case" columns, with only the samples and events that have a Psi
+    score.
+
+    Yields
+    ------
+    psi : pandas.DataFrame
+        An (samples, events in block) dataframe of percent spliced-in values,
+        or a long table of the non-NaN values
+    summary : pandas.DataFrame
+        Junction reads, Psi and notes of the events in the block, for every
+        sample, or less with another ``summary``, see
+        :py:func:`calculate_psi`
+    """
+    if psi_format not in PSI_FORMATS:
+        raise ValueError('"{}" is not a valid format for Psi. Only {} are '
+                         'allowed'.format(psi_format, ', '.join(PSI_FORMATS)))
+    _check_dtypes(dtypes)
+    _check_summary(summary)
+    _check_backend(backend)
+    if backend == 'serial':
+        n_jobs = 1
+    event_ids, reads, isoform1, isoform2, incompatible, blocks = _setup(
+        event_annotation, reads2d, isoform1_junctions, isoform2_junctions,
+        n_jobs, chunk_size, dtypes)
+    processors = n_jobs if n_jobs > 0 else joblib.cpu_count()
+
+    for block, cases, psi in _iter_results(
+            reads, isoform1, isoform2, incompatible, blocks, n_jobs=n_jobs,
+            temp_folder=temp_folder, batch_size=processors, backend=backend,
+            min_reads=min_reads, method=method,
+            uneven_coverage_multiplier=uneven_coverage_multiplier,
+            psi_dtype=_psi_dtype(dtypes)):
+        block_summary = _block_summary(
+            summary, event_ids[block], reads2d.index, reads, isoform1[block],
+            isoform2[block], incompatible[block], cases, psi,
+            isoform1_junctions, isoform2_junctions, min_reads=min_reads,
+            uneven_coverage_multiplier=uneven_coverage_multiplier,
+            notes=notes, dtypes=dtypes)
+        if psi_format == 'long':
+            yield _psi_long(psi, cases, reads2d.index,
+                            event_ids[block], dtypes), block_summary
+        else:
+            yield (_psi_frame(psi, reads2d.index, event_ids[block]),
+                   block_summary)
+
+
+def _check_slots(reads, isoform1, isoform2, incompatible):
+    """Make sure the junction positions are integers within the reads"""
+    n_junctions = reads.shape[1]
+    slots = []
+    for name, positions in (('isoform1', isoform1), ('isoform2', isoform2),
+                            ('incompatible', incompatible)):
+        positions = np.asarray(positions)
+        if name == 'incompatible' and positions.size == 0:
+            positions = np.zeros((len(slots[0]), 0), dtype=int)
+        if positions.ndim != 2 or not np.issubdtype(positions.dtype,
+                                                    np.integer):
+            raise ValueError('{} must be a 2-dimensional array of integer '
+                             'junction positions'.format(name))
+        if slots and len(positions) != len(slots[0]):
+            raise ValueError('isoform1, isoform2 and incompatible must have '
+                             'one row per event')
+        lowest = 0 if name != 'incompatible' else MISSING
+        if positions.size > 0 and (positions.min() < lowest
+                                   or positions.max() >= n_junctions):
+            raise ValueError(
+                '{name} has junction positions outside of the {n} columns of '
+                'the reads{padded}'.format(
+                    name=name, n=n_junctions,
+                    padded=', other than MISSING for padding'
+                    if name == 'incompatible' else ''))
+        slots.append(positions)
+    return slots
+
+
+def calculate_psi_arrays(reads, isoform1, isoform2, incompatible,
+                         min_reads=MIN_READS, method='mean',
+                         uneven_coverage_multiplier=UNEVEN_COVERAGE_MULTIPLIER,
+                         n_jobs=1, temp_folder=None, chunk_size=None,
+                         dtypes='default', backend='processes'):
+    """Percent spliced-in and case codes from arrays of reads and positions
+
+    Same rules as :py:func:`calculate_psi`, but without any event, sample or
+    junction ids, so no annotation table, labeled reads or summary is built.
+    This is meant for embedding in pipelines which already hold their
+    junction reads as arrays.
+
+    Parameters
+    ----------
+    reads : numpy.ndarray or scipy.sparse.spmatrix or SparseReads
+        A (n_samples, n_junctions) matrix of junction reads
+    isoform1, isoform2 : numpy.ndarray
+        (n_events, n_junctions) integer column positions of the isoform1 and
+        isoform2 junctions of each event in ``reads``. Every junction must
+        be in ``reads``
+    incompatible : numpy.ndarray
+        (n_events, n_incompatible) integer column positions of the
+        incompatible junctions of each event, padded with ``MISSING`` for
+        events with fewer. Can have no columns
+    dtypes : "default" | "compact", optional
+        With "compact", reads are ``READS_DTYPE`` and Psi is ``PSI_DTYPE``
+
+    See :py:func:`calculate_psi` for the other parameters.
+
+    Returns
+    -------
+    psi : numpy.ndarray
+        (n_samples, n_events) percent spliced-in, NaN if rejected
+    cases : numpy.ndarray
+        (n_samples, n_events) integer case codes, see :py:func:`case_table`
+    """
+    _check_dtypes(dtypes)
+    _check_backend(backend)
+    if backend == 'serial':
+        n_jobs = 1
+    if sparse.issparse(reads):
+        reads = SparseReads(reads, index=np.arange(reads.shape[0]),
+                            columns=np.arange(reads.shape[1]))
+    reads = reads_matrix(reads, dtypes)
+    if len(reads.shape) != 2:
+        raise ValueError('reads must be a (n_samples, n_junctions) matrix')
+    isoform1, isoform2, incompatible = _check_slots(
+        reads, isoform1, isoform2, incompatible)
+
+    n_events, n_samples = len(isoform1), reads.shape[0]
+    if chunk_size is None:
+        n_slots = isoform1.shape[1] + isoform2.shape[1] \
+            + incompatible.shape[1]
+        chunk_size = _chunk_size(n_events, n_samples, n_slots, n_jobs)
+    blocks = _blocks(n_events, chunk_size)
+
+    psi_dtype = _psi_dtype(dtypes)
+    psi = np.empty((n_events, n_samples), dtype=psi_dtype)
+    cases = np.empty((n_events, n_samples), dtype=np.int8)
+    for block, block_cases, block_psi in _iter_results(
+            reads, isoform1, isoform2, incompatible, blocks, n_jobs=n_jobs,
+            temp_folder=temp_folder, backend=backend, min_reads=min_reads,
+            method=method,
+            uneven_coverage_multiplier=uneven_coverage_multiplier,
+            psi_dtype=psi_dtype):
+        psi[block] = block_psi
+        cases[block] = block_cases
+    return psi.T, cases.T
+
+
+def sweep_settings(min_reads=(MIN_READS,),
+                   uneven_coverage_multiplier=(UNEVEN_COVERAGE_MULTIPLIER,)):
+    """All combinations of thresholds to sweep over
+
+    Returns
+    -------
+    settings : list of tuple
+        (min_reads, uneven_coverage_multiplier) pairs, ordered by
+        ``min_reads`` first
+    """
+    return list(itertools.product(min_reads, uneven_coverage_multiplier))
+
+
+def _case_counts(cases, settings):
+    """Number of samples and events in each case, for every setting"""
+    n_settings = len(settings)
+    counts = np.zeros((n_settings, len(CASE_NOTES)), dtype=np.int64)
+    for i in range(n_settings):
+        counts[i] = np.bincount(cases[:, i].ravel(),
+                                minlength=len(CASE_NOTES))
+    index = pd.MultiIndex.from_tuples(
+        settings, names=['min_reads', 'uneven_coverage_multiplier'])
+    columns = pd.Index(np.arange(len(CASE_NOTES)), name=CASE)
+    return pd.DataFrame(counts, index=index, columns=columns)
+
+
+def iter_sweep(event_annotation, reads2d, isoform1_junctions,
+               isoform2_junctions, settings, method='mean', n_jobs=-1,
+               temp_folder=None, chunk_size=None, output='psi',
+               backend='processes'):
+    """Calculate percent-spliced-in with several thresholds in one pass
+
+    Each block of events' junction reads are gathered, and Psi is combined
+    from them, only once. Only which samples are rejected depends on the
+    thresholds, so every setting is classified from the same reads. See
+    :py:func:`iter_psi` for the other parameters.
+
+    Parameters
+    ----------
+    settings : list of tuple
+        (min_reads, uneven_coverage_multiplier) pairs, e.g. from
+        :py:func:`sweep_settings`
+    output : "psi" | "counts"
+        Yield the Psi scores and cases of each setting, or only the number
+        of samples and events in each case
+
+    Yields
+    ------
+    psi : list of pandas.DataFrame
+        With ``output="psi"``, the long table of Psi of the block, like
+        :py:func:`iter_psi` with ``psi_format="long"``, for each setting
+    counts : pandas.DataFrame
+        With ``output="counts"``, a (n_settings, n_cases) table of the number
+        of samples and events of the block in each case, with the settings
+        as the index and the case codes as the columns
+    """
+    if output not in SWEEP_OUTPUTS:
+        raise ValueError('"{}" is not a valid output of a sweep. Only {} are '
+                         'allowed'.format(output, ', '.join(SWEEP_OUTPUTS)))
+    _check_backend(backend)
+    if backend == 'serial':
+        n_jobs = 1
+    settings = [tuple(setting) for setting in settings]
+    event_ids, reads, isoform1, isoform2, incompatible, blocks = _setup(
+        event_annotation, reads2d, isoform1_junctions, isoform2_junctions,
+        n_jobs, chunk_size)
+    processors = n_jobs if n_jobs > 0 else joblib.cpu_count()
+
+    for block, cases, psi in _iter_results(
+            reads, isoform1, isoform2, incompatible, blocks, n_jobs=n_jobs,
+            temp_folder=temp_folder, batch_size=processors, backend=backend,
+            function=_block_sweep, settings=settings, method=method):
+        if cases.ndim == 2:
+            # Without any events, there is no axis of settings
+            shape = 0, len(settings), cases.shape[1]
+            cases, psi = cases.reshape(shape), psi.reshape(shape)
+        if output == 'counts':
+            yield _case_counts(cases, settings)
+        else:
+            yield [_psi_long(psi[:, i], cases[:, i], reads2d.index,
+                             event_ids[block])
+                   for i in range(len(settings))]
@@ -0,0 +1,236 @@
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdt
+import pytest
+
+
+@pytest.fixture
+def tables():
+    se = pd.DataFrame({'sample_id': ['a', 'b', 'a'],
+                       'isoform2_junction12': [10, 0, 3],
+                       'psi': [0.5, np.nan, 1.0],
+                       'notes': ['Case 1: x, y', 'Case 2', 'Case 1: x, y']},
+                      columns=['sample_id', 'isoform2_junction12', 'psi',
+                               'notes'])
+    mxe = pd.DataFrame({'sample_id': ['c'],
+                        'isoform1_junction13': [4],
+                        'psi': [0.25],
+                        'notes': ['Case 3']},
+                       columns=['sample_id', 'isoform1_junction13', 'psi',
+                                'notes'])
+    return [se, mxe]
+
+
+def test_append_csv(tables, tmpdir):
+    from outrigger.io.tables import append_csv
+
+    csv = tmpdir.join('table.csv').strpath
+    df = tables[0]
+    for i in range(len(df)):
+        append_csv(df.iloc[i:i + 1], csv, first=i == 0, index=False)
+
+    pdt.assert_frame_equal(pd.read_csv(csv), df)
+
+
+@pytest.mark.parametrize('chunksize', [1, 2, 100])
+def test_concatenate_csvs(tables, tmpdir, chunksize):
+    from outrigger.io.tables import concatenate_csvs
+
+    filenames = []
+    for i, df in enumerate(tables):
+        filename = tmpdir.join('{}.csv'.format(i)).strpath
+        df.to_csv(filename, index=False, na_rep='NA')
+        filenames.append(filename)
+    csv = tmpdir.join('concatenated.csv').strpath
+
+    concatenate_csvs(filenames, csv, column='splice_type',
+                     values=['se', 'mxe'], chunksize=chunksize)
+
+    true = pd.concat([df.assign(splice_type=value)
+                      for df, value in zip(tables, ['se', 'mxe'])],
+                     ignore_index=True)
+    test = pd.read_csv(csv, index_col=0)
+    # The added column is right after the first table's columns
+    assert test.columns.tolist() == ['sample_id', 'isoform2_junction12', 'psi',
+                                     'notes', 'splice_type',
+                                     'isoform1_junction13']
+    pdt.assert_frame_equal(test, true)
+
+
+def test_write_npz_read_npz(tables, tmpdir):
+    from outrigger.io.tables import write_npz, read_npz
+
+    filename = tmpdir.join('table.npz').strpath
+    true = tables[0]
+    true.loc[1, 'sample_id'] = np.nan
+    write_npz(true, filename)
+    test = read_npz(filename)
+
+    assert test['sample_id'].dtype.name == 'category'
+    assert test['notes'].dtype.name == 'category'
+    pdt.assert_frame_equal(test, true, check_categorical=False,
+                           check_dtype=False)
+
+
+@pytest.mark.parametrize('index', [False, True])
+def test_append_csv_file(tables, tmpdir, index):
+    from outrigger.io.tables import append_csv_file
+
+    true = pd.concat(tables, ignore_index=True)
+    source = tmpdir.join('source.csv').strpath
+    target = tmpdir.join('target.csv').strpath
+    tables[1].to_csv(source, index=False, na_rep='NA')
+    # The target has all the columns, even if they're empty
+    true.iloc[:len(tables[0])].to_csv(target, index=index, na_rep='NA')
+
+    append_csv_file(source, target, index=index, chunksize=1)
+
+    test = pd.read_csv(target, index_col=0 if index else None)
+    pdt.assert_frame_equal(test, true)
+
+
+def test_append_csv_file_extra_columns(tables, tmpdir):
+    from outrigger.io.tables import append_csv_file
+
+    source = tmpdir.join('source.csv').strpath
+    target = tmpdir.join('target.csv').strpath
+    tables[1].to_csv(source, index=False)
+    tables[0].to_csv(target, index=False)
+
+    with pytest.raises(ValueError):
+        append_csv_file(source, target)
+
+
+@pytest.mark.parametrize('n_rows', [0, 1, 3])
+def test__last_index(tables, tmpdir, n_rows):
+    from outrigger.io.tables import _last_index
+
+    csv = tmpdir.join('table.csv').strpath
+    df = tables[0].iloc[:n_rows]
+    df.index = df.index + 10
+    df.to_csv(csv)
+
+    assert _last_index(csv) == (n_rows + 9 if n_rows > 0 else -1)
+
+
+@pytest.mark.parametrize('chunksize', [1, 100])
+def test_join_csv(tables, tmpdir, chunksize):
+    from outrigger.io.tables import join_csv
+
+    csv = tmpdir.join('table.csv').strpath
+    df = tables[0].set_index('sample_id').iloc[:2]
+    df.to_csv(csv, na_rep='NA')
+    new = pd.DataFrame({'new': [2.0, 3.0]}, index=['b', 'z'])
+
+    join_csv(csv, new, chunksize=chunksize)
+
+    true = df.join(new)
+    test = pd.read_csv(csv, index_col=0)
+    pdt.assert_frame_equal(test, true)
+
+
+def test_read_unique(tables, tmpdir):
+    from outrigger.io.tables import read_unique
+
+    csv = tmpdir.join('table.csv').strpath
+    tables[0].to_csv(csv, index=False)
+
+    sample_ids, junction12 = read_unique(
+        csv, ['sample_id', 'isoform2_junction12'], chunksize=1)
+    pdt.assert_index_equal(sample_ids, pd.Index(['a', 'b']))
+    pdt.assert_index_equal(junction12, pd.Index(['0', '10', '3']))
+
+
+@pytest.mark.parametrize('chunksize', [1, 100])
+def test_split_csv(tables, tmpdir, chunksize):
+    from outrigger.io.tables import split_csv
+
+    csv = tmpdir.join('table.csv').strpath
+    df = tables[0]
+    df.to_csv(csv, index=False, na_rep='NA')
+    filenames = [tmpdir.join('{}.csv'.format(i)).strpath for i in range(3)]
+
+    split_csv(csv, 'sample_id', {'a': 1, 'b': 0}, filenames,
+              chunksize=chunksize)
+
+    for filename, true in zip(filenames, [df.iloc[[1]], df.iloc[[0, 2]],
+                                          df.iloc[[]]]):
+        test = pd.read_csv(filename)
+        true.index = range(len(true))
+        pdt.assert_frame_equal(test, true, check_dtype=False,
+                               check_index_type=False)
+
+
+@pytest.mark.parametrize('chunksize', [1, 100])
+def test_paste_csvs(tables, tmpdir, chunksize):
+    from outrigger.io.tables import paste_csvs
+
+    df = tables[0].set_index('sample_id')
+    filenames = []
+    for i, column in enumerate(df):
+        filename = tmpdir.join('{}.csv'.format(i)).strpath
+        df[[column]].to_csv(filename, na_rep='NA')
+        filenames.append(filename)
+    csv = tmpdir.join('pasted.csv').strpath
+
+    paste_csvs(filenames, csv, chunksize=chunksize)
+
+    pdt.assert_frame_equal(pd.read_csv(csv, index_col=0), df)
+
+
+def test_paste_csvs_different_rows(tables, tmpdir):
+    from outrigger.io.tables import paste_csvs
+
+    df = tables[0].set_index('sample_id')
+    filenames = [tmpdir.join('0.csv').strpath, tmpdir.join('1.csv').strpath]
+    df.to_csv(filenames[0])
+    df.iloc[1:].to_csv(filenames[1])
+
+    with pytest.raises(ValueError):
+        paste_csvs(filenames, tmpdir.join('pasted.csv').strpath)
+
+
+def test_read_rows(tmpdir):
+    from outrigger.io.tables import read_rows
+
+    df = pd.DataFrame({'a': ['x', 'y', 'z', 'x'], 'b': [1, 2, 3, 4]},
+                      columns=['a', 'b'])
+    csv = tmpdir.join('table.csv').strpath
+    df.to_csv(csv, index=False)
+
+    test = read_rows(csv, {'a': ['x', 'z'], 'b': [3, 4]}, chunksize=1)
+    pdt.assert_frame_equal(test, df.iloc[2:])
+
+    test, (a,) = read_rows(csv, {'b': [3]}, chunksize=1, unique=['a'])
+    pdt.assert_frame_equal(test, df.iloc[2:3])
+    pdt.assert_index_equal(a, pd.Index(['x', 'y', 'z']))
+
+
+def test_concatenate_npzs(tables, tmpdir):
+    from outrigger.io.tables import write_npz, read_npz, concatenate_npzs
+
+    df = tables[0]
+    df.loc[1, 'sample_id'] = np.nan
+    filenames = []
+    for i, rows in enumerate([[0], [1, 2], []]):
+        filename = tmpdir.join('{}.npz'.format(i)).strpath
+        write_npz(df.iloc[rows], filename)
+        filenames.append(filename)
+    true = tmpdir.join('true.npz').strpath
+    write_npz(df, true)
+    npz = tmpdir.join('concatenated.npz').strpath
+
+    concatenate_npzs(filenames, npz)
+
+    pdt.assert_frame_equal(read_npz(npz), read_npz(true))
+
+
+def test_concatenate_npzs_different_columns(tables, tmpdir):
+    from outrigger.io.tables import write_npz, concatenate_npzs
+
+    filenames = [tmpdir.join('0.npz').strpath, tmpdir.join('1.npz').strpath]
+    write_npz(tables[0], filenames[0])
+    write_npz(tables[1], filenames[1])
+
+    with pytest.raises(ValueError):
+        concatenate_npzs(filenames, tmpdir.join('concatenated.npz').strpath)
@@ -0,0 +1,105 @@
+import os
+
+import pandas as pd
+import pandas.util.testing as pdt
+import pytest
+
+
+@pytest.fixture
+def reads_csv(tasic2016_outrigger_output):
+    return os.path.join(tasic2016_outrigger_output, 'junctions', 'reads.csv')
+
+
+@pytest.fixture
+def true_psi(tasic2016_outrigger_output):
+    """(samples, events) Psi of all events and samples"""
+    csv = os.path.join(tasic2016_outrigger_output, 'psi', 'outrigger_psi.csv')
+    return pd.read_csv(csv, index_col=0).T
+
+
+def test_query(tasic2016_outrigger_output_index, reads_csv, true_psi):
+    from outrigger.psi.query import query
+
+    events = true_psi.columns[::3]
+    samples = true_psi.index[:2]
+    test_psi, test_summary = query(tasic2016_outrigger_output_index,
+                                   reads_csv, events=events, samples=samples)
+
+    # Every requested event and sample is calculated, even without reads
+    assert test_psi.shape == (len(samples), len(events))
+    true = true_psi.loc[test_psi.index, test_psi.columns]
+    pdt.assert_frame_equal(test_psi, true, check_names=False)
+    assert set(test_summary['sample_id']) == set(samples)
+    assert set(test_summary['event_id']) == set(test_psi.columns)
+    assert set(test_summary['splice_type']) <= {'se', 'mxe'}
+
+
+def test_query_samples_without_reads(tmpdir,
+                                     tasic2016_outrigger_output_index,
+                                     reads_csv, true_psi):
+    from outrigger.psi.query import query
+
+    junction_reads = pd.read_csv(reads_csv)
+    # Only has reads of a junction which isn't in any event
+    no_reads = junction_reads.iloc[:1].copy()
+    no_reads['sample_id'] = 'no_reads'
+    no_reads['junction_id'] = 'junction:chr1:1-2:+'
+    csv = tmpdir.join('reads.csv').strpath
+    pd.concat([junction_reads, no_reads], ignore_index=True).to_csv(
+        csv, index=False)
+
+    events = true_psi.columns[:5]
+    samples = [true_psi.index[0], 'no_reads']
+    test_psi, test_summary = query(tasic2016_outrigger_output_index, csv,
+                                   events=events, samples=samples)
+
+    assert test_psi.shape == (len(samples), len(events))
+    assert test_psi.loc['no_reads'].isnull().all()
+    pdt.assert_frame_equal(
+        test_psi.loc[[samples[0]]],
+        true_psi.loc[[samples[0]], test_psi.columns], check_names=False)
+
+
+def test_query_reads2d(tasic2016_outrigger_output_index, reads_csv,
+                       true_psi):
+    from outrigger.psi.query import query
+    from outrigger.psi.reads import SparseReads
+
+    junction_reads = pd.read_csv(reads_csv)
+    reads2d = junction_reads.pivot(index='sample_id', columns='junction_id',
+                                   values='reads').fillna(0).astype(int)
+    events = true_psi.columns[:5]
+
+    csv_psi, csv_summary = query(tasic2016_outrigger_output_index,
+                                 reads_csv, events=events)
+    for reads in (reads2d, SparseReads.from_tall(junction_reads)):
+        test_psi, test_summary = query(tasic2016_outrigger_output_index,
+                                       reads, events=events)
+        pdt.assert_frame_equal(test_psi, csv_psi)
+        pdt.assert_frame_equal(test_summary, csv_summary)
+
+
+def test_query_genes(tasic2016_outrigger_output_index, reads_csv):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi.query import events_csv, query
+    from outrigger.psi.vectorized import calculate_psi
+
+    test_psi, test_summary = query(tasic2016_outrigger_output_index,
+                                   reads_csv, genes=['Snap25'],
+                                   splice_types=['se'])
+
+    # Same events as the query reads, validated if there are any
+    events = pd.read_csv(events_csv(tasic2016_outrigger_output_index, 'se'),
+                         index_col=0)
+    snap25 = events.loc[(events['isoform1_gene_name'] == 'Snap25')
+                        | (events['isoform2_gene_name'] == 'Snap25')]
+    assert len(test_psi.columns) > 0
+    assert set(test_psi.columns) == set(snap25.index)
+
+    junction_reads = pd.read_csv(reads_csv)
+    reads2d = junction_reads.pivot(index='sample_id', columns='junction_id',
+                                   values='reads').fillna(0).astype(int)
+    true_psi, true_summary = calculate_psi(snap25, reads2d, n_jobs=1,
+                                           **ISOFORM_JUNCTIONS['se'])
+    pdt.assert_frame_equal(test_psi.loc[true_psi.index, true_psi.columns],
+                           true_psi, check_names=False)
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdt
+import pytest
+
+
+@pytest.fixture
+def sparse_reads(junction_reads):
+    from outrigger.psi.reads import SparseReads
+
+    return SparseReads.from_tall(junction_reads)
+
+
+@pytest.fixture
+def dense_reads(junction_reads):
+    from outrigger.common import SAMPLE_ID, JUNCTION_ID, READS
+
+    reads2d = junction_reads.pivot(index=SAMPLE_ID, columns=JUNCTION_ID,
+                                   values=READS)
+    return reads2d.fillna(0).astype(int)
+
+
+class TestSparseReads(object):
+
+    def test_from_tall(self, sparse_reads, dense_reads):
+        assert sparse_reads.shape == dense_reads.shape
+        assert sparse_reads.matrix.nnz < np.prod(dense_reads.shape)
+        pdt.assert_index_equal(sparse_reads.index, dense_reads.index,
+                               check_names=False)
+        pdt.assert_index_equal(sparse_reads.columns, dense_reads.columns,
+                               check_names=False)
+        pdt.assert_frame_equal(sparse_reads.to_frame(), dense_reads,
+                               check_names=False)
+
+    def test_from_tall_samples(self, junction_reads, dense_reads):
+        from outrigger.psi.reads import SparseReads
+
+        samples = dense_reads.index.tolist() + ['no_reads']
+        sparse_reads = SparseReads.from_tall(junction_reads, samples=samples)
+
+        true = dense_reads.reindex(index=samples).fillna(0).astype(int)
+        pdt.assert_frame_equal(sparse_reads.to_frame(), true,
+                               check_names=False)
+
+    def test___init__wrong_shape(self):
+        from outrigger.psi.reads import SparseReads
+
+        with pytest.raises(ValueError):
+            SparseReads(np.zeros((2, 3)), index=['a', 'b'],
+                        columns=['x', 'y'])
+
+    def test_take(self, sparse_reads, dense_reads):
+        positions = [3, 0, 3]
+        np.testing.assert_array_equal(sparse_reads.take(positions),
+                                      dense_reads.values[:, positions])
+
+    def test_reindex(self, sparse_reads, dense_reads):
+        columns = ['new'] + dense_reads.columns[::-2].tolist()
+        test = sparse_reads.reindex(columns)
+        pdt.assert_frame_equal(test.to_frame(),
+                               dense_reads.reindex(columns=columns,
+                                                   fill_value=0),
+                               check_names=False)
+
+
+@pytest.mark.parametrize('positions', [[[0, 2], [2, -1]], [5, 1, 5], []])
+def test_take_columns(sparse_reads, dense_reads, positions):
+    from outrigger.psi.reads import take_columns
+
+    positions = np.array(positions, dtype=int)
+    true = dense_reads.values[:, positions]
+    true[:, positions < 0] = 0
+
+    for reads2d in (sparse_reads, dense_reads, dense_reads.values):
+        test = take_columns(reads2d, positions)
+        assert test.shape == (dense_reads.shape[0],) + positions.shape
+        np.testing.assert_array_equal(test, true)
+
+
+def test_pivot_reads(junction_reads, dense_reads):
+    from outrigger.psi.reads import pivot_reads
+
+    test = pivot_reads(junction_reads)
+    pdt.assert_frame_equal(test, dense_reads)
+
+
+def test_pivot_reads_samples_junctions(junction_reads, dense_reads):
+    from outrigger.psi.reads import pivot_reads
+
+    samples = ['no_reads'] + dense_reads.index[::2].tolist()
+    junctions = dense_reads.columns[1::3].tolist() + ['no_reads']
+    test = pivot_reads(junction_reads, samples=samples, junctions=junctions)
+
+    true = dense_reads.reindex(index=samples, columns=junctions)
+    true = true.fillna(0).astype(int)
+    pdt.assert_frame_equal(test, true, check_names=False)
+
+
+def test_duplicated_reads(junction_reads):
+    from outrigger.psi.reads import SparseReads, pivot_reads
+
+    duplicated = pd.concat([junction_reads, junction_reads.iloc[:1]],
+                           ignore_index=True)
+    with pytest.raises(ValueError):
+        pivot_reads(duplicated)
+    with pytest.raises(ValueError):
+        SparseReads.from_tall(duplicated)
+
+
+def test_column_max(sparse_reads, dense_reads):
+    from outrigger.psi.reads import column_max
+
+    true = dense_reads.values.max(axis=0)
+    np.testing.assert_array_equal(column_max(dense_reads), true)
+    np.testing.assert_array_equal(column_max(sparse_reads), true)
+    np.testing.assert_array_equal(column_max(dense_reads.iloc[:0]),
+                                  np.zeros(dense_reads.shape[1]))
+
+
+def test_memmap_reads(sparse_reads, dense_reads, tmpdir):
+    from outrigger.psi.reads import memmap_reads, take_columns
+
+    positions = np.arange(dense_reads.shape[1])
+    for reads in (sparse_reads, dense_reads.values):
+        with memmap_reads(reads, temp_folder=tmpdir.strpath) as memmapped:
+            assert len(tmpdir.listdir()) == 1
+            if reads is sparse_reads:
+                assert isinstance(memmapped.matrix.data, np.memmap)
+            else:
+                assert isinstance(memmapped, np.memmap)
+            np.testing.assert_array_equal(
+                take_columns(memmapped, positions), dense_reads.values)
+        # The memory-mapped file is cleaned up afterwards
+        assert len(tmpdir.listdir()) == 0
@@ -0,0 +1,139 @@
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdt
+import pytest
+
+
+@pytest.fixture
+def reads_csv(tasic2016_outrigger_output):
+    return os.path.join(tasic2016_outrigger_output, 'junctions', 'reads.csv')
+
+
+@pytest.fixture
+def true_psi(tasic2016_outrigger_output):
+    """(samples, events) Psi of all events and samples"""
+    csv = os.path.join(tasic2016_outrigger_output, 'psi', 'outrigger_psi.csv')
+    return pd.read_csv(csv, index_col=0).T
+
+
+@pytest.fixture(params=[False, True], ids=['dense', 'sparse'])
+def store(request, tasic2016_outrigger_output_index, reads_csv):
+    from outrigger.psi.server import PsiStore
+
+    return PsiStore(tasic2016_outrigger_output_index, reads_csv,
+                    sparse=request.param)
+
+
+def test_psi_store(store, true_psi):
+    events = true_psi.columns[::3]
+    samples = true_psi.index[:2]
+    test_psi, test_cases = store.psi(events=events, samples=samples)
+
+    true = true_psi.loc[samples, events]
+    test = test_psi.reindex(index=true.index, columns=true.columns)
+    pdt.assert_frame_equal(test, true, check_names=False)
+    assert test_cases.shape == test_psi.shape
+
+
+def test_psi_store_genes(store, tasic2016_outrigger_output_index,
+                         reads_csv):
+    from outrigger.psi.query import query
+
+    test_psi, test_cases = store.psi(genes=['Snap25'], splice_types=['se'])
+
+    # Same events of the same index as a query
+    true_psi, true_summary = query(tasic2016_outrigger_output_index,
+                                   reads_csv, genes=['Snap25'],
+                                   splice_types=['se'])
+    assert len(test_psi.columns) > 0
+    pdt.assert_frame_equal(test_psi, true_psi, check_names=False)
+
+
+def test_psi_store_n_jobs(tasic2016_outrigger_output_index, reads_csv,
+                          monkeypatch):
+    from outrigger.psi import vectorized
+    from outrigger.psi.server import PsiStore
+
+    true_psi, true_cases = PsiStore(tasic2016_outrigger_output_index,
+                                    reads_csv).psi()
+
+    # Several blocks of events, calculated in parallel by threads which
+    # share the cached reads, instead of memory-mapping them again
+    def memmap_reads(*args, **kwargs):
+        raise AssertionError('The reads were memory-mapped')
+    monkeypatch.setattr(vectorized, 'MIN_CHUNK_SIZE', 1)
+    monkeypatch.setattr(vectorized, 'memmap_reads', memmap_reads)
+    store = PsiStore(tasic2016_outrigger_output_index, reads_csv, n_jobs=2)
+    test_psi, test_cases = store.psi()
+    pdt.assert_frame_equal(test_psi, true_psi)
+    pdt.assert_frame_equal(test_cases, true_cases)
+
+
+def test_psi_store_add_samples(store, reads_csv, true_psi):
+    junction_reads = pd.read_csv(reads_csv)
+    sample = true_psi.index[0]
+    new = junction_reads.loc[junction_reads['sample_id'] == sample].copy()
+    new['sample_id'] = 'new_sample'
+
+    added = store.add_samples(new)
+    assert added.tolist() == ['new_sample']
+    test_psi, test_cases = store.psi(samples=[sample, 'new_sample'])
+    np.testing.assert_array_equal(test_psi.loc['new_sample'].values,
+                                  test_psi.loc[sample].values)
+
+    with pytest.raises(ValueError):
+        store.add_samples(new)
+
+
+def test_psi_store_invalid_splice_type(store):
+    with pytest.raises(ValueError):
+        store.psi(splice_types=['ri'])
+
+
+def test_application(store, reads_csv, true_psi):
+    from wsgiref.util import setup_testing_defaults
+
+    from outrigger.psi.server import application
+
+    app = application(store)
+
+    def request(path, query='', method='GET', body=b''):
+        environ = {'PATH_INFO': path, 'QUERY_STRING': query,
+                   'REQUEST_METHOD': method,
+                   'CONTENT_LENGTH': str(len(body)),
+                   'wsgi.input': io.BytesIO(body)}
+        setup_testing_defaults(environ)
+        statuses = []
+        data = app(environ, lambda status, headers: statuses.append(status))
+        return statuses[0], json.loads(b''.join(data).decode('utf-8'))
+
+    events = true_psi.columns[:3]
+    samples = true_psi.index[:2]
+    status, body = request('/psi', 'events={}&samples={}'.format(
+        ','.join(events), ','.join(samples)))
+    assert status == '200 OK'
+    test = pd.DataFrame(body['psi'], index=body['samples'],
+                        columns=body['events'], dtype=float)
+    true = true_psi.loc[test.index, test.columns]
+    pdt.assert_frame_equal(test, true, check_names=False)
+
+    status, body = request('/samples')
+    assert status == '200 OK'
+    assert body == store.samples.tolist()
+
+    junction_reads = pd.read_csv(reads_csv)
+    new = junction_reads.loc[junction_reads['sample_id'] == samples[0]]
+    new = new.assign(sample_id='new_sample')
+    status, body = request('/samples', method='POST',
+                           body=new.to_csv(index=False).encode('utf-8'))
+    assert status == '200 OK'
+    assert body == ['new_sample']
+
+    status, body = request('/psi', 'splice_types=ri')
+    assert status == '400 Bad Request'
+    status, body = request('/nothing')
+    assert status == '404 Not Found'
@@ -0,0 +1,37 @@
+import pytest
+
+
+@pytest.mark.parametrize('shard, true', [('1/4', (1, 4)), ('4/4', (4, 4))])
+def test_parse_shard(shard, true):
+    from outrigger.psi.shards import parse_shard
+
+    assert parse_shard(shard) == true
+
+
+@pytest.mark.parametrize('shard', ['0/4', '5/4', '1', '1/x', '1/2/3'])
+def test_parse_shard_invalid(shard):
+    from outrigger.psi.shards import parse_shard
+
+    with pytest.raises(ValueError):
+        parse_shard(shard)
+
+
+@pytest.mark.parametrize('n', [1, 3, 7, 12])
+def test_shard_items(n):
+    from outrigger.psi.shards import shard_items
+
+    items = ['sample{:02d}'.format(i) for i in range(10)][::-1]
+    test = [shard_items(items, i, n) for i in range(1, n + 1)]
+
+    # Every item is in exactly one shard, in sorted order
+    assert sum(test, []) == sorted(items)
+    sizes = [len(x) for x in test]
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_shard_items_key():
+    from outrigger.psi.shards import shard_items
+
+    filenames = ['b/sample1.bam', 'a/sample2.bam', 'c/sample0.bam']
+    test = shard_items(filenames, 1, 2, key=lambda x: x.split('/')[1])
+    assert test == ['c/sample0.bam']
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdt
+import pytest
+
+
+@pytest.fixture
+def event_annotation():
+    return pd.DataFrame(
+        {'junction13': ['j1', 'j1', 'j3', 'j2'],
+         'junction12': ['j2', 'j2', 'j4', 'j5'],
+         'junction23': ['j3', 'j3', 'j5', 'j6'],
+         'incompatible_junctions': ['j6|j4|j6', 'j6|j4|j6', np.nan, 'j9']},
+        index=pd.Index(['event2', 'event2', 'event1', 'event3'],
+                       name='event_id'))
+
+
+@pytest.fixture
+def event_junctions(event_annotation):
+    from outrigger.common import SE_ISOFORM1_JUNCTIONS, SE_ISOFORM2_JUNCTIONS
+    from outrigger.psi.slots import EventJunctions
+
+    return EventJunctions.from_annotation(
+        event_annotation, SE_ISOFORM1_JUNCTIONS, SE_ISOFORM2_JUNCTIONS)
+
+
+class TestEventJunctions(object):
+
+    def test_from_annotation(self, event_junctions):
+        from outrigger.psi.slots import MISSING
+
+        pdt.assert_index_equal(event_junctions.event_ids,
+                               pd.Index(['event1', 'event2', 'event3'],
+                                        name='event_id'))
+        pdt.assert_index_equal(
+            event_junctions.junctions,
+            pd.Index(['j1', 'j2', 'j3', 'j4', 'j5', 'j6', 'j9']))
+        np.testing.assert_array_equal(event_junctions.isoform1,
+                                      [[2], [0], [1]])
+        np.testing.assert_array_equal(event_junctions.isoform2,
+                                      [[3, 4], [1, 2], [4, 5]])
+        np.testing.assert_array_equal(
+            event_junctions.incompatible,
+            [[MISSING, MISSING, MISSING], [5, 3, 5], [6, MISSING, MISSING]])
+
+    def test_resolve(self, event_junctions):
+        from outrigger.psi.slots import MISSING
+
+        # No j1 so event2 is dropped, and no j9 so event3 has no incompatible
+        # junctions
+        junction_ids = pd.Index(['j6', 'j5', 'j4', 'j3', 'j2'])
+        event_ids, isoform1, isoform2, incompatible = \
+            event_junctions.resolve(junction_ids)
+
+        pdt.assert_index_equal(event_ids, pd.Index(['event1', 'event3'],
+                                                   name='event_id'))
+        np.testing.assert_array_equal(isoform1, [[3], [4]])
+        np.testing.assert_array_equal(isoform2, [[2, 1], [1, 0]])
+        assert incompatible.shape == (2, 0)
+
+        junction_ids = pd.Index(['j6', 'j5', 'j4', 'j3', 'j2', 'j1'])
+        event_ids, isoform1, isoform2, incompatible = \
+            event_junctions.resolve(junction_ids)
+        # Same order as the junction ids, without duplicates
+        np.testing.assert_array_equal(
+            incompatible, [[MISSING, MISSING], [0, 2], [MISSING, MISSING]])
+
+    def test_subset(self, event_junctions):
+        subset = event_junctions.subset(['event3', 'event1', 'event1'])
+
+        pdt.assert_index_equal(subset.event_ids,
+                               pd.Index(['event1', 'event3'],
+                                        name='event_id'))
+        np.testing.assert_array_equal(subset.isoform2, [[3, 4], [4, 5]])
+        pdt.assert_index_equal(subset.junctions, event_junctions.junctions)
+
+    def test_present(self, event_junctions):
+        from outrigger.psi.slots import MISSING
+
+        # No j1 so event2 is dropped, and no j9 so it's missing from event3
+        present = event_junctions.present(['j6', 'j5', 'j4', 'j3', 'j2'])
+
+        pdt.assert_index_equal(present.event_ids,
+                               pd.Index(['event1', 'event3'],
+                                        name='event_id'))
+        pdt.assert_index_equal(present.junctions,
+                               pd.Index(['j2', 'j3', 'j4', 'j5', 'j6']))
+        np.testing.assert_array_equal(present.isoform1, [[1], [0]])
+        np.testing.assert_array_equal(present.isoform2, [[2, 3], [3, 4]])
+        assert (present.incompatible == MISSING).all()
+
+    def test_save_load(self, event_junctions, tmpdir):
+        from outrigger.psi.slots import EventJunctions
+
+        filename = tmpdir.join('junction_slots.npz').strpath
+        event_junctions.save(filename)
+        test = EventJunctions.load(filename)
+
+        pdt.assert_index_equal(test.event_ids, event_junctions.event_ids,
+                               check_names=False)
+        pdt.assert_index_equal(test.junctions, event_junctions.junctions)
+        for name in ('isoform1', 'isoform2', 'incompatible'):
+            np.testing.assert_array_equal(getattr(test, name),
+                                          getattr(event_junctions, name))
+
+    def test___init__wrong_shape(self):
+        from outrigger.psi.slots import EventJunctions
+
+        with pytest.raises(ValueError):
+            EventJunctions(['event1', 'event2'], ['j1', 'j2'],
+                           np.zeros((2, 1)), np.zeros((1, 2)),
+                           np.zeros((2, 0)))
@@ -0,0 +1,817 @@
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdt
+import pytest
+
+
+@pytest.fixture
+def random_junction_ids():
+    return ['junction:chr1:{}-{}:+'.format(i * 100, i * 100 + 50)
+            for i in range(12)]
+
+
+@pytest.fixture
+def random_reads2d(random_junction_ids):
+    """Junction reads with lots of zeros, a few small and a few big counts"""
+    random_state = np.random.RandomState(2017)
+    n_samples = 50
+    shape = n_samples, len(random_junction_ids)
+    reads = random_state.choice([0, 0, 0, 1, 5, 9, 10, 11, 50, 200, 1000],
+                                size=shape)
+    index = pd.Index(['sample{}'.format(i) for i in range(n_samples)],
+                     name='sample_id')
+    return pd.DataFrame(reads, index=index, columns=random_junction_ids)
+
+
+@pytest.fixture
+def random_event_annotation(splice_type, random_junction_ids):
+    """Events made of random junctions, some of which are not in the data"""
+    from outrigger.common import ISOFORM_JUNCTIONS, INCOMPATIBLE_JUNCTIONS
+
+    random_state = np.random.RandomState(0)
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    junction_numbers = isoform_junctions['isoform1_junctions'] \
+        + isoform_junctions['isoform2_junctions']
+    not_in_data = 'junction:chr2:100-200:+'
+
+    rows = []
+    for i in range(40):
+        junctions = random_state.choice(random_junction_ids,
+                                        size=len(junction_numbers),
+                                        replace=False).tolist()
+        if i % 13 == 0:
+            junctions[-1] = not_in_data
+        row = dict(zip(junction_numbers, junctions))
+
+        n_incompatible = random_state.randint(0, 4)
+        others = [x for x in random_junction_ids if x not in junctions]
+        incompatible = random_state.choice(
+            others + [not_in_data], size=n_incompatible).tolist()
+        row[INCOMPATIBLE_JUNCTIONS] = '|'.join(incompatible) \
+            if incompatible else np.nan
+        rows.append(row)
+
+        # Events have multiple rows with the same junctions
+        if i % 5 == 0:
+            rows.append(row)
+    index = ['event{}'.format(i) for i in range(len(rows))]
+    # Same event ids for duplicated rows
+    index = [name if i == 0 or rows[i] is not rows[i - 1]
+             else index[i - 1] for i, name in enumerate(index)]
+    return pd.DataFrame(rows, index=pd.Index(index, name='event_id'))
+
+
+@pytest.fixture(params=[(10, 10, 'mean'), (1, 2, 'min'), (30, 3, 'mean'),
+                        (0, 10, 'mean')],
+                ids=['default', 'min', 'high min_reads', 'zero min_reads'])
+def psi_parameters(request):
+    min_reads, uneven_coverage_multiplier, method = request.param
+    return dict(min_reads=min_reads,
+                uneven_coverage_multiplier=uneven_coverage_multiplier,
+                method=method)
+
+
+def _per_event_psi(event_annotation, reads2d, psi_parameters,
+                   isoform_junctions):
+    """Calculate psi one event at a time"""
+    from outrigger.common import SAMPLE_ID, EVENT_ID, PSI
+    from outrigger.psi.compute import _maybe_parallelize_psi
+
+    summaries = _maybe_parallelize_psi(event_annotation, reads2d, n_jobs=1,
+                                       **dict(psi_parameters,
+                                              **isoform_junctions))
+    summary = pd.concat(summaries, ignore_index=True)
+    psi = summary.pivot(index=SAMPLE_ID, columns=EVENT_ID, values=PSI)
+    return psi, summary
+
+
+def test_calculate_psi_matches_per_event(random_event_annotation,
+                                         random_reads2d, splice_type,
+                                         psi_parameters):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi.vectorized import calculate_psi
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    true_psi, true_summary = _per_event_psi(
+        random_event_annotation, random_reads2d, psi_parameters,
+        isoform_junctions)
+
+    test_psi, test_summary = calculate_psi(
+        random_event_annotation, random_reads2d, n_jobs=1,
+        **dict(psi_parameters, **isoform_junctions))
+
+    pdt.assert_frame_equal(test_psi, true_psi)
+    # Events that aren't in the data add empty "object" columns to the per
+    # event summaries, so only the values need to match
+    pdt.assert_frame_equal(test_summary, true_summary, check_dtype=False)
+
+
+def test_calculate_psi_uncovered(random_event_annotation, random_reads2d,
+                                 splice_type, psi_parameters, monkeypatch):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    # Junctions without reads in any sample, and samples with few reads
+    reads2d = random_reads2d.copy()
+    reads2d.iloc[:, :4] = 0
+    reads2d.iloc[:20] = reads2d.iloc[:20].clip(upper=5)
+    true_psi, true_summary = _per_event_psi(
+        random_event_annotation, reads2d, psi_parameters, isoform_junctions)
+
+    n_classified = []
+    classify = vectorized.classify
+
+    def counted_classify(isoform1, *args, **kwargs):
+        n_classified.append(isoform1.shape[0])
+        return classify(isoform1, *args, **kwargs)
+
+    monkeypatch.setattr(vectorized, 'classify', counted_classify)
+    test_psi, test_summary = vectorized.calculate_psi(
+        random_event_annotation, reads2d, n_jobs=1,
+        **dict(psi_parameters, **isoform_junctions))
+
+    pdt.assert_frame_equal(test_psi, true_psi)
+    pdt.assert_frame_equal(test_summary, true_summary, check_dtype=False)
+    if psi_parameters['min_reads'] > 0:
+        # Only samples and events with sufficient reads are classified
+        assert sum(n_classified) < test_psi.size
+
+
+@pytest.mark.parametrize('max_block_size', [1, 100, 1000])
+def test_calculate_psi_blocks(random_event_annotation, random_reads2d,
+                              splice_type, n_jobs, max_block_size,
+                              monkeypatch, capsys):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    true_psi, true_summary = vectorized.calculate_psi(
+        random_event_annotation, random_reads2d, n_jobs=1,
+        **isoform_junctions)
+
+    monkeypatch.setattr(vectorized, 'MAX_BLOCK_SIZE', max_block_size)
+    test_psi, test_summary = vectorized.calculate_psi(
+        random_event_annotation, random_reads2d, n_jobs=n_jobs,
+        **isoform_junctions)
+
+    out, err = capsys.readouterr()
+    if n_jobs == 1:
+        assert 'Iterating' in out
+    else:
+        assert 'Parallelizing' in out
+
+    pdt.assert_frame_equal(test_psi, true_psi)
+    pdt.assert_frame_equal(test_summary, true_summary)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_calculate_psi_chunk_size(random_event_annotation, random_reads2d,
+                                  splice_type, chunk_size):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    true_psi, true_summary = vectorized.calculate_psi(
+        random_event_annotation, random_reads2d, n_jobs=1,
+        **isoform_junctions)
+
+    test_psi, test_summary = vectorized.calculate_psi(
+        random_event_annotation, random_reads2d, n_jobs=2,
+        chunk_size=chunk_size, **isoform_junctions)
+
+    pdt.assert_frame_equal(test_psi, true_psi)
+    pdt.assert_frame_equal(test_summary, true_summary)
+
+
+@pytest.mark.parametrize('backend', ['processes', 'threads', 'serial'])
+@pytest.mark.parametrize('sparse', [False, True])
+def test_calculate_psi_backend(random_event_annotation, random_reads2d,
+                               splice_type, backend, sparse, capsys):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+    from outrigger.psi.reads import SparseReads
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    true_psi, true_summary = vectorized.calculate_psi(
+        random_event_annotation, random_reads2d, n_jobs=1,
+        **isoform_junctions)
+
+    reads2d = random_reads2d
+    if sparse:
+        reads2d = SparseReads(random_reads2d.values,
+                              index=random_reads2d.index,
+                              columns=random_reads2d.columns)
+    capsys.readouterr()
+    test_psi, test_summary = vectorized.calculate_psi(
+        random_event_annotation, reads2d, n_jobs=2, chunk_size=7,
+        backend=backend, **isoform_junctions)
+    out, err = capsys.readouterr()
+
+    if backend == 'serial':
+        assert 'Iterating' in out
+    else:
+        assert 'across 2 {}'.format(backend) in out
+    pdt.assert_frame_equal(test_psi, true_psi)
+    pdt.assert_frame_equal(test_summary, true_summary)
+
+
+def test_calculate_psi_invalid_backend(random_event_annotation,
+                                       random_reads2d, splice_type):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+
+    with pytest.raises(ValueError):
+        vectorized.calculate_psi(
+            random_event_annotation, random_reads2d, n_jobs=2,
+            backend='gpu', **ISOFORM_JUNCTIONS[splice_type])
+
+
+def test_calculate_psi_chunk_size_invalid(random_event_annotation,
+                                          random_reads2d, splice_type):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+
+    with pytest.raises(ValueError):
+        vectorized.calculate_psi(
+            random_event_annotation, random_reads2d, n_jobs=1, chunk_size=0,
+            **ISOFORM_JUNCTIONS[splice_type])
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_calculate_psi_compact(random_event_annotation, random_reads2d,
+                               splice_type, sparse):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+    from outrigger.psi.reads import SparseReads
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    true_psi, true_summary = vectorized.calculate_psi(
+        random_event_annotation, random_reads2d, n_jobs=1,
+        **isoform_junctions)
+
+    reads2d = random_reads2d
+    if sparse:
+        reads2d = SparseReads(reads2d.values, index=reads2d.index,
+                              columns=reads2d.columns)
+    test_psi, test_summary = vectorized.calculate_psi(
+        random_event_annotation, reads2d, n_jobs=1, dtypes='compact',
+        **isoform_junctions)
+
+    assert (test_psi.dtypes == vectorized.PSI_DTYPE).all()
+    pdt.assert_frame_equal(test_psi, true_psi.astype(vectorized.PSI_DTYPE))
+
+    assert test_summary.columns.tolist() == true_summary.columns.tolist()
+    for column in test_summary.columns:
+        test, true = test_summary[column], true_summary[column]
+        if column in ('sample_id', 'event_id'):
+            assert test.dtype.name == 'category'
+            assert test.astype(object).tolist() == true.tolist()
+        elif column == 'notes':
+            pdt.assert_series_equal(test, true)
+        else:
+            if column.startswith('isoform'):
+                assert test.dtype == vectorized.READS_DTYPE
+            np.testing.assert_allclose(test.astype(float), true, rtol=1e-6)
+
+
+def test_calculate_psi_summary(random_event_annotation, random_reads2d,
+                               splice_type):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    true_psi, full = vectorized.calculate_psi(
+        random_event_annotation, random_reads2d, n_jobs=1, notes='code',
+        **isoform_junctions)
+
+    for summary in ('cases', 'counts', 'none'):
+        test_psi, test_summary = vectorized.calculate_psi(
+            random_event_annotation, random_reads2d, n_jobs=1,
+            summary=summary, **isoform_junctions)
+        pdt.assert_frame_equal(test_psi, true_psi)
+
+        if summary == 'cases':
+            pdt.assert_frame_equal(
+                test_summary, full[['sample_id', 'event_id', 'case']])
+        elif summary == 'counts':
+            true = full.groupby(['event_id', 'case'], sort=False).size()
+            true = true.rename('count').reset_index()
+            true['case'] = true['case'].astype(np.int8)
+            test = test_summary.sort_values(['event_id', 'case'])
+            true = true.sort_values(['event_id', 'case'])
+            test.index = true.index = range(len(true))
+            pdt.assert_frame_equal(test, true, check_dtype=False)
+        else:
+            assert test_summary is None
+
+
+def test_calculate_psi_invalid_summary(random_event_annotation,
+                                       random_reads2d, splice_type):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+
+    with pytest.raises(ValueError):
+        vectorized.calculate_psi(
+            random_event_annotation, random_reads2d, n_jobs=1,
+            summary='some', **ISOFORM_JUNCTIONS[splice_type])
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_calculate_psi_arrays(random_event_annotation, random_reads2d,
+                              splice_type, psi_parameters, sparse):
+    from scipy.sparse import csc_matrix
+
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+    from outrigger.psi.slots import EventJunctions
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    true_psi, true_summary = vectorized.calculate_psi(
+        random_event_annotation, random_reads2d, n_jobs=1, notes='code',
+        **dict(psi_parameters, **isoform_junctions))
+
+    event_ids, isoform1, isoform2, incompatible = \
+        EventJunctions.from_annotation(
+            random_event_annotation, **isoform_junctions).resolve(
+            random_reads2d.columns)
+    reads = random_reads2d.values
+    if sparse:
+        reads = csc_matrix(reads)
+    test_psi, test_cases = vectorized.calculate_psi_arrays(
+        reads, isoform1, isoform2, incompatible, **psi_parameters)
+
+    true = true_psi.reindex(index=random_reads2d.index, columns=event_ids)
+    np.testing.assert_array_equal(test_psi, true.values)
+    np.testing.assert_array_equal(test_cases.T.ravel(),
+                                  true_summary['case'].values)
+
+
+def test_calculate_psi_arrays_compact_missing_incompatible():
+    from outrigger.psi import vectorized
+    from outrigger.psi.slots import MISSING
+
+    # Samples x junctions, with many reads on the incompatible junction 4
+    reads = np.array([[20, 30, 25, 0, 50],
+                      [0, 40, 35, 12, 0],
+                      [15, 0, 0, 11, 3]], dtype=vectorized.READS_DTYPE)
+    isoform1 = np.array([[0], [0]])
+    isoform2 = np.array([[1, 2], [1, 3]])
+    # The second event has no incompatible junctions, so it's padded
+    incompatible = np.array([[4], [MISSING]])
+
+    incompatible_reads = vectorized._block_reads(
+        reads, isoform1, isoform2, incompatible)[2]
+    assert (incompatible_reads[1] < 0).all()
+
+    true_psi, true_cases = vectorized.calculate_psi_arrays(
+        reads.astype(int), isoform1, isoform2, incompatible)
+    test_psi, test_cases = vectorized.calculate_psi_arrays(
+        reads, isoform1, isoform2, incompatible, dtypes='compact')
+
+    np.testing.assert_array_equal(test_cases, true_cases)
+    np.testing.assert_allclose(test_psi, true_psi, rtol=1e-6)
+    assert true_cases[0, 0] == vectorized.CASE_INCOMPATIBLE
+    assert true_cases[0, 1] != vectorized.CASE_INCOMPATIBLE
+
+
+def test_calculate_psi_arrays_invalid_positions(random_reads2d):
+    from outrigger.psi import vectorized
+
+    reads = random_reads2d.values
+    isoform = np.array([[0, 1], [2, 3]])
+    with pytest.raises(ValueError):
+        vectorized.calculate_psi_arrays(reads, isoform, [[4], [-1]],
+                                        np.zeros((2, 0), dtype=int))
+    with pytest.raises(ValueError):
+        vectorized.calculate_psi_arrays(reads, isoform, [[4], [5]],
+                                        [[reads.shape[1]], [-1]])
+    with pytest.raises(ValueError):
+        vectorized.calculate_psi_arrays(reads, isoform, [[4]], [])
+
+
+def test_calculate_psi_invalid_dtypes(random_event_annotation,
+                                      random_reads2d, splice_type):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+
+    with pytest.raises(ValueError):
+        vectorized.calculate_psi(
+            random_event_annotation, random_reads2d, n_jobs=1,
+            dtypes='tiny', **ISOFORM_JUNCTIONS[splice_type])
+
+
+@pytest.mark.parametrize('n_events, n_jobs, true', [
+    # Serial: as many events as fit in a block
+    (100000, 1, 2 ** 22 // (100 * 3)),
+    # Parallel with few events: don't make tiny blocks
+    (5000, 4, 1000),
+    # Parallel with many events: a few blocks per processor
+    (100000, 4, 100000 // (4 * 4)),
+    # Parallel with many events: but at most MAX_BLOCK_SIZE reads per block
+    (10000000, 4, 2 ** 22 // (100 * 3))])
+def test__chunk_size(n_events, n_jobs, true):
+    from outrigger.psi.vectorized import _chunk_size
+
+    test = _chunk_size(n_events, n_samples=100, n_slots=3, n_jobs=n_jobs)
+    assert test == true
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_iter_psi(random_event_annotation, random_reads2d, splice_type,
+                  n_jobs, chunk_size):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    true_psi, true_summary = vectorized.calculate_psi(
+        random_event_annotation, random_reads2d, n_jobs=1,
+        notes='categorical', **isoform_junctions)
+
+    blocks = list(vectorized.iter_psi(
+        random_event_annotation, random_reads2d, n_jobs=n_jobs,
+        chunk_size=chunk_size, notes='categorical', **isoform_junctions))
+    n_events = true_psi.shape[1]
+    assert len(blocks) == -(-n_events // chunk_size)
+
+    test_psi = pd.concat([psi for psi, summary in blocks], axis=1)
+    test_summary = pd.concat([summary for psi, summary in blocks],
+                             ignore_index=True)
+    pdt.assert_frame_equal(test_psi, true_psi)
+    pdt.assert_frame_equal(test_summary, true_summary)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_iter_psi_shared_junction_sets(random_event_annotation,
+                                       random_reads2d, splice_type, n_jobs,
+                                       chunk_size, monkeypatch):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    # Copies of events with the same junctions, e.g. with different flanking
+    # exons, which are sorted into later blocks
+    first = random_event_annotation.loc[
+        ~random_event_annotation.index.duplicated()]
+    copies = first.iloc[:10].copy()
+    copies.index = 'z_copy_' + copies.index
+    event_annotation = pd.concat([random_event_annotation, copies])
+    true_psi, true_summary = _per_event_psi(
+        event_annotation, random_reads2d, {}, isoform_junctions)
+
+    n_calculated = []
+    block_psi = vectorized._block_psi
+
+    def counted_block_psi(reads, isoform1, *args, **kwargs):
+        n_calculated.append(len(isoform1))
+        return block_psi(reads, isoform1, *args, **kwargs)
+
+    monkeypatch.setattr(vectorized, '_block_psi', counted_block_psi)
+    blocks = list(vectorized.iter_psi(
+        event_annotation, random_reads2d, n_jobs=n_jobs,
+        chunk_size=chunk_size, **isoform_junctions))
+
+    test_psi = pd.concat([psi for psi, summary in blocks], axis=1)
+    test_summary = pd.concat([summary for psi, summary in blocks],
+                             ignore_index=True)
+    pdt.assert_frame_equal(test_psi, true_psi)
+    pdt.assert_frame_equal(test_summary, true_summary, check_dtype=False)
+
+    if n_jobs == 1:
+        # Every copy in the data is calculated only once
+        n_copies = test_psi.columns.str.startswith('z_copy_').sum()
+        assert n_copies > 0
+        assert sum(n_calculated) == test_psi.shape[1] - n_copies
+
+
+def test__junction_sets():
+    from outrigger.psi.vectorized import _junction_sets
+
+    isoform1 = np.array([[4], [1], [4], [2], [1]])
+    isoform2 = np.array([[3, 5], [3, 5], [3, 5], [6, 7], [3, 5]])
+    incompatible = np.array([[-1], [-1], [-1], [0], [0]])
+    first, keys = _junction_sets(isoform1, isoform2, incompatible)
+
+    np.testing.assert_array_equal(first, [0, 1, 3, 4])
+    np.testing.assert_array_equal(keys, [0, 1, 0, 2, 3])
+
+
+def test_iter_psi_long(random_event_annotation, random_reads2d, splice_type):
+    from outrigger.common import ISOFORM_JUNCTIONS, SAMPLE_ID, EVENT_ID, \
+        PSI, CASE
+    from outrigger.psi import vectorized
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    true_psi, true_summary = vectorized.calculate_psi(
+        random_event_annotation, random_reads2d, n_jobs=1, notes='code',
+        **isoform_junctions)
+    true = true_summary.dropna(subset=[PSI])[[SAMPLE_ID, EVENT_ID, PSI, CASE]]
+    true.index = range(len(true))
+
+    blocks = list(vectorized.iter_psi(
+        random_event_annotation, random_reads2d, n_jobs=1, chunk_size=7,
+        psi_format='long', **isoform_junctions))
+    test = pd.concat([psi for psi, summary in blocks], ignore_index=True)
+
+    pdt.assert_frame_equal(test, true)
+
+
+def test_iter_psi_invalid_psi_format(random_event_annotation, random_reads2d,
+                                     splice_type):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+
+    with pytest.raises(ValueError):
+        next(vectorized.iter_psi(
+            random_event_annotation, random_reads2d, n_jobs=1,
+            psi_format='tall', **ISOFORM_JUNCTIONS[splice_type]))
+
+
+def test_calculate_psi_sparse(random_event_annotation, random_reads2d,
+                              splice_type, n_jobs, monkeypatch):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+    from outrigger.psi.reads import SparseReads
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    true_psi, true_summary = vectorized.calculate_psi(
+        random_event_annotation, random_reads2d, n_jobs=1,
+        **isoform_junctions)
+
+    sparse_reads = SparseReads(random_reads2d.values, random_reads2d.index,
+                               random_reads2d.columns)
+    monkeypatch.setattr(vectorized, 'MAX_BLOCK_SIZE', 1000)
+    test_psi, test_summary = vectorized.calculate_psi(
+        random_event_annotation, sparse_reads, n_jobs=n_jobs,
+        **isoform_junctions)
+
+    pdt.assert_frame_equal(test_psi, true_psi)
+    pdt.assert_frame_equal(test_summary, true_summary)
+
+
+@pytest.mark.parametrize('dtypes', ['default', 'compact'])
+def test_reads_matrix(random_reads2d, dtypes):
+    from outrigger.psi.reads import SparseReads
+    from outrigger.psi.vectorized import reads_matrix, READS_DTYPE
+
+    test = reads_matrix(random_reads2d, dtypes)
+    assert isinstance(test, np.ndarray)
+    np.testing.assert_array_equal(test, random_reads2d.values)
+
+    sparse_reads = SparseReads(random_reads2d.values, random_reads2d.index,
+                               random_reads2d.columns)
+    test = reads_matrix(sparse_reads, dtypes)
+    assert isinstance(test, SparseReads)
+    pdt.assert_index_equal(test.columns, sparse_reads.columns)
+    if dtypes == 'compact':
+        assert test.matrix.dtype == READS_DTYPE
+    else:
+        assert test is sparse_reads
+
+
+def test_calculate_psi_event_junctions(random_event_annotation,
+                                       random_reads2d, splice_type):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+    from outrigger.psi.slots import EventJunctions
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    true_psi, true_summary = vectorized.calculate_psi(
+        random_event_annotation, random_reads2d, n_jobs=1,
+        **isoform_junctions)
+
+    event_junctions = EventJunctions.from_annotation(
+        random_event_annotation, **isoform_junctions)
+    test_psi, test_summary = vectorized.calculate_psi(
+        event_junctions, random_reads2d, n_jobs=1, **isoform_junctions)
+
+    pdt.assert_frame_equal(test_psi, true_psi)
+    pdt.assert_frame_equal(test_summary, true_summary)
+
+
+def test_junction_slots(random_event_annotation, random_reads2d,
+                        splice_type):
+    from outrigger.common import ISOFORM_JUNCTIONS, INCOMPATIBLE_JUNCTIONS
+    from outrigger.psi.vectorized import junction_slots, MISSING
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    junction_ids = random_reads2d.columns
+
+    event_ids, isoform1, isoform2, incompatible = junction_slots(
+        random_event_annotation, junction_ids, **isoform_junctions)
+
+    assert event_ids.is_monotonic_increasing
+    assert event_ids.is_unique
+    assert isoform1.shape == (len(event_ids),
+                              len(isoform_junctions['isoform1_junctions']))
+    assert isoform2.shape == (len(event_ids),
+                              len(isoform_junctions['isoform2_junctions']))
+    assert len(incompatible) == len(event_ids)
+
+    for event_id, positions in zip(event_ids, incompatible):
+        row = random_event_annotation.loc[[event_id]].iloc[0]
+        test = [junction_ids[i] for i in positions if i != MISSING]
+        if isinstance(row[INCOMPATIBLE_JUNCTIONS], float):
+            true = []
+        else:
+            true = junction_ids.intersection(
+                row[INCOMPATIBLE_JUNCTIONS].split('|')).tolist()
+        assert test == true
+
+
+@pytest.mark.parametrize('isoform1, isoform2, true', [
+    ([0], [0, 0], 'Case 2'),
+    ([1], [12, 12], 'Case 10b'),
+    ([15], [20, 20], 'Case 8'),
+    ([5], [5, 9], 'Case 3'),
+    ([10], [9, 9], 'Case 9b'),
+    ([200], [20, 9], 'Case 9a'),
+    ([20], [1000, 10], 'Case 5'),
+    ([0], [20, 20], 'Case 7'),
+    ([20], [0, 0], 'Case 6')])
+def test_classify(isoform1, isoform2, true):
+    from outrigger.psi.compute import _single_isoform_maybe_reject
+    from outrigger.psi.vectorized import classify, case_notes
+
+    cases = classify(np.array([isoform1]), np.array([isoform2]),
+                     np.empty((1, 0)))
+    test = case_notes()[cases[0]]
+
+    assert test.startswith(true + ':')
+    __, __, case = _single_isoform_maybe_reject(
+        pd.Series(isoform1), pd.Series(isoform2),
+        n_junctions=len(isoform1) + len(isoform2))
+    assert test == case
+
+
+@pytest.fixture
+def random_junction_reads(splice_type):
+    """Junction reads of many samples of one event, around the thresholds"""
+    from outrigger.common import ISOFORM_JUNCTIONS
+
+    random_state = np.random.RandomState(2017)
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    values = [0, 0, 1, 2, 5, 9, 10, 11, 30, 50, 200, 1000]
+    n_rows = 500
+    isoform1 = random_state.choice(values, size=(
+        n_rows, len(isoform_junctions['isoform1_junctions'])))
+    isoform2 = random_state.choice(values, size=(
+        n_rows, len(isoform_junctions['isoform2_junctions'])))
+    incompatible = random_state.choice([-1, -1, 0, 5, 10, 50],
+                                       size=(n_rows, 2))
+    return isoform1, isoform2, incompatible
+
+
+def test__classify_rows_matches_per_sample(random_junction_reads,
+                                           psi_parameters):
+    from outrigger.psi.compute import _single_isoform_maybe_reject
+    from outrigger.psi.vectorized import _classify_rows, case_notes
+
+    isoform1, isoform2, incompatible = random_junction_reads
+    min_reads = psi_parameters['min_reads']
+    uneven_coverage_multiplier = psi_parameters['uneven_coverage_multiplier']
+    # The per-sample implementation doesn't know about incompatible
+    # junctions
+    incompatible = np.empty((len(isoform1), 0), dtype=int)
+
+    cases = np.empty(len(isoform1), dtype=np.int8)
+    _classify_rows(isoform1, isoform2, incompatible, min_reads,
+                   uneven_coverage_multiplier, cases)
+    test = case_notes(min_reads, uneven_coverage_multiplier)[cases]
+
+    n_junctions = isoform1.shape[1] + isoform2.shape[1]
+    true = [_single_isoform_maybe_reject(
+        pd.Series(row1), pd.Series(row2), n_junctions=n_junctions,
+        min_reads=min_reads,
+        uneven_coverage_multiplier=uneven_coverage_multiplier)[2]
+        for row1, row2 in zip(isoform1, isoform2)]
+    assert test.tolist() == true
+
+
+def test__classify_rows_matches_numpy(random_junction_reads,
+                                      psi_parameters):
+    from outrigger.psi.vectorized import _classify_rows, classify
+
+    isoform1, isoform2, incompatible = random_junction_reads
+    min_reads = psi_parameters['min_reads']
+    uneven_coverage_multiplier = psi_parameters['uneven_coverage_multiplier']
+
+    test = np.empty(len(isoform1), dtype=np.int8)
+    _classify_rows(isoform1, isoform2, incompatible, min_reads,
+                   uneven_coverage_multiplier, test)
+    true = classify(isoform1, isoform2, incompatible, min_reads=min_reads,
+                    uneven_coverage_multiplier=uneven_coverage_multiplier,
+                    engine='numpy')
+    np.testing.assert_array_equal(test, true)
+
+
+def test_classify_numba(random_junction_reads, psi_parameters):
+    pytest.importorskip('numba')
+    from outrigger.psi.vectorized import classify
+
+    # (events, samples, junctions) like a block of events
+    isoform1, isoform2, incompatible = [
+        reads.reshape(50, 10, reads.shape[-1])
+        for reads in random_junction_reads]
+    kwargs = dict(min_reads=psi_parameters['min_reads'],
+                  uneven_coverage_multiplier=psi_parameters[
+                      'uneven_coverage_multiplier'])
+
+    test = classify(isoform1, isoform2, incompatible, engine='numba',
+                    **kwargs)
+    true = classify(isoform1, isoform2, incompatible, engine='numpy',
+                    **kwargs)
+    assert test.shape == (50, 10)
+    np.testing.assert_array_equal(test, true)
+
+
+def test_classify_invalid_engine():
+    from outrigger.psi.vectorized import classify
+
+    with pytest.raises(ValueError):
+        classify(np.array([[10]]), np.array([[10, 10]]), np.empty((1, 0)),
+                 engine='cuda')
+
+
+@pytest.mark.parametrize('notes', ['categorical', 'code'])
+def test_calculate_psi_notes(random_event_annotation, random_reads2d,
+                             splice_type, notes):
+    from outrigger.common import ISOFORM_JUNCTIONS, NOTES, CASE
+    from outrigger.psi.vectorized import calculate_psi, case_table
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    true_psi, true_summary = calculate_psi(
+        random_event_annotation, random_reads2d, min_reads=5, n_jobs=1,
+        **isoform_junctions)
+
+    test_psi, test_summary = calculate_psi(
+        random_event_annotation, random_reads2d, min_reads=5, n_jobs=1,
+        notes=notes, **isoform_junctions)
+
+    pdt.assert_frame_equal(test_psi, true_psi)
+    if notes == 'categorical':
+        assert test_summary[NOTES].dtype.name == 'category'
+        test_summary[NOTES] = test_summary[NOTES].astype(object)
+    else:
+        assert NOTES not in test_summary
+        cases = case_table(min_reads=5)
+        test_summary[CASE] = cases.loc[test_summary[CASE], NOTES].values
+        test_summary = test_summary.rename(columns={CASE: NOTES})
+    pdt.assert_frame_equal(test_summary, true_summary)
+
+
+def test_sweep_settings():
+    from outrigger.psi.vectorized import sweep_settings
+
+    test = sweep_settings([5, 10], [2, 10, 20])
+    true = [(5, 2), (5, 10), (5, 20), (10, 2), (10, 10), (10, 20)]
+    assert test == true
+
+
+@pytest.mark.parametrize('chunk_size', [7, 1000])
+def test_iter_sweep(random_event_annotation, random_reads2d, splice_type,
+                    n_jobs, chunk_size):
+    from outrigger.common import ISOFORM_JUNCTIONS, CASE
+    from outrigger.psi import vectorized
+
+    isoform_junctions = ISOFORM_JUNCTIONS[splice_type]
+    settings = vectorized.sweep_settings([0, 10, 30], [3, 10])
+
+    blocks = list(vectorized.iter_sweep(
+        random_event_annotation, random_reads2d, settings=settings,
+        n_jobs=n_jobs, chunk_size=chunk_size, **isoform_junctions))
+    counts = sum(vectorized.iter_sweep(
+        random_event_annotation, random_reads2d, settings=settings,
+        n_jobs=n_jobs, chunk_size=chunk_size, output='counts',
+        **isoform_junctions))
+
+    for i, (min_reads, uneven_coverage_multiplier) in enumerate(settings):
+        true_psi, true_summary = vectorized.calculate_psi(
+            random_event_annotation, random_reads2d, n_jobs=1,
+            min_reads=min_reads, notes='code',
+            uneven_coverage_multiplier=uneven_coverage_multiplier,
+            **isoform_junctions)
+        test = pd.concat([block[i] for block in blocks], ignore_index=True)
+        true = pd.concat(
+            [psi for psi, summary in vectorized.iter_psi(
+                random_event_annotation, random_reads2d, n_jobs=1,
+                min_reads=min_reads, psi_format='long',
+                uneven_coverage_multiplier=uneven_coverage_multiplier,
+                **isoform_junctions)], ignore_index=True)
+        pdt.assert_frame_equal(test, true)
+
+        true_counts = true_summary[CASE].value_counts().reindex(
+            counts.columns, fill_value=0)
+        test_counts = counts.loc[(min_reads, uneven_coverage_multiplier)]
+        np.testing.assert_array_equal(test_counts.values, true_counts.values)
+
+
+def test_iter_sweep_invalid_output(random_event_annotation, random_reads2d,
+                                   splice_type):
+    from outrigger.common import ISOFORM_JUNCTIONS
+    from outrigger.psi import vectorized
+
+    with pytest.raises(ValueError):
+        next(vectorized.iter_sweep(
+            random_event_annotation, random_reads2d, settings=[(10, 10)],
+            n_jobs=1, output='table', **ISOFORM_JUNCTIONS[splice_type]))
@@ -1,6 +1,7 @@
 
 import filecmp
 import os
+import shutil
 
 import pandas as pd
 import pandas.util.testing as pdt
@@ -82,6 +83,39 @@ def assert_directories_equal(dir1, dir2, ignore=None,
                                                               size2=size2))
 
 
+def assert_psi_outputs_equal(dir1, dir2, psi_format='wide'):
+    """Check the junctions and Psi outputs have the same rows"""
+    from outrigger.io.tables import read_npz
+
+    def read_sorted(folder, *path):
+        filename = os.path.join(folder, *path)
+        if filename.endswith('.npz'):
+            df = read_npz(filename).astype(object)
+        else:
+            df = pd.read_csv(filename)
+            if path[-1] == 'outrigger_summary.csv':
+                # Rows are numbered in a different order
+                df = df.iloc[:, 1:]
+        df = df.sort_values(df.columns.tolist())
+        df.index = range(len(df.index))
+        return df.sort_index(axis=1)
+
+    filenames = [('junctions', 'reads.csv'),
+                 ('junctions', 'metadata.csv'),
+                 ('psi', 'outrigger_summary.csv')]
+    for splice_abbrev in ('se', 'mxe'):
+        filenames.append(('psi', splice_abbrev, 'samples.csv'))
+        filenames.append(('psi', splice_abbrev, 'summary.csv'))
+        filenames.append(('psi', splice_abbrev, 'psi.npz'
+                          if psi_format == 'long' else 'psi.csv'))
+    if psi_format == 'wide':
+        filenames.append(('psi', 'outrigger_psi.csv'))
+
+    for path in filenames:
+        pdt.assert_frame_equal(read_sorted(dir1, *path),
+                               read_sorted(dir2, *path))
+
+
 class TestCommandLine(object):
 
     def test_no_arguments(self, capsys):
@@ -93,7 +127,7 @@ class TestCommandLine(object):
 
         CommandLine()
 
-        text = '[-h] [--version] {index,validate,psi} ...'
+        text = '[-h] [--version] {index,validate,psi,merge-psi,serve} ...'
         out, err = capsys.readouterr()
 
         # Argparse for Python2 sends the version info to stderr, but Python3
@@ -289,6 +323,48 @@ class TestCommandLine(object):
         dir2 = tasic2016_outrigger_output
         assert_directories_equal(dir1, dir2, ignore=['.DS_Store'])
 
+    def test_main_psi_sparse(self, tmpdir, tasic2016_unprocessed,
+                             tasic2016_outrigger_output, sj_filenames):
+        from outrigger.commandline import CommandLine
+
+        output_folder = tmpdir.strpath
+
+        gtf = os.path.join(tasic2016_unprocessed, 'gtf',
+                           'gencode.vM10.annotation.subset.gtf')
+        arguments = ['index', '--sj-out-tab']
+        arguments.extend(sj_filenames)
+        arguments.extend(['--gtf', gtf, '--output', output_folder])
+        CommandLine(arguments)
+
+        args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                '--sparse']
+        CommandLine(args)
+
+        dir1 = output_folder
+        dir2 = tasic2016_outrigger_output
+        assert_directories_equal(dir1, dir2, ignore=['.DS_Store'])
+
+    def test_main_psi_chunk_size(self, tmpdir, tasic2016_unprocessed,
+                                 tasic2016_outrigger_output, sj_filenames):
+        from outrigger.commandline import CommandLine
+
+        output_folder = tmpdir.strpath
+
+        gtf = os.path.join(tasic2016_unprocessed, 'gtf',
+                           'gencode.vM10.annotation.subset.gtf')
+        arguments = ['index', '--sj-out-tab']
+        arguments.extend(sj_filenames)
+        arguments.extend(['--gtf', gtf, '--output', output_folder])
+        CommandLine(arguments)
+
+        args = ['psi', '--output', output_folder, '--n-jobs', '2',
+                '--chunk-size', '2']
+        CommandLine(args)
+
+        dir1 = output_folder
+        dir2 = tasic2016_outrigger_output
+        assert_directories_equal(dir1, dir2, ignore=['.DS_Store'])
+
     def test_main_psi_bam(self, tmpdir, tasic2016_outrigger_output_index,
                           tasic2016_outrigger_output_bam, bam_filenames):
         from outrigger.commandline import CommandLine
@@ -304,3 +380,568 @@ class TestCommandLine(object):
         dir1 = output_folder
         dir2 = tasic2016_outrigger_output_bam
         assert_directories_equal(dir1, dir2, ignore=['.DS_Store', 'index'])
+
+    def test_main_psi_bam_stream(self, tmpdir,
+                                 tasic2016_outrigger_output_index,
+                                 tasic2016_outrigger_output_bam,
+                                 bam_filenames):
+        from outrigger.commandline import CommandLine
+
+        output_folder = tmpdir.strpath
+
+        args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                '--index', tasic2016_outrigger_output_index, '--stream',
+                '--bam']
+        args.extend(bam_filenames)
+        CommandLine(args)
+
+        assert not os.path.exists(os.path.join(output_folder, 'junctions',
+                                               'reads.csv'))
+        test = pd.read_csv(os.path.join(output_folder, 'psi',
+                                        'outrigger_psi.csv'), index_col=0)
+        true = pd.read_csv(os.path.join(tasic2016_outrigger_output_bam, 'psi',
+                                        'outrigger_psi.csv'), index_col=0)
+        # All events of the index are calculated, including ones without
+        # reads in any sample
+        assert true.index.isin(test.index).all()
+        pdt.assert_frame_equal(test.loc[true.index, true.columns], true)
+
+        for splice_abbrev in ('se', 'mxe'):
+            test = pd.read_csv(os.path.join(output_folder, 'psi',
+                                            splice_abbrev, 'psi.csv'),
+                               index_col=0)
+            true = pd.read_csv(os.path.join(tasic2016_outrigger_output_bam,
+                                            'psi', splice_abbrev, 'psi.csv'),
+                               index_col=0)
+            pdt.assert_frame_equal(test.loc[true.index, true.columns], true)
+
+    @pytest.mark.parametrize('psi_format', ['wide', 'long'])
+    def test_main_psi_bam_stream_chunks(self, tmpdir, monkeypatch,
+                                        tasic2016_outrigger_output_index,
+                                        tasic2016_outrigger_output_bam,
+                                        bam_filenames, psi_format):
+        from outrigger import commandline
+        from outrigger.io.tables import read_npz
+
+        output_folders = []
+        for chunk_size in (len(bam_filenames), 1):
+            monkeypatch.setattr(commandline, 'STREAM_CHUNK_SIZE', chunk_size)
+            output_folder = tmpdir.mkdir(str(chunk_size)).strpath
+            args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                    '--index', tasic2016_outrigger_output_index, '--stream',
+                    '--psi-format', psi_format, '--bam']
+            args.extend(bam_filenames)
+            commandline.CommandLine(args)
+            output_folders.append(output_folder)
+
+        # One row per junction of all the samples
+        metadata = pd.read_csv(os.path.join(output_folders[1], 'junctions',
+                                            'metadata.csv'))
+        true = pd.read_csv(os.path.join(tasic2016_outrigger_output_bam,
+                                        'junctions', 'metadata.csv'))
+        assert not metadata.junction_id.duplicated().any()
+        assert set(metadata.junction_id) == set(true.junction_id)
+
+        # No leftover temporary files
+        assert sorted(os.listdir(os.path.join(output_folders[1], 'psi'))) \
+            == sorted(os.listdir(os.path.join(output_folders[0], 'psi')))
+        for splice_abbrev in ('se', 'mxe'):
+            if psi_format == 'long':
+                test, true = (read_npz(os.path.join(x, 'psi', splice_abbrev,
+                                                    'psi.npz'))
+                              for x in output_folders[::-1])
+            else:
+                test, true = (pd.read_csv(os.path.join(x, 'psi',
+                                                       splice_abbrev,
+                                                       'psi.csv'))
+                              for x in output_folders[::-1])
+            pdt.assert_frame_equal(test, true)
+
+    def test_main_psi_notes_code(self, tmpdir,
+                                 tasic2016_outrigger_output_index,
+                                 tasic2016_outrigger_output):
+        from outrigger.commandline import CommandLine
+        from outrigger.common import NOTES, CASE
+
+        output_folders = {}
+        for notes in ('text', 'code'):
+            output_folder = tmpdir.mkdir(notes).strpath
+            junctions_folder = os.path.join(output_folder, 'junctions')
+            os.mkdir(junctions_folder)
+            shutil.copy(os.path.join(tasic2016_outrigger_output, 'junctions',
+                                     'reads.csv'), junctions_folder)
+
+            args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                    '--index', tasic2016_outrigger_output_index,
+                    '--notes', notes]
+            CommandLine(args)
+            output_folders[notes] = output_folder
+
+        cases = pd.read_csv(os.path.join(output_folders['code'], 'psi',
+                                         'cases.csv'), index_col=0)
+        assert not os.path.exists(
+            os.path.join(output_folders['text'], 'psi', 'cases.csv'))
+
+        for splice_abbrev in ('se', 'mxe'):
+            test = pd.read_csv(os.path.join(output_folders['code'], 'psi',
+                                            splice_abbrev, 'summary.csv'))
+            true = pd.read_csv(os.path.join(output_folders['text'], 'psi',
+                                            splice_abbrev, 'summary.csv'))
+            assert NOTES not in test
+            test[NOTES] = cases.loc[test[CASE], NOTES].values
+            del test[CASE]
+
+            pdt.assert_frame_equal(test.sort_index(axis=1),
+                                   true.sort_index(axis=1))
+
+    def test_main_psi_long(self, tmpdir, tasic2016_outrigger_output_index,
+                           tasic2016_outrigger_output):
+        from outrigger.commandline import CommandLine
+        from outrigger.common import SAMPLE_ID, EVENT_ID, PSI, CASE
+        from outrigger.io.tables import read_npz
+
+        output_folders = {}
+        for psi_format in ('wide', 'long'):
+            output_folder = tmpdir.mkdir(psi_format).strpath
+            junctions_folder = os.path.join(output_folder, 'junctions')
+            os.mkdir(junctions_folder)
+            shutil.copy(os.path.join(tasic2016_outrigger_output, 'junctions',
+                                     'reads.csv'), junctions_folder)
+
+            args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                    '--index', tasic2016_outrigger_output_index,
+                    '--psi-format', psi_format, '--notes', 'code']
+            CommandLine(args)
+            output_folders[psi_format] = output_folder
+
+        long_psi = os.path.join(output_folders['long'], 'psi')
+        assert not os.path.exists(os.path.join(long_psi, 'outrigger_psi.csv'))
+
+        for splice_abbrev in ('se', 'mxe'):
+            assert not os.path.exists(
+                os.path.join(long_psi, splice_abbrev, 'psi.csv'))
+            test = read_npz(os.path.join(long_psi, splice_abbrev, 'psi.npz'))
+
+            summary = pd.read_csv(os.path.join(
+                output_folders['wide'], 'psi', splice_abbrev, 'summary.csv'))
+            true = summary.dropna(subset=[PSI])[[SAMPLE_ID, EVENT_ID, PSI,
+                                                 CASE]]
+            true.index = range(len(true))
+            test[SAMPLE_ID] = test[SAMPLE_ID].astype(object)
+            test[EVENT_ID] = test[EVENT_ID].astype(object)
+            pdt.assert_frame_equal(test, true, check_dtype=False)
+
+    def test_main_psi_junction_slots(self, tmpdir,
+                                     tasic2016_outrigger_output_index,
+                                     tasic2016_outrigger_output):
+        from outrigger.commandline import CommandLine
+        from outrigger.common import ISOFORM_JUNCTIONS
+        from outrigger.psi.slots import EventJunctions, JUNCTION_SLOTS_NPZ
+
+        # Index with the junctions of each event saved as integers, like the
+        # ones made by "outrigger index"
+        index = tmpdir.join('index').strpath
+        shutil.copytree(tasic2016_outrigger_output_index, index)
+        for splice_abbrev in ('se', 'mxe'):
+            events = pd.read_csv(os.path.join(index, splice_abbrev,
+                                              'events.csv'), index_col=0)
+            event_junctions = EventJunctions.from_annotation(
+                events, **ISOFORM_JUNCTIONS[splice_abbrev])
+            event_junctions.save(os.path.join(index, splice_abbrev,
+                                              JUNCTION_SLOTS_NPZ))
+
+        output_folders = []
+        for input_index in (index, tasic2016_outrigger_output_index):
+            output_folder = tmpdir.mkdir(
+                'output{}'.format(len(output_folders))).strpath
+            junctions_folder = os.path.join(output_folder, 'junctions')
+            os.mkdir(junctions_folder)
+            shutil.copy(os.path.join(tasic2016_outrigger_output, 'junctions',
+                                     'reads.csv'), junctions_folder)
+
+            args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                    '--index', input_index]
+            CommandLine(args)
+            output_folders.append(output_folder)
+
+        assert_directories_equal(*output_folders, ignore=['.DS_Store'])
+
+    @pytest.mark.parametrize('psi_format', ['wide', 'long'])
+    def test_main_psi_append(self, tmpdir, tasic2016_outrigger_output_index,
+                             tasic2016_outrigger_output, psi_format):
+        from outrigger.commandline import CommandLine
+        reads = pd.read_csv(os.path.join(tasic2016_outrigger_output,
+                                         'junctions', 'reads.csv'))
+        samples = sorted(reads.sample_id.unique())
+        new = reads.sample_id.isin(samples[-3:])
+        new_reads_csv = tmpdir.join('new_reads.csv').strpath
+        reads.loc[new].to_csv(new_reads_csv, index=False)
+
+        output_folders = {}
+        for name, junction_reads in (('all', reads),
+                                     ('append', reads.loc[~new])):
+            output_folder = tmpdir.mkdir(name).strpath
+            junctions_folder = os.path.join(output_folder, 'junctions')
+            os.mkdir(junctions_folder)
+            junction_reads.to_csv(os.path.join(junctions_folder, 'reads.csv'),
+                                  index=False)
+
+            args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                    '--index', tasic2016_outrigger_output_index,
+                    '--psi-format', psi_format]
+            CommandLine(args)
+            output_folders[name] = output_folder
+
+        args = ['psi', '--output', output_folders['append'], '--n-jobs', '1',
+                '--index', tasic2016_outrigger_output_index,
+                '--psi-format', psi_format, '--append',
+                '--junction-reads-csv', new_reads_csv]
+        CommandLine(args)
+
+        assert_psi_outputs_equal(output_folders['append'],
+                                 output_folders['all'], psi_format)
+
+    @pytest.mark.parametrize('psi_format', ['wide', 'long'])
+    def test_main_psi_sample_partition_size(
+            self, tmpdir, tasic2016_outrigger_output_index,
+            tasic2016_outrigger_output, psi_format):
+        from outrigger.commandline import CommandLine
+
+        output_folders = []
+        for partition_size in (None, 10):
+            output_folder = tmpdir.mkdir(str(partition_size)).strpath
+            junctions_folder = os.path.join(output_folder, 'junctions')
+            os.mkdir(junctions_folder)
+            shutil.copy(os.path.join(tasic2016_outrigger_output, 'junctions',
+                                     'reads.csv'), junctions_folder)
+
+            args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                    '--index', tasic2016_outrigger_output_index,
+                    '--psi-format', psi_format]
+            if partition_size is not None:
+                args.extend(['--sample-partition-size', str(partition_size)])
+            CommandLine(args)
+            output_folders.append(output_folder)
+
+        # No leftover partitions
+        assert sorted(os.listdir(os.path.join(output_folders[1], 'psi'))) \
+            == sorted(os.listdir(os.path.join(output_folders[0], 'psi')))
+        # Junctions of several partitions are written once
+        metadata = pd.read_csv(os.path.join(output_folders[1], 'junctions',
+                                            'metadata.csv'))
+        assert not metadata.junction_id.duplicated().any()
+        assert_psi_outputs_equal(output_folders[1], output_folders[0],
+                                 psi_format)
+
+    def test_main_psi_unused_junctions(
+            self, tmpdir, tasic2016_outrigger_output_index,
+            tasic2016_outrigger_output):
+        from outrigger.commandline import CommandLine
+
+        reads = pd.read_csv(os.path.join(tasic2016_outrigger_output,
+                                         'junctions', 'reads.csv'))
+        # Junctions which aren't in any event don't change Psi
+        unused = reads.copy()
+        unused['junction_id'] = 'junction:chr1:1-2:+'
+        unused = unused.drop_duplicates('sample_id')
+        # Samples without any reads of the index's junctions are still kept
+        no_reads = unused.iloc[:1].copy()
+        no_reads['sample_id'] = 'no_reads'
+
+        output_folders = []
+        for name, junction_reads in (
+                ('true', reads),
+                ('test', pd.concat([reads, unused, no_reads],
+                                   ignore_index=True))):
+            output_folder = tmpdir.mkdir(name).strpath
+            junctions_folder = os.path.join(output_folder, 'junctions')
+            os.mkdir(junctions_folder)
+            junction_reads.to_csv(os.path.join(junctions_folder, 'reads.csv'),
+                                  index=False)
+
+            args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                    '--index', tasic2016_outrigger_output_index]
+            CommandLine(args)
+            output_folders.append(output_folder)
+
+        true, test = (pd.read_csv(os.path.join(x, 'psi', 'outrigger_psi.csv'),
+                                  index_col=0) for x in output_folders)
+        assert test['no_reads'].isnull().all()
+        pdt.assert_frame_equal(test[true.columns], true)
+
+    def test_main_serve(self, tasic2016_outrigger_output_index,
+                        tasic2016_outrigger_output, monkeypatch):
+        from outrigger.commandline import CommandLine
+        from outrigger.psi import server
+
+        served = []
+        monkeypatch.setattr(server, 'serve', lambda *args: served.append(args))
+
+        reads_csv = os.path.join(tasic2016_outrigger_output, 'junctions',
+                                 'reads.csv')
+        args = ['serve', '--index', tasic2016_outrigger_output_index,
+                '--junction-reads-csv', reads_csv, '--port', '9999']
+        CommandLine(args)
+
+        store, host, port = served[0]
+        assert (host, port) == (server.HOST, 9999)
+        true = pd.read_csv(os.path.join(tasic2016_outrigger_output, 'psi',
+                                        'outrigger_psi.csv'), index_col=0).T
+        psi, cases = store.psi()
+        pdt.assert_frame_equal(psi.loc[true.index, true.columns], true,
+                               check_names=False)
+
+    @pytest.mark.parametrize('summary', ['cases', 'counts', 'none'])
+    def test_main_psi_summary(self, tmpdir, tasic2016_outrigger_output_index,
+                              tasic2016_outrigger_output, summary):
+        from outrigger.commandline import CommandLine
+
+        psi_folders = {}
+        for name in ('full', summary):
+            output_folder = tmpdir.mkdir(name).strpath
+            junctions_folder = os.path.join(output_folder, 'junctions')
+            os.mkdir(junctions_folder)
+            shutil.copy(os.path.join(tasic2016_outrigger_output, 'junctions',
+                                     'reads.csv'), junctions_folder)
+
+            args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                    '--index', tasic2016_outrigger_output_index,
+                    '--summary', name]
+            CommandLine(args)
+            psi_folders[name] = os.path.join(output_folder, 'psi')
+
+        psi_folder = psi_folders[summary]
+        true_folder = psi_folders['full']
+        pdt.assert_frame_equal(
+            pd.read_csv(os.path.join(psi_folder, 'outrigger_psi.csv')),
+            pd.read_csv(os.path.join(true_folder, 'outrigger_psi.csv')))
+
+        summary_csv = os.path.join(psi_folder, 'outrigger_summary.csv')
+        if summary == 'none':
+            assert not os.path.exists(summary_csv)
+            return
+        test = pd.read_csv(summary_csv, index_col=0)
+        true = pd.read_csv(os.path.join(true_folder,
+                                        'outrigger_summary.csv'),
+                           index_col=0)
+        # Same cases as the notes of the full summary
+        cases = pd.read_csv(os.path.join(psi_folder, 'cases.csv'))
+        true['case'] = true['notes'].map(
+            cases.set_index('notes')['case']).astype(int)
+        if summary == 'cases':
+            assert test.columns.tolist() == ['sample_id', 'event_id', 'case',
+                                             'splice_type']
+            pdt.assert_frame_equal(test, true[test.columns])
+        else:
+            assert test.columns.tolist() == ['event_id', 'case', 'count',
+                                             'splice_type']
+            counts = true.groupby(['event_id', 'case', 'splice_type'])
+            counts = counts.size().rename('count').reset_index()
+            test = test.sort_values(['event_id', 'case'])[counts.columns]
+            counts = counts.sort_values(['event_id', 'case'])
+            pdt.assert_frame_equal(test.reset_index(drop=True),
+                                   counts.reset_index(drop=True),
+                                   check_dtype=False)
+
+    def test_main_psi_dtypes_compact(
+            self, tmpdir, tasic2016_outrigger_output_index,
+            tasic2016_outrigger_output):
+        from outrigger.commandline import CommandLine
+
+        output_folders = {}
+        for dtypes in ('default', 'compact'):
+            output_folder = tmpdir.mkdir(dtypes).strpath
+            junctions_folder = os.path.join(output_folder, 'junctions')
+            os.mkdir(junctions_folder)
+            shutil.copy(os.path.join(tasic2016_outrigger_output, 'junctions',
+                                     'reads.csv'), junctions_folder)
+
+            args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                    '--index', tasic2016_outrigger_output_index,
+                    '--dtypes', dtypes]
+            CommandLine(args)
+            output_folders[dtypes] = output_folder
+
+        for path in (('outrigger_psi.csv',), ('se', 'summary.csv'),
+                     ('mxe', 'summary.csv')):
+            test, true = (pd.read_csv(os.path.join(output_folders[x], 'psi',
+                                                   *path))
+                          for x in ('compact', 'default'))
+            pdt.assert_frame_equal(test, true, check_less_precise=True)
+
+    def test_main_psi_sample_partition_size_sj_out_tab(
+            self, tmpdir, tasic2016_outrigger_output_index, sj_filenames):
+        from outrigger.commandline import CommandLine
+
+        output_folders = []
+        for partition_size in (None, 2):
+            output_folder = tmpdir.mkdir(str(partition_size)).strpath
+            args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                    '--index', tasic2016_outrigger_output_index,
+                    '--sj-out-tab'] + sj_filenames
+            if partition_size is not None:
+                args.extend(['--sample-partition-size', str(partition_size)])
+            CommandLine(args)
+            output_folders.append(output_folder)
+
+        assert_psi_outputs_equal(output_folders[1], output_folders[0])
+
+    def test_main_psi_append_existing_samples(
+            self, tmpdir, tasic2016_outrigger_output_index,
+            tasic2016_outrigger_output):
+        from outrigger.commandline import CommandLine
+
+        output_folder = tmpdir.strpath
+        junctions_folder = os.path.join(output_folder, 'junctions')
+        os.mkdir(junctions_folder)
+        reads_csv = os.path.join(tasic2016_outrigger_output, 'junctions',
+                                 'reads.csv')
+        shutil.copy(reads_csv, junctions_folder)
+
+        args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                '--index', tasic2016_outrigger_output_index]
+        CommandLine(args)
+
+        with pytest.raises(ValueError):
+            CommandLine(args + ['--append', '--junction-reads-csv',
+                                reads_csv])
+
+    def test_main_psi_sweep(self, tmpdir, tasic2016_outrigger_output_index,
+                            tasic2016_outrigger_output):
+        from outrigger.commandline import CommandLine
+        from outrigger.common import SAMPLE_ID, EVENT_ID, PSI, CASE
+        from outrigger.io.tables import read_npz
+
+        def run(name, *options):
+            output_folder = tmpdir.mkdir(name).strpath
+            junctions_folder = os.path.join(output_folder, 'junctions')
+            os.mkdir(junctions_folder)
+            shutil.copy(os.path.join(tasic2016_outrigger_output, 'junctions',
+                                     'reads.csv'), junctions_folder)
+            args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                    '--index', tasic2016_outrigger_output_index]
+            CommandLine(args + list(options))
+            return os.path.join(output_folder, 'psi')
+
+        sweep = run('sweep', '--sweep-min-reads', '5', '10',
+                    '--sweep-uneven-coverage-multiplier', '10')
+        counts = run('counts', '--sweep-min-reads', '5', '10',
+                     '--sweep-output', 'counts')
+        assert not os.path.exists(os.path.join(sweep, 'outrigger_psi.csv'))
+        counts = pd.read_csv(os.path.join(counts, 'sweep', 'counts.csv'))
+
+        for min_reads in (5, 10):
+            single = run(str(min_reads), '--min-reads', str(min_reads),
+                         '--psi-format', 'long', '--notes', 'code')
+            test = read_npz(os.path.join(
+                sweep, 'sweep',
+                'min_reads{}_uneven_coverage_multiplier10.npz'.format(
+                    min_reads)))
+            for column in (SAMPLE_ID, EVENT_ID, 'splice_type'):
+                test[column] = test[column].astype(object)
+            setting_counts = counts.loc[counts['min_reads'] == min_reads]
+
+            for splice_abbrev in ('se', 'mxe'):
+                true = read_npz(os.path.join(single, splice_abbrev,
+                                             'psi.npz'))
+                true[SAMPLE_ID] = true[SAMPLE_ID].astype(object)
+                true[EVENT_ID] = true[EVENT_ID].astype(object)
+                type_test = test.loc[test['splice_type'] == splice_abbrev,
+                                     [SAMPLE_ID, EVENT_ID, PSI, CASE]]
+                type_test.index = range(len(type_test))
+                pdt.assert_frame_equal(type_test, true, check_dtype=False)
+
+                summary = pd.read_csv(os.path.join(single, splice_abbrev,
+                                                   'summary.csv'))
+                type_counts = setting_counts.loc[
+                    setting_counts['splice_type'] == splice_abbrev]
+                type_counts = type_counts.set_index(CASE)['count']
+                true_counts = summary[CASE].value_counts().reindex(
+                    type_counts.index, fill_value=0)
+                assert (type_counts == true_counts).all()
+
+    @pytest.mark.parametrize('summary', ['full', 'counts'])
+    def test_main_psi_shard(self, tmpdir, tasic2016_outrigger_output_index,
+                            tasic2016_outrigger_output, summary):
+        from outrigger.commandline import CommandLine
+
+        reads_csv = os.path.join(tasic2016_outrigger_output, 'junctions',
+                                 'reads.csv')
+        shard_folders = []
+        for i in range(1, 4):
+            output_folder = tmpdir.mkdir('shard{}'.format(i)).strpath
+            args = ['psi', '--output', output_folder, '--n-jobs', '1',
+                    '--index', tasic2016_outrigger_output_index,
+                    '--junction-reads-csv', reads_csv, '--summary', summary,
+                    '--shard', '{}/3'.format(i)]
+            CommandLine(args)
+            shard_folders.append(output_folder)
+
+        merged_folder = tmpdir.join('merged').strpath
+        CommandLine(['merge-psi', '--output', merged_folder,
+                     '--shards'] + shard_folders)
+
+        psi_folder = os.path.join(merged_folder, 'psi')
+        true_folder = os.path.join(tasic2016_outrigger_output, 'psi')
+        test = pd.read_csv(os.path.join(psi_folder, 'outrigger_psi.csv'),
+                           index_col=0)
+        true = pd.read_csv(os.path.join(true_folder, 'outrigger_psi.csv'),
+                           index_col=0)
+        # Samples of the shards are in order, and all events of the index
+        # are calculated, including ones without reads in any sample
+        assert test.columns.tolist() == true.columns.tolist()
+        assert true.index.isin(test.index).all()
+        pdt.assert_frame_equal(test.loc[true.index], true)
+
+        for splice_abbrev in ('se', 'mxe'):
+            test = pd.read_csv(os.path.join(psi_folder, splice_abbrev,
+                                            'psi.csv'), index_col=0)
+            true = pd.read_csv(os.path.join(true_folder, splice_abbrev,
+                                            'psi.csv'), index_col=0)
+            pdt.assert_frame_equal(test[true.columns], true)
+
+        samples = true.index
+        test_summary = pd.read_csv(os.path.join(psi_folder,
+                                                'outrigger_summary.csv'))
+        if summary == 'counts':
+            assert (test_summary.groupby('event_id')['count'].sum()
+                    == len(samples)).all()
+        else:
+            assert set(test_summary['sample_id']) == set(samples)
+
+    def test_main_psi_shard_invalid(self, tmpdir,
+                                    tasic2016_outrigger_output_index,
+                                    tasic2016_outrigger_output):
+        from outrigger.commandline import CommandLine
+
+        reads_csv = os.path.join(tasic2016_outrigger_output, 'junctions',
+                                 'reads.csv')
+        args = ['psi', '--output', tmpdir.strpath, '--n-jobs', '1',
+                '--index', tasic2016_outrigger_output_index,
+                '--junction-reads-csv', reads_csv]
+        for options in (['--shard', '4/3'], ['--shard', 'first'],
+                        ['--shard', '1/3', '--psi-format', 'long'],
+                        ['--shard', '1/3', '--sample-partition-size', '2']):
+            with pytest.raises(ValueError):
+                CommandLine(args + options)
+
+    @pytest.mark.parametrize('backend', ['threads', 'serial'])
+    def test_main_psi_backend(self, tmpdir, tasic2016_outrigger_output_index,
+                              tasic2016_outrigger_output, backend):
+        from outrigger.commandline import CommandLine
+
+        output_folders = []
+        for name in ('processes', backend):
+            output_folder = tmpdir.mkdir(name).strpath
+            junctions_folder = os.path.join(output_folder, 'junctions')
+            os.mkdir(junctions_folder)
+            shutil.copy(os.path.join(tasic2016_outrigger_output, 'junctions',
+                                     'reads.csv'), junctions_folder)
+
+            args = ['psi', '--output', output_folder, '--n-jobs', '2',
+                    '--chunk-size', '2', '--backend', name,
+                    '--index', tasic2016_outrigger_output_index]
+            CommandLine(args)
+            output_folders.append(output_folder)
+
+        assert_psi_outputs_equal(output_folders[1], output_folders[0])